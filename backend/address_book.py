@@ -18,13 +18,10 @@ def create_contact(contact_data):
     Returns:
         dict: The created contact data, including its new unique ID.
     """
-    contacts = db.load_data(db.RUBRICA_DB)
-    
     # Assign a unique ID
     contact_data['id'] = str(uuid.uuid4())
     
-    contacts.append(contact_data)
-    db.save_data(db.RUBRICA_DB, contacts)
+    db.insert_record(db.RUBRICA_DB, contact_data)
     return contact_data
 
 def get_all_contacts():
@@ -46,11 +43,7 @@ def find_contact_by_id(contact_id):
     Returns:
         dict: The contact dictionary if found, else None.
     """
-    contacts = db.load_data(db.RUBRICA_DB)
-    for contact in contacts:
-        if contact.get('id') == contact_id:
-            return contact
-    return None
+    return db.find_record(db.RUBRICA_DB, contact_id)
 
 def search_contacts(query):
     """
@@ -87,22 +80,8 @@ def update_contact(contact_id, updated_data):
     Returns:
         dict: The updated contact dictionary, or None if not found.
     """
-    contacts = db.load_data(db.RUBRICA_DB)
-    contact_found = False
-    
-    for i, contact in enumerate(contacts):
-        if contact.get('id') == contact_id:
-            # Update the existing dictionary with new values
-            contact.update(updated_data)
-            contacts[i] = contact
-            contact_found = True
-            break
-            
-    if contact_found:
-        db.save_data(db.RUBRICA_DB, contacts)
-        return contacts[i]
-    else:
-        return None
+    # Merges the new values into the stored contact (None if not found)
+    return db.update_record(db.RUBRICA_DB, contact_id, updated_data)
 
 def delete_contact(contact_id):
     """
@@ -114,17 +93,8 @@ def delete_contact(contact_id):
     Returns:
         bool: True if deletion was successful, False otherwise.
     """
-    contacts = db.load_data(db.RUBRICA_DB)
-    
-    # Create a new list excluding the contact to be deleted
-    new_contacts = [c for c in contacts if c.get('id') != contact_id]
-    
-    if len(new_contacts) < len(contacts):
-        # The list is shorter, meaning the contact was found and removed
-        db.save_data(db.RUBRICA_DB, new_contacts)
-        return True  # Success
-    else:
-        return False # Not found
+    # True if the contact was found and removed, False if not found
+    return db.delete_record(db.RUBRICA_DB, contact_id)
 
 # --- Import/Export Functions ---
 
@@ -1,8 +1,14 @@
+import bisect
+import copy
+import heapq
+import threading
 import uuid
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import date, datetime, timedelta
 
 # Import centralized modules using relative imports
 from . import persistence as db
+from . import events
 from . import email_utils
 from . import projects as db_progetti
 from . import documents as db_docs
@@ -24,9 +30,204 @@ def _parse_date(date_str):
     except ValueError:
         return None
 
+# --- Recurring Events ---
+# A recurring event (e.g., the monthly F24 payment, a weekly client call)
+# is stored once, as a 'ricorrente' event whose 'date' is the first
+# occurrence, with its rule:
+#   'recurrence': {'freq': 'monthly', 'interval': 1,
+#                  'until': '2026-12-31' or None, 'exceptions': ['2025-08-16']}
+# Its occurrences are never stored: they are generated on the fly, only
+# for the date range being asked for (see _occorrenze). Monthly and yearly
+# events falling on a day missing from a month (e.g., the 31st) occur on
+# the last day of that month.
+FREQUENZE_RICORRENZA = ["daily", "weekly", "monthly", "yearly"]
+TIPI_EVENTO_MANUALE = ("manuale", "ricorrente") # Events created (and deletable) by the user
+
+def _add_months(start, months):
+    """Returns the date some months after another, clamped to the end of shorter months."""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return date(year, month, min(start.day, (next_month - timedelta(days=1)).day))
+
+def _occorrenze(event, start_ord, end_ord):
+    """
+    Generates the occurrences of a recurring event within a date range,
+    in order. The first one is computed directly, without walking
+    through the occurrences before the range.
+
+    Args:
+        event (dict): A 'ricorrente' event.
+        start_ord (int): The ordinal of the start of the range (inclusive).
+        end_ord (int): The ordinal of the end of the range (inclusive).
+
+    Yields:
+        int: The date ordinal of each occurrence.
+    """
+    rule = event['recurrence']
+    first = date.fromordinal(event['date_ord'])
+    interval = max(int(rule.get('interval') or 1), 1)
+    until = _parse_date(rule.get('until'))
+    if until is not None:
+        end_ord = min(end_ord, until.toordinal())
+    exceptions = {d.toordinal() for d in map(_parse_date, rule.get('exceptions', ())) if d is not None}
+    start_ord = max(start_ord, first.toordinal())
+
+    if rule['freq'] in ('daily', 'weekly'):
+        step = interval * (7 if rule['freq'] == 'weekly' else 1)
+        # First occurrence on or after the start of the range
+        ordinal = first.toordinal() + -(-(start_ord - first.toordinal()) // step) * step
+        while ordinal <= end_ord:
+            if ordinal not in exceptions:
+                yield ordinal
+            ordinal += step
+    else:
+        months = interval * (12 if rule['freq'] == 'yearly' else 1)
+        start = date.fromordinal(start_ord)
+        # Last occurrence in a month before or equal to the start of the range
+        count = ((start.year - first.year) * 12 + start.month - first.month) // months
+        while True:
+            ordinal = _add_months(first, count * months).toordinal()
+            if ordinal > end_ord:
+                break
+            if ordinal >= start_ord and ordinal not in exceptions:
+                yield ordinal
+            count += 1
+
+def _occorrenza(event, ordinal):
+    """Returns a copy of a recurring event, dated on one of its occurrences."""
+    occurrence = copy.deepcopy(event)
+    occurrence['date'] = date.fromordinal(ordinal).isoformat()
+    occurrence['date_ord'] = ordinal
+    return occurrence
+
+# --- Date Index ---
+# The calendar page and the dashboard ask for the events of a date range
+# over and over. Instead of scanning (and copying) every event each time,
+# the events are kept in an index sorted by date: [(date ordinal, id)].
+# A range query bisects to the first entry of the range and slices up to
+# the last one, so it costs O(log n + k) and returns the events in order.
+# Recurring events are kept aside (they are few) and expanded within the
+# range. The index is built on first use, then updated from the change
+# feed (see events.py); a 'reload' (e.g., another process changed the
+# events) drops it, to be rebuilt by the next query.
+# With the SQLite backend, range queries are left to the database index.
+
+_date_index = None # Sorted [(date ordinal, event id)], or None if not built
+_recurring_events = None # {event id: recurring event}, built with the index
+_index_changes = 0 # Changes seen, to detect those made while (re)building
+_index_lock = threading.Lock() # Never held while calling the persistence layer
+
+def _is_recurring(event):
+    """Returns True for a recurring event with a valid first date."""
+    return event is not None and event.get('type') == 'ricorrente' and event.get('date_ord') is not None
+
+def _index_entry(event):
+    """Returns the index entry of a one-off event (or None if it has no valid date)."""
+    if event is None or _is_recurring(event):
+        return None
+    ordinal = event.get('date_ord')
+    return (ordinal, event['id']) if ordinal is not None else None
+
+def _on_calendar_change(change):
+    """Applies a change of the events to the date index (see events.py)."""
+    global _date_index, _recurring_events, _index_changes
+    with _index_lock:
+        _index_changes += 1
+        if _date_index is None:
+            return
+        if change.operation == 'reload':
+            _date_index = _recurring_events = None
+            return
+        _recurring_events.pop(change.id, None)
+        if _is_recurring(change.after):
+            _recurring_events[change.id] = change.after
+        old_entry = _index_entry(change.before)
+        new_entry = _index_entry(change.after)
+        if old_entry == new_entry:
+            return
+        if old_entry is not None:
+            position = bisect.bisect_left(_date_index, old_entry)
+            if position < len(_date_index) and _date_index[position] == old_entry:
+                del _date_index[position]
+        if new_entry is not None:
+            bisect.insort(_date_index, new_entry)
+
+events.subscribe(db.CALENDARIO_DB, _on_calendar_change)
+
+def _as_ordinal(value):
+    """Returns the ordinal of a date (or of an ISO date string)."""
+    if isinstance(value, str):
+        value = _parse_date(value)
+        if value is None:
+            raise ValueError("Invalid date. Use YYYY-MM-DD.")
+    return value.toordinal()
+
+def _index_lookup(start_ord, end_ord):
+    """
+    Returns the one-off events of a date range, from the date index, and
+    all the recurring events.
+
+    Args:
+        start_ord (int): The ordinal of the start of the range (inclusive).
+        end_ord (int): The ordinal of the end of the range (inclusive).
+
+    Returns:
+        tuple: (sorted (date ordinal, event id) entries, list of recurring events).
+    """
+    global _date_index, _recurring_events
+    # Changes made by other processes are published as a 'reload'
+    db.revalidate(db.CALENDARIO_DB)
+    with _index_lock:
+        index, recurring = _date_index, _recurring_events
+    while index is None:
+        with _index_lock:
+            changes = _index_changes
+        all_events = db.load_data(db.CALENDARIO_DB)
+        index = sorted(entry for entry in map(_index_entry, all_events) if entry is not None)
+        recurring = {e['id']: e for e in all_events if _is_recurring(e)}
+        with _index_lock:
+            if _index_changes != changes:
+                index = None # Changed while loading: load again
+            else:
+                _date_index, _recurring_events = index, recurring
+    with _index_lock:
+        low = bisect.bisect_left(index, (start_ord,))
+        high = bisect.bisect_left(index, (end_ord + 1,))
+        return index[low:high], list(recurring.values())
+
+def _use_date_index():
+    """Returns True if range queries go through the date index (pickle backend)."""
+    return db.get_storage_backend() != 'sqlite'
+
+def _eventi_range(start_date, end_date):
+    """
+    Merges the one-off events and the occurrences of the recurring events
+    of a date range, lazily, in date order.
+
+    Yields:
+        tuple: (date ordinal, event id, event), where the event is None
+               for a one-off event not loaded yet.
+    """
+    start_ord, end_ord = _as_ordinal(start_date), _as_ordinal(end_date)
+    if _use_date_index():
+        entries, recurring = _index_lookup(start_ord, end_ord)
+        single = ((ordinal, event_id, None) for ordinal, event_id in entries)
+    else:
+        # The date range and the sorting are handled by the database
+        found = db.query_data(db.CALENDARIO_DB, date_from=start_date, date_to=end_date, order_by='date')
+        single = ((e['date_ord'], e['id'], e) for e in found if e.get('type') != 'ricorrente')
+        recurring = [e for e in db.query_data(db.CALENDARIO_DB, type='ricorrente') if _is_recurring(e)]
+    expanded = (
+        ((ordinal, event['id'], event) for ordinal in _occorrenze(event, start_ord, end_ord))
+        for event in recurring
+    )
+    return heapq.merge(single, *expanded, key=lambda item: item[:2])
+
 def get_eventi(start_date, end_date):
     """
     Gets all calendar events (manual and automatic) within a date range.
+    Recurring events are returned once per occurrence in the range.
 
     Args:
         start_date (datetime.date): The start of the date range.
@@ -35,26 +236,45 @@ def get_eventi(start_date, end_date):
     Returns:
         list: A sorted list of event dictionaries.
     """
-    events = db.load_data(db.CALENDARIO_DB)
     results = []
-    
-    for event in events:
-        event_date = _parse_date(event.get('date'))
-        # Check if the event's date falls within the specified range
-        if event_date and start_date <= event_date <= end_date:
+    for ordinal, event_id, event in _eventi_range(start_date, end_date):
+        if event is None:
+            event = db.find_record(db.CALENDARIO_DB, event_id)
+            if event is not None:
+                results.append(event)
+        elif event.get('type') == 'ricorrente':
+            results.append(_occorrenza(event, ordinal))
+        else:
             results.append(event)
-            
-    # Sort results by date
-    return sorted(results, key=lambda x: x['date'])
+    return results
 
-def create_evento_manuale(event_date, title, description):
+def count_eventi_per_giorno(start_date, end_date):
+    """
+    Counts the calendar events of each day in a date range, without
+    loading the events (e.g., to draw a month grid).
+
+    Args:
+        start_date (datetime.date): The start of the date range.
+        end_date (datetime.date): The end of the date range.
+
+    Returns:
+        dict: {datetime.date: number of events}, only for days with events.
+    """
+    counts = Counter(ordinal for ordinal, _, _ in _eventi_range(start_date, end_date))
+    return {date.fromordinal(ordinal): count for ordinal, count in sorted(counts.items())}
+
+def create_evento_manuale(event_date, title, description, frequenza=None, intervallo=1, fino_al=None):
     """
     Adds a new user-created event to the calendar database.
+    With a frequency, the event repeats from its date on (see Recurring Events).
 
     Args:
-        event_date (str): The date in 'YYYY-MM-DD' format.
+        event_date (str): The date in 'YYYY-MM-DD' format (the first occurrence).
         title (str): The title of the event.
         description (str): A description for the event.
+        frequenza (str, optional): One of FREQUENZE_RICORRENZA, for a recurring event.
+        intervallo (int): Repeat every 'intervallo' days/weeks/months/years.
+        fino_al (str, optional): The last possible date ('YYYY-MM-DD'), or None.
 
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
@@ -70,72 +290,266 @@ def create_evento_manuale(event_date, title, description):
         'type': 'manuale', # Distinguish from automatic events
         'source_id': None
     }
+    if frequenza:
+        if frequenza not in FREQUENZE_RICORRENZA:
+            return False, f"Invalid frequency: '{frequenza}'."
+        try:
+            intervallo = int(intervallo)
+        except (TypeError, ValueError):
+            return False, "The interval must be a whole number."
+        if intervallo < 1:
+            return False, "The interval must be at least 1."
+        if fino_al and not _parse_date(fino_al):
+            return False, "Invalid end date. Use YYYY-MM-DD."
+        event['type'] = 'ricorrente'
+        event['recurrence'] = {'freq': frequenza, 'interval': intervallo, 'until': fino_al or None, 'exceptions': []}
     
-    events = db.load_data(db.CALENDARIO_DB)
-    events.append(event)
-    db.save_data(db.CALENDARIO_DB, events)
+    db.insert_record(db.CALENDARIO_DB, event)
     return True, "Event created."
 
+def salta_occorrenza(event_id, occurrence_date):
+    """
+    Removes one occurrence of a recurring event (e.g., a call skipped
+    for a holiday), leaving the others.
+
+    Args:
+        event_id (str): The 'id' of the recurring event.
+        occurrence_date (str): The date of the occurrence ('YYYY-MM-DD').
+
+    Returns:
+        tuple (bool, str): (True, "Success message") or (False, "Error message").
+    """
+    event = db.find_record(db.CALENDARIO_DB, event_id)
+    if not event or not _is_recurring(event):
+        return False, "Recurring event not found."
+    occurrence = _parse_date(occurrence_date)
+    if occurrence is None:
+        return False, "Invalid date. Use YYYY-MM-DD."
+    if next(_occorrenze(event, occurrence.toordinal(), occurrence.toordinal()), None) is None:
+        return False, "The event doesn't occur on that date."
+    recurrence = event['recurrence']
+    recurrence['exceptions'] = recurrence.get('exceptions', []) + [occurrence.isoformat()]
+    db.update_record(db.CALENDARIO_DB, event_id, {'recurrence': recurrence})
+    return True, "Occurrence removed."
+
+def delete_evento_manuale(event_id):
+    """
+    Deletes a user-created event (all the occurrences, if recurring).
+    Automatic events can't be deleted: they follow their source.
+
+    Args:
+        event_id (str): The 'id' of the event.
+
+    Returns:
+        tuple (bool, str): (True, "Success message") or (False, "Error message").
+    """
+    event = db.find_record(db.CALENDARIO_DB, event_id)
+    if not event or event.get('type') not in TIPI_EVENTO_MANUALE:
+        return False, "Event not found or not manual."
+    db.delete_record(db.CALENDARIO_DB, event_id)
+    return True, "Event deleted."
+
+# --- Automatic Deadlines ---
+# The automatic events are derived from the projects (one per open phase
+# with a due date) and the invoices (one per unpaid invoice with a due
+# date). Each one has a stable id, computed from its source (type, record
+# id, phase id), so it is updated in place instead of deleted and recreated.
+# Every change to a project or an invoice made by this process updates
+# just the events derived from it (see _on_source_change), so
+# generate_scadenze_automatiche() only rescans a source when it can't be
+# sure the events match it: the first time, after changes made by another
+# process, or with the SQLite backend (no on-disk stamps). The stamps of
+# the data the events last matched are kept in the settings
+# ('scadenze_sync'), so a new process doesn't rescan unchanged data.
+
+AUTO_EVENT_NAMESPACE = uuid.UUID('6f0c3f52-8a7e-4d5b-9c1e-2b7a4e9d3c10')
+AUTO_EVENT_TYPES = {db.PROGETTI_DB: 'auto_project', db.DOCUMENTI_DB: 'auto_invoice'}
+
+_LIVE = 'live'
+# {source: _LIVE (every change seen since a full scan), or the on-disk
+# stamp (see persistence.get_data_stamp) the events were found to match}
+_synced = {}
+
+def _auto_event_id(event_type, source_id, fase_id=None):
+    """Returns the stable id of the automatic event of a source record (and phase)."""
+    return str(uuid.uuid5(AUTO_EVENT_NAMESPACE, f"{event_type}:{source_id}:{fase_id or ''}"))
+
+def _auto_events(source, record):
+    """
+    Computes the automatic events derived from a project or an invoice.
+
+    Args:
+        source (str): db.PROGETTI_DB or db.DOCUMENTI_DB.
+        record (dict): The project or document (or None).
+
+    Returns:
+        dict: {event id: event}, empty if the record has no deadlines.
+    """
+    auto_events = {}
+    if record is None:
+        return auto_events
+    if source == db.PROGETTI_DB:
+        if record.get('status') == 'In corso':
+            for fase in record.get('fasi', []):
+                # If phase is not complete and has a valid due date
+                if not fase.get('completata') and _parse_date(fase.get('scadenza')):
+                    event_id = _auto_event_id('auto_project', record['id'], fase.get('id'))
+                    auto_events[event_id] = {
+                        'id': event_id,
+                        'date': fase['scadenza'],
+                        'title': f"[PROJECT] Phase Due: {fase['nome']}",
+                        'description': f"Project: {record['name']} (ID: {record['id']})",
+                        'type': 'auto_project',
+                        'source_id': record['id']
+                    }
+    elif record.get('doc_type') == 'invoice' and record.get('status') in ('In sospeso', 'Scaduto'):
+        # Validated once when the invoice was saved (see persistence.DATE_ORDINAL_FIELDS)
+        if record.get('due_date_ord') is not None:
+            event_id = _auto_event_id('auto_invoice', record['id'])
+            # Missing (or None) totals count as zero
+            total = record.get('total_da_pagare')
+            if total is None:
+                total = record.get('total') or 0
+            auto_events[event_id] = {
+                'id': event_id,
+                'date': record['due_date'],
+                'title': f"[INVOICE] Payment Due: {record['number']}",
+                'description': f"Client (ID: {record['client_id']}) - Total: {total:.2f} €",
+                'type': 'auto_invoice',
+                'source_id': record['id']
+            }
+    return auto_events
+
+def _same_event(stored, event):
+    """Returns True if a stored event (or None) already has all the values of an event."""
+    return stored is not None and all(stored.get(key) == value for key, value in event.items())
+
+def _apply_auto_events(old_events, new_events):
+    """
+    Writes the differences between two sets of automatic events.
+
+    Args:
+        old_events (dict): {event id: event} as currently stored.
+        new_events (dict): {event id: event} as they should be.
+
+    Returns:
+        int: The number of events added, updated or removed.
+    """
+    changed = 0
+    for event_id in old_events.keys() - new_events.keys():
+        if db.delete_record(db.CALENDARIO_DB, event_id):
+            changed += 1
+    for event_id, event in new_events.items():
+        if not _same_event(old_events.get(event_id), event):
+            if db.update_record(db.CALENDARIO_DB, event_id, event) is None:
+                db.insert_record(db.CALENDARIO_DB, event)
+            changed += 1
+    return changed
+
+def _on_source_change(change):
+    """Updates the automatic events of a changed project or invoice (see events.py)."""
+    if change.operation == 'reload':
+        # Changed by someone else: rescanned by the next generate_scadenze_automatiche()
+        if change.entity is None:
+            _synced.clear()
+        else:
+            _synced.pop(change.entity, None)
+        return
+    _apply_auto_events(_auto_events(change.entity, change.before), _auto_events(change.entity, change.after))
+    if _synced.get(change.entity) is not _LIVE:
+        # The on-disk stamp the events matched is now out of date
+        _synced.pop(change.entity, None)
+
+for _source in AUTO_EVENT_TYPES:
+    events.subscribe(_source, _on_source_change)
+
+def _rescan_source(source):
+    """
+    Brings the automatic events of a source up to date with all its records.
+
+    Args:
+        source (str): db.PROGETTI_DB or db.DOCUMENTI_DB.
+
+    Returns:
+        int: The number of events added, updated or removed.
+    """
+    if source == db.PROGETTI_DB:
+        records = db_progetti.get_all_projects()
+    else:
+        records = db_docs.get_all_documents(doc_type='invoice')
+    expected = {}
+    for record in records:
+        expected.update(_auto_events(source, record))
+    # Events left by older versions (random ids) don't match and are replaced
+    stored = {e['id']: e for e in db.query_data(db.CALENDARIO_DB, type=AUTO_EVENT_TYPES[source])}
+    with db.group_commit():
+        return _apply_auto_events(stored, expected)
+
 def generate_scadenze_automatiche():
     """
-    Scans all projects and invoices to generate/update calendar events.
-    This function is 'idempotent' - it deletes all old 'auto' events
-    and regenerates them, ensuring no duplicates.
-    
+    Brings the automatic calendar events (project phases and invoices
+    due) up to date. Only the events whose source changed are written,
+    and projects and invoices are only rescanned when they may have
+    changed without this process seeing it (see Automatic Deadlines).
+
     Returns:
-        tuple (int, str): (count_of_new_events, "Success message").
+        tuple (int, str): (count_of_changed_events, "Success message").
     """
-    all_events = db.load_data(db.CALENDARIO_DB)
-    
-    # 1. Filter to keep only manual events
-    manual_events = [e for e in all_events if e.get('type') == 'manuale']
-    
-    new_auto_events = []
+    # Pending writes first, so the on-disk stamps describe the current data
+    db.flush()
+    changed = 0
+    # Other processes (e.g., the GUI adding an event) must not write
+    # while the events are checked against the data
+    with db.write_lock():
+        settings = db.load_settings()
+        matched = settings.get('scadenze_sync', {})
+        new_matched = {}
+        for source in AUTO_EVENT_TYPES:
+            if _synced.get(source) is _LIVE:
+                db.revalidate(source) # A change by another process drops _LIVE
+            state = _synced.get(source)
+            stamp = db.get_data_stamp(source)
+            if stamp is None or (state is not _LIVE and stamp not in (state, matched.get(source))):
+                # Without a stamp (SQLite) changes by other processes can't be ruled out
+                changed += _rescan_source(source)
+                _synced[source] = _LIVE
+            elif state is not _LIVE:
+                _synced[source] = stamp
+            if stamp is not None:
+                new_matched[source] = stamp
+        if new_matched != matched:
+            settings['scadenze_sync'] = new_matched
+            db.save_settings(settings)
+    return changed, "Automatic deadlines updated."
+
+def componi_digest_scadenze(target_date, eventi):
+    """
+    Builds the reminder email listing the events of a day.
+
+    Args:
+        target_date (datetime.date): The day of the events.
+        eventi (list): The events of that day (see get_eventi).
+
+    Returns:
+        tuple (str, str): (subject, body).
+    """
+    target_date_str = target_date.isoformat()
+    subject = f"Deadline Reminders for {target_date_str}"
+    body = f"Hello,\n\nThese are your reminders for {target_date_str}:\n\n"
     
-    # 2. Scan active projects for incomplete phases with due dates
-    progetti = db_progetti.get_all_projects()
-    for p in progetti:
-        if p.get('status') == 'In corso':
-            for fase in p.get('fasi', []):
-                # If phase is not complete and has a due date
-                if not fase.get('completata') and fase.get('scadenza'):
-                    fase_date = _parse_date(fase['scadenza'])
-                    if fase_date:
-                        new_auto_events.append({
-                            'id': str(uuid.uuid4()),
-                            'date': fase['scadenza'],
-                            'title': f"[PROJECT] Phase Due: {fase['nome']}",
-                            'description': f"Project: {p['name']} (ID: {p['id']})",
-                            'type': 'auto_project',
-                            'source_id': p['id']
-                        })
-
-    # 3. Scan 'In sospeso' or 'Scaduto' invoices for due dates
-    fatture = db_docs.get_all_documents(doc_type='invoice')
-    for f in fatture:
-        if f.get('status') == 'In sospeso' or f.get('status') == 'Scaduto':
-            due_date_str = f.get('due_date')
-            due_date = _parse_date(due_date_str)
-            if due_date:
-                new_auto_events.append({
-                    'id': str(uuid.uuid4()),
-                    'date': due_date_str,
-                    'title': f"[INVOICE] Payment Due: {f['number']}",
-                    'description': f"Client (ID: {f['client_id']}) - Total: {f.get('total_da_pagare', f.get('total', 0)):.2f} €",
-                    'type': 'auto_invoice',
-                    'source_id': f['id']
-                })
-                
-    # 4. Save the new combined list (manual + new auto)
-    final_events = manual_events + new_auto_events
-    db.save_data(db.CALENDARIO_DB, final_events)
+    for event in eventi:
+        body += "---------------------------------\n"
+        body += f"SUBJECT: {event['title']}\n"
+        body += f"DETAILS: {event['description']}\n"
     
-    return len(new_auto_events), "Automatic deadlines updated."
+    body += "\n\nHave a great day,\nYour Management App"
+    return subject, body
 
 def send_notifiche_scadenze(giorni_anticipo=1):
     """
     Finds all deadlines for a target date (e.g., tomorrow)
     and sends a single summary email.
+    For reminders sent automatically every day, see scheduler.py.
 
     Args:
         giorni_anticipo (int): How many days in the future to check.
@@ -147,7 +561,7 @@ def send_notifiche_scadenze(giorni_anticipo=1):
     settings = db.load_settings()
     smtp_config = settings.get('smtp_config')
     # Use the specific notification email, or fall back to the SMTP user
-    notify_email = smtp_config.get('notify_email', smtp_config.get('user'))
+    notify_email = smtp_config.get('notify_email') or smtp_config.get('user')
 
     if not notify_email:
         return False, "No notification email configured in settings."
@@ -156,34 +570,16 @@ def send_notifiche_scadenze(giorni_anticipo=1):
         
     # Calculate the target date
     target_date = datetime.now().date() + timedelta(days=giorni_anticipo)
-    target_date_str = target_date.isoformat()
 
     # Find events for that specific day
     # We use generate_scadenze_automatiche() first to ensure data is fresh
     generate_scadenze_automatiche()
-    all_events = db.load_data(db.CALENDARIO_DB)
-    events_for_target_date = [e for e in all_events if e.get('date') == target_date_str]
+    events_for_target_date = get_eventi(target_date, target_date)
     
     if not events_for_target_date:
-        return True, f"No deadlines found for {target_date_str}."
+        return True, f"No deadlines found for {target_date.isoformat()}."
 
-    # Build the email body
-    subject = f"Deadline Reminders for {target_date_str}"
-    body = f"Hello,\n\nThese are your reminders for {target_date_str}:\n\n"
-    
-    for event in events_for_target_date:
-        body += "---------------------------------\n"
-        body += f"SUBJECT: {event['title']}\n"
-        body += f"DETAILS: {event['description']}\n"
-    
-    body += "\n\nHave a great day,\nYour Management App"
-    
-    # Send the email using the utility function
-    success, msg = email_utils.send_email(
-        recipient_email=notify_email,
-        subject=subject,
-        body=body,
-        smtp_config=smtp_config
-    )
+    subject, body = componi_digest_scadenze(target_date, events_for_target_date)
     
-    return success, msg
\ No newline at end of file
+    # Sent over the shared connection of the account (see email_utils)
+    return email_utils.get_connection(smtp_config).send(notify_email, subject, body)
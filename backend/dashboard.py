@@ -1,6 +1,5 @@
 import os
 from datetime import datetime, timedelta
-from decimal import Decimal
 import pandas as pd
 
 # Import backend modules using relative imports
@@ -10,6 +9,8 @@ from . import projects as db_progetti
 from . import documents as db_docs
 from . import calendar as db_calendario
 from . import ledger as db_ledger
+from . import ledger_columns
+from . import money
 from . import time_reports as db_reporting # time_reports.py was not provided, but is imported
 
 # Import PDF generation tools from reportlab
@@ -37,31 +38,21 @@ def get_dashboard_data():
     
     # 2. Get all invoices and filter for unpaid ones
     fatture = db_docs.get_all_documents(doc_type='invoice')
-    fatture_da_incassare = []
-    totale_da_incassare = Decimal('0')
-    for f in fatture:
-        if f.get('status') in ['In sospeso', 'Scaduto']:
-            fatture_da_incassare.append(f)
-            # Use 'total_da_pagare' which includes withholding tax (Ritenuta)
-            totale_da_incassare += f.get('total_da_pagare', Decimal('0'))
+    fatture_da_incassare = [f for f in fatture if f.get('status') in ['In sospeso', 'Scaduto']]
+    # Use 'total_da_pagare' which includes withholding tax (Ritenuta), summed exactly
+    totale_da_incassare = money.total(
+        f.get('total_da_pagare') for f in fatture_da_incassare
+    ).to_decimal()
             
     # 3. Get upcoming deadlines for the next 7 days
     end_date = today + timedelta(days=7)
     scadenze_imminenti = db_calendario.get_eventi(today, end_date)
     
     # 4. Calculate Earning Statistics (Cash basis, Year-To-Date)
-    # Use the internal _get_dataframe helper from the ledger module
-    df_movimenti, _ = db_ledger._get_dataframe(current_year)
-    incassato_ytd = Decimal('0')
-    uscite_ytd = Decimal('0')
-    if not df_movimenti.empty:
-        # Sum 'amount_totale' from the financial ledger
-        incassato_ytd = Decimal(str(
-            df_movimenti[df_movimenti['type'] == 'Entrata']['amount_totale'].sum()
-        ))
-        uscite_ytd = Decimal(str(
-            df_movimenti[df_movimenti['type'] == 'Uscita']['amount_totale'].sum()
-        ))
+    # Exact sums of 'amount_totale' over the columnar ledger
+    totali = ledger_columns.sum_by_type(current_year, 'amount_totale')
+    incassato_ytd = totali['Entrata']
+    uscite_ytd = totali['Uscita']
 
     # Assemble the final dictionary for the UI
     return {
@@ -93,14 +84,10 @@ def _get_report_dataframes(year):
     # Create a lookup map for client names to avoid repeated DB calls
     client_names = {c['id']: c.get('name', 'N/A') for c in db_rubrica.get_all_contacts()}
     
-    # Filter all invoices by year
-    for doc in db_docs.get_all_documents(doc_type='invoice'):
-        try:
-            if datetime.strptime(doc['date'], '%Y-%m-%d').year == year:
-                doc['client_name'] = client_names.get(doc['client_id'], 'N/A')
-                fatture_anno.append(doc)
-        except ValueError:
-            continue
+    # Invoices of the year (only that year's partition is read)
+    for doc in db_docs.get_all_documents(doc_type='invoice', year=year):
+        doc['client_name'] = client_names.get(doc['client_id'], 'N/A')
+        fatture_anno.append(doc)
             
     df_fatture = pd.DataFrame(fatture_anno)
     if not df_fatture.empty:
@@ -0,0 +1,391 @@
+import os
+
+from . import events
+from . import sqlite_store
+from . import locking
+from . import file_cache
+from . import writes
+from . import journal
+from . import partitions
+from . import record_format
+from . import storage_backend
+from . import transactions
+from .record_format import copy_record, prepared
+
+# --- Change Feed ---
+# Every change to the records is published to the events module (see
+# events.py), right after it is applied. The copies of the records before
+# and after the change are only made when someone listens.
+
+def publish_change(db_name, record_id, before, after):
+    """
+    Publishes the change of one record, unless nothing changed.
+
+    Args:
+        db_name (str): The data list (e.g., PROGETTI_DB).
+        record_id (str): The 'id' of the record.
+        before (dict): A private copy of the old record, or None if inserted.
+        after (dict): A private copy of the new record, or None if deleted.
+    """
+    if before == after:
+        return
+    operation = 'insert' if before is None else 'delete' if after is None else 'update'
+    events.publish(events.Change(db_name, record_id, operation, before, after))
+
+def _publish_replace(db_name, old_records, new_records):
+    """Publishes the differences between two versions of a whole data list."""
+    old_by_id = {record.get('id'): record for record in old_records}
+    for record in new_records:
+        record_id = record.get('id')
+        publish_change(db_name, record_id, old_by_id.pop(record_id, None), copy_record(record))
+    for record_id, record in old_by_id.items():
+        publish_change(db_name, record_id, record, None)
+
+# --- Cache Versions and Stamps ---
+
+def get_data_version(db_name):
+    """
+    Returns the in-process version counter of a data file.
+    The counter changes whenever the cached content changes, so derived
+    structures (indexes, aggregates) can cheaply check if they are stale.
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+
+    Returns:
+        int: The current version (0 if never loaded).
+    """
+    if db_name in partitions.PARTITIONED_DBS:
+        # Changes whenever any partition (or the partition list) changes
+        prefix = os.path.splitext(db_name)[0] + '_'
+        return sum(
+            version for name, version in file_cache.versions.items()
+            if name.startswith(prefix) or name == db_name + partitions.PARTITION_INDEX_SUFFIX
+        )
+    return file_cache.versions.get(db_name, 0)
+
+@locking.synchronized
+def invalidate_cache(db_name=None):
+    """
+    Drops cached data so the next read goes to disk.
+    Subscribers to the changes (see events.py) get a 'reload'.
+
+    Args:
+        db_name (str, optional): The file to drop. If None, clears everything.
+    """
+    if db_name is None:
+        file_cache.cache.clear()
+        journal.stores.clear()
+        storage_backend.forget()
+        transactions.recovery_checked = False
+    else:
+        file_cache.cache.pop(db_name, None)
+        journal.stores.pop(db_name, None)
+        if db_name in partitions.PARTITIONED_DBS:
+            file_cache.cache.pop(db_name + partitions.PARTITION_INDEX_SUFFIX, None)
+            prefix = os.path.splitext(db_name)[0] + '_'
+            for name in [name for name in journal.stores if name.startswith(prefix)]:
+                del journal.stores[name]
+    events.reload(db_name)
+
+@locking.synchronized
+def get_partition_stamp(db_name, year):
+    """
+    Returns a stamp identifying the on-disk content of one year partition,
+    so data derived from it can be persisted next to it and revalidated
+    later (even by another process) without loading the records.
+
+    Args:
+        db_name (str): DOCUMENTI_DB or PRIMANOTA_DB.
+        year (int): The partition year.
+
+    Returns:
+        tuple: Stat values of the partition snapshot and journal, or None
+               if there is no stable on-disk state (SQLite backend, or a
+               write of the partition still pending a flush).
+    """
+    if db_name not in partitions.PARTITIONED_DBS or storage_backend.use_sqlite(db_name):
+        return None
+    partitions.partition_years(db_name)
+    return _disk_stamp(partitions.partition_path(db_name, year))
+
+def _disk_stamp(name):
+    """Returns the stat values of a store's snapshot and journal (None if a write is pending)."""
+    if name in writes.deferred_writes:
+        return None
+    stamp = ()
+    for path in (name, journal.journal_path(name)):
+        stat_result = journal.stat_or_none(path)
+        stamp += file_cache.file_stamp(stat_result) if stat_result is not None else (0, 0, 0)
+    return stamp
+
+@locking.synchronized
+def get_data_stamp(db_name):
+    """
+    Returns a stamp identifying the on-disk content of a whole data list
+    (like get_partition_stamp), without loading the records. Unlike
+    get_data_version, it also changes when another process writes.
+
+    Args:
+        db_name (str): The filename constant (e.g., PROGETTI_DB).
+
+    Returns:
+        tuple: Stat values of all the files of the data list, or None if
+               there is no stable on-disk state (SQLite backend, or a
+               write still pending a flush).
+    """
+    if storage_backend.use_sqlite(db_name):
+        return None
+    names = partitions.store_names(db_name) # Splits a legacy store first, if needed
+    stamp = ()
+    if db_name in partitions.PARTITIONED_DBS:
+        stamp += journal.stamp_or_none(db_name + partitions.PARTITION_INDEX_SUFFIX) or (0, 0, 0)
+    for name in names:
+        store_stamp = _disk_stamp(name)
+        if store_stamp is None:
+            return None
+        stamp += store_stamp
+    return stamp
+
+@locking.synchronized
+def revalidate(db_name):
+    """
+    Checks the cached records of a data list against the files, reloading
+    what another process changed (subscribers then get a 'reload').
+    Costs a few stat calls when nothing changed. Stores on disk but never
+    loaded by this process (e.g., a partition created by another process)
+    are loaded and reported as a 'reload' too.
+
+    Args:
+        db_name (str): The filename constant (e.g., PROGETTI_DB).
+    """
+    if storage_backend.use_sqlite(db_name):
+        return
+    for name in partitions.store_names(db_name):
+        if name in journal.stores:
+            journal.load_store(name)
+        elif os.path.exists(name) or os.path.exists(journal.journal_path(name)):
+            journal.load_store(name)
+            events.reload(partitions.logical_db(name))
+
+# --- Generic Data Persistence ---
+
+@locking.synchronized
+def load_data(db_name):
+    """
+    Loads a data list from a specified pickle file.
+
+    The decoded list is cached in memory and revalidated against the
+    file's mtime/size, so repeated loads don't re-read the file.
+    The caller always receives its own copy and may modify it freely.
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB) to load from.
+
+    Returns:
+        list: The loaded list of data, or an empty list if the file
+              doesn't exist or is empty/corrupt.
+    """
+    if storage_backend.use_sqlite(db_name):
+        return sqlite_store.load_all(storage_backend.sqlite(), db_name)
+    return [
+        copy_record(record)
+        for name in partitions.store_names(db_name)
+        for record in journal.load_store(name)['data']
+    ]
+
+@locking.exclusive
+def save_data(db_name, data):
+    """
+    Saves an entire data list to a specified pickle file.
+    This rewrites the whole file: for single-record changes prefer
+    insert_record, update_record and delete_record.
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB) to save to.
+        data (list): The list of data to save.
+    """
+    # Keep a private copy, so later changes to 'data' can't leak into the cache
+    data = [prepared(record, db_name) for record in data]
+    old_data = load_data(db_name) if events.has_subscribers(db_name) else None
+    if storage_backend.use_sqlite(db_name):
+        sqlite_store.replace_all(storage_backend.sqlite(), db_name, data)
+    elif db_name in partitions.PARTITIONED_DBS:
+        partitions.save_partitioned(db_name, data)
+    else:
+        journal.write_snapshot(db_name, data)
+    if old_data is not None:
+        _publish_replace(db_name, old_data, data)
+
+@locking.exclusive
+def insert_record(db_name, record):
+    """
+    Appends a new record to a data file.
+    The record must already have its unique 'id'.
+
+    Args:
+        db_name (str): The filename constant (e.g., PRIMANOTA_DB).
+        record (dict): The record to add.
+    """
+    record = prepared(record, db_name)
+    notify = events.has_subscribers(db_name)
+    before = find_record(db_name, record['id']) if notify else None
+    if storage_backend.use_sqlite(db_name):
+        sqlite_store.insert(storage_backend.sqlite(), db_name, record)
+    else:
+        partitions.journal_changes(db_name, [('insert', record)])
+    if notify:
+        publish_change(db_name, record['id'], before, copy_record(record))
+
+@locking.synchronized
+def find_record(db_name, record_id):
+    """
+    Finds a single record by its unique ID.
+    Uses the primary key index (or the SQLite primary key), so the cost
+    doesn't depend on the number of records.
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+        record_id (str): The 'id' of the record to find.
+
+    Returns:
+        dict: A copy of the record if found, else None.
+    """
+    if storage_backend.use_sqlite(db_name):
+        return sqlite_store.find(storage_backend.sqlite(), db_name, record_id)
+    found = partitions.locate(db_name, record_id)
+    return copy_record(found[1]) if found is not None else None
+
+@locking.exclusive
+def update_record(db_name, record_id, fields):
+    """
+    Merges new field values into an existing record.
+
+    Args:
+        db_name (str): The filename constant (e.g., PROGETTI_DB).
+        record_id (str): The 'id' of the record to update.
+        fields (dict): The fields to set.
+
+    Returns:
+        dict: A copy of the updated record, or None if not found.
+    """
+    fields = prepared(fields, db_name, whole=False)
+    notify = events.has_subscribers(db_name)
+    before = find_record(db_name, record_id) if notify else None
+    if storage_backend.use_sqlite(db_name):
+        updated = sqlite_store.update(storage_backend.sqlite(), db_name, record_id, fields)
+    elif partitions.locate(db_name, record_id) is None:
+        updated = None
+    else:
+        partitions.journal_changes(db_name, [('update', record_id, fields)])
+        updated = copy_record(partitions.locate(db_name, record_id)[1])
+    if notify and updated is not None:
+        publish_change(db_name, record_id, before, copy_record(updated))
+    return updated
+
+@locking.exclusive
+def modify_record(db_name, record_id, change):
+    """
+    Changes a record based on its current content (e.g., appends to one
+    of its lists). The record is read and the changed fields are written
+    under the same lock, so a change made in between by another thread or
+    process can't be overwritten. Only the fields returned by change() are
+    journaled: the caller neither loads the whole data list nor writes it
+    back.
+
+    Args:
+        db_name (str): The filename constant (e.g., PROGETTI_DB).
+        record_id (str): The 'id' of the record to change.
+        change (callable): Called with a copy of the record, returns the
+            fields to set (dict), or None to leave the record unchanged.
+
+    Returns:
+        dict: A copy of the record after the change, or None if not found.
+    """
+    record = find_record(db_name, record_id)
+    if record is None:
+        return None
+    fields = change(record)
+    if not fields:
+        return record
+    return update_record(db_name, record_id, fields)
+
+@locking.exclusive
+def delete_record(db_name, record_id):
+    """
+    Removes a record from a data file.
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+        record_id (str): The 'id' of the record to delete.
+
+    Returns:
+        bool: True if the record was found and deleted, False otherwise.
+    """
+    before = find_record(db_name, record_id) if events.has_subscribers(db_name) else None
+    if storage_backend.use_sqlite(db_name):
+        deleted = sqlite_store.delete(storage_backend.sqlite(), db_name, record_id)
+    elif partitions.locate(db_name, record_id) is None:
+        deleted = False
+    else:
+        partitions.journal_changes(db_name, [('delete', record_id)])
+        deleted = True
+    if deleted and before is not None:
+        publish_change(db_name, record_id, before, None)
+    return deleted
+
+@locking.synchronized
+def query_data(db_name, date_from=None, date_to=None, order_by=None, **filters):
+    """
+    Loads only the records matching some simple conditions.
+    With the SQLite backend the conditions are evaluated by the database
+    using its indexes; with the pickle backend they are evaluated in memory.
+
+    Args:
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        date_from (date, optional): Inclusive lower bound on the record 'date'.
+        date_to (date, optional): Inclusive upper bound on the record 'date'.
+        order_by (str, optional): A field to sort the results by (e.g., 'date').
+        **filters: Equality conditions on indexed fields
+                   (date, status, client_id, doc_type, linked_invoice_id, type).
+
+    Returns:
+        list: Copies of the matching records. Records with an invalid 'date'
+              are excluded when a date range is given.
+    """
+    date_from = record_format.as_date(date_from) if date_from is not None else None
+    date_to = record_format.as_date(date_to) if date_to is not None else None
+
+    if storage_backend.use_sqlite(db_name):
+        return sqlite_store.query(
+            storage_backend.sqlite(), db_name, filters,
+            date_from.isoformat() if date_from else None,
+            date_to.isoformat() if date_to else None,
+            order_by
+        )
+
+    has_range = date_from is not None or date_to is not None
+    # Plain integer comparisons on the stored date ordinals
+    ord_from = date_from.toordinal() if date_from is not None else None
+    ord_to = date_to.toordinal() if date_to is not None else None
+    results = []
+    # Partitioned stores only read the years in the range
+    records = (
+        record
+        for name in partitions.store_names(db_name, date_from, date_to)
+        for record in journal.load_store(name)['data']
+    )
+    for record in records:
+        if any(record.get(key) != value for key, value in filters.items()):
+            continue
+        if has_range:
+            ordinal = record.get('date_ord')
+            if (ordinal is None or
+                (ord_from is not None and ordinal < ord_from) or
+                (ord_to is not None and ordinal > ord_to)):
+                continue
+        results.append(copy_record(record))
+
+    if order_by is not None:
+        results.sort(key=lambda r: r.get(order_by) or '')
+    return results
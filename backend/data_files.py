@@ -0,0 +1,14 @@
+# --- Constants: File Paths ---
+# Define filenames for all data persistence files.
+# These will be created in the root folder.
+# Use them through the persistence module (e.g., persistence.RUBRICA_DB).
+RUBRICA_DB = 'rubrica.pkl'
+PROGETTI_DB = 'progetti.pkl'
+DOCUMENTI_DB = 'documenti.pkl'
+CALENDARIO_DB = 'calendario.pkl'
+MAGAZZINO_DB = 'magazzino.pkl'
+PRIMANOTA_DB = 'primanota.pkl'
+SETTINGS_FILE = 'settings.pkl'
+SQLITE_FILE = 'gestionale.db'
+TRANSACTION_FILE = 'transaction.pending'
+SEQUENCES_FILE = 'sequences.pkl'
@@ -1,11 +1,51 @@
+import hashlib
 import os
+import re
 import uuid
-from datetime import date, datetime
-from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from itertools import islice
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+from xml.sax.saxutils import escape as xml_escape
 
 # Import for new HTML->PDF generation
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from weasyprint import HTML
+# WeasyPrint is optional: without it (or without its GTK libraries, which
+# fail with OSError) documents are rendered with the ReportLab engine
+try:
+    from weasyprint import CSS, HTML
+except (ImportError, OSError):
+    CSS = HTML = None
+URLFetcher = URLFetcherResponse = default_url_fetcher = FontConfiguration = None
+if HTML is not None:
+    try:
+        from weasyprint.urls import URLFetcher, URLFetcherResponse
+    except ImportError:
+        from weasyprint import default_url_fetcher # WeasyPrint without URLFetcher
+    try:
+        from weasyprint.text.fonts import FontConfiguration
+    except ImportError:
+        try:
+            from weasyprint.fonts import FontConfiguration # WeasyPrint < 53
+        except ImportError:
+            pass
+# pypdf is optional: it joins the parts of large documents
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+# Import PDF generation tools from reportlab (the fast PDF engine)
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.platypus.flowables import HRFlowable
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import cm
 
 # Required for stats
 import pandas as pd
@@ -14,9 +54,11 @@ import pandas as pd
 from . import persistence as db
 from . import address_book as db_rubrica
 from . import inventory as db_magazzino # Needed for stock updates
+from . import money
 
 # --- Constants ---
 PDF_EXPORT_DIR = "DOCUMENTI_PDF" # Directory for storing exported PDFs
+TEMPLATE_FILE = "invoice_template.html" # HTML template of quotes and invoices
 VALID_INVOICE_STATUS = ["In sospeso", "Pagato", "Scaduto", "Annullato"]
 VALID_QUOTE_STATUS = ["Bozza", "Inviato", "Accettato", "Rifiutato", "Fatturato"]
 
@@ -44,32 +86,36 @@ def find_document_by_id(doc_id):
     Returns:
         dict: The document dictionary if found, else None.
     """
-    documents = db.load_data(db.DOCUMENTI_DB)
-    for doc in documents:
-        if doc.get('id') == doc_id:
-            return doc
-    return None
+    return db.find_record(db.DOCUMENTI_DB, doc_id)
 
-def get_all_documents(doc_type=None):
+def get_all_documents(doc_type=None, year=None):
     """
-    Gets all documents, optionally filtering by type ('quote' or 'invoice').
+    Gets all documents, optionally filtering by type ('quote' or 'invoice')
+    and by the year of their date.
 
     Args:
         doc_type (str, optional): 'quote' or 'invoice'.
+        year (int, optional): Only documents dated in this year.
+                              Reads just that year's partition.
 
     Returns:
         list: A list of document dictionaries.
     """
-    documents = db.load_data(db.DOCUMENTI_DB)
+    filters = {'doc_type': doc_type} if doc_type else {}
+    if year is not None:
+        return db.query_data(
+            db.DOCUMENTI_DB, date_from=date(year, 1, 1), date_to=date(year, 12, 31), **filters
+        )
     if doc_type:
-        return [d for d in documents if d.get('doc_type') == doc_type]
-    return documents
+        # Filtered by the storage backend (an indexed query with SQLite)
+        return db.query_data(db.DOCUMENTI_DB, **filters)
+    return db.load_data(db.DOCUMENTI_DB)
 
 # --- Core Logic: Calculations ---
 
 def _calculate_totals(items, discount_perc=Decimal('0'), vat_perc=Decimal('22'), ritenuta_perc=Decimal('0')):
     """
-    Performs financial calculations using Decimal for precision.
+    Performs financial calculations with exact Money amounts.
     Includes subtotal, discount, taxable amount, VAT, withholding tax (ritenuta),
     and final amount due.
 
@@ -89,50 +135,44 @@ def _calculate_totals(items, discount_perc=Decimal('0'), vat_perc=Decimal('22'),
     vat_perc = Decimal(str(vat_perc))
     ritenuta_perc = Decimal(str(ritenuta_perc))
     
-    subtotal = Decimal('0')
+    # The math runs on exact integer Money amounts (same results as Decimal)
+    subtotal = money.ZERO
     
     # Calculate subtotal from line items
     for item in items:
-        qty = Decimal(str(item.get('qty', '1')))
-        unit_price = Decimal(str(item.get('unit_price', '0')))
-        item_total = qty * unit_price
-        item['total'] = item_total # Store line total in the item dict
+        item_total = money.Money.parse(item.get('unit_price', '0')) * item.get('qty', '1')
+        item['total'] = item_total.to_decimal() # Store line total in the item dict
         subtotal += item_total
         
-    # Calculate discount
-    discount_amount = (subtotal * (discount_perc / Decimal('100'))).quantize(
-        Decimal('0.01'), rounding=ROUND_HALF_UP
-    )
+    # Calculate discount (rounded half up to the cent)
+    discount_amount = subtotal.percent(discount_perc)
     
     taxable_amount = subtotal - discount_amount
     
     # Calculate VAT (IVA)
-    vat_amount = (taxable_amount * (vat_perc / Decimal('100'))).quantize(
-        Decimal('0.01'), rounding=ROUND_HALF_UP
-    )
+    vat_amount = taxable_amount.percent(vat_perc)
     
     # This is the gross total of the document (taxable + VAT)
     total = taxable_amount + vat_amount
     
     # Calculate withholding tax (Ritenuta) on the taxable amount
-    ritenuta_amount = (taxable_amount * (ritenuta_perc / Decimal('100'))).quantize(
-        Decimal('0.01'), rounding=ROUND_HALF_UP
-    )
+    ritenuta_amount = taxable_amount.percent(ritenuta_perc)
     
     # This is the final net amount the client has to pay (Gross - Withholding)
     total_da_pagare = total - ritenuta_amount
     
+    # Records store plain Decimals
     return {
-        'subtotal': subtotal,
+        'subtotal': subtotal.to_decimal(),
         'discount_perc': discount_perc,
-        'discount_amount': discount_amount,
-        'taxable_amount': taxable_amount,
+        'discount_amount': discount_amount.to_decimal(),
+        'taxable_amount': taxable_amount.to_decimal(),
         'vat_perc': vat_perc,
-        'vat_amount': vat_amount,
-        'total': total, # Gross document total
+        'vat_amount': vat_amount.to_decimal(),
+        'total': total.to_decimal(), # Gross document total
         'ritenuta_perc': ritenuta_perc,
-        'ritenuta_amount': ritenuta_amount,
-        'total_da_pagare': total_da_pagare, # Net amount to be paid
+        'ritenuta_amount': ritenuta_amount.to_decimal(),
+        'total_da_pagare': total_da_pagare.to_decimal(), # Net amount to be paid
         'items': items # Return items with calculated 'total'
     }
 
@@ -178,18 +218,18 @@ def create_quote(client_id, project_id, items, discount_perc, vat_perc, notes=""
     
     quote.update(calculations) # Add all calculated fields
     
-    documents = db.load_data(db.DOCUMENTI_DB)
-    documents.append(quote)
-    db.save_data(db.DOCUMENTI_DB, documents)
+    db.insert_record(db.DOCUMENTI_DB, quote)
     
     return quote
 
 # --- Core Logic: Invoices ---
 
-def create_invoice(client_id, project_id, items, discount_perc, vat_perc, ritenuta_perc, due_date, notes=""):
+def create_invoice(client_id, project_id, items, discount_perc, vat_perc, ritenuta_perc, due_date, notes="", tx=None):
     """
     Creates a new invoice document and saves it.
     This function *also* updates warehouse stock if items are linked.
+    The invoice, its number and all the stock changes are committed
+    together in one transaction: if anything fails, nothing is saved.
 
     Args:
         client_id (str): The associated client ID.
@@ -200,6 +240,7 @@ def create_invoice(client_id, project_id, items, discount_perc, vat_perc, ritenu
         ritenuta_perc (Decimal): Withholding tax percentage.
         due_date (str): Due date in 'YYYY-MM-DD' format.
         notes (str): Footer notes.
+        tx (persistence.Transaction, optional): Outer transaction to join.
 
     Returns:
         dict: The newly created invoice.
@@ -215,46 +256,46 @@ def create_invoice(client_id, project_id, items, discount_perc, vat_perc, ritenu
     except InvalidOperation as e:
         raise ValueError(f"Invalid number in line items: {e}")
 
-    invoice = {
-        'id': str(uuid.uuid4()),
-        'doc_type': 'invoice',
-        'number': db.get_next_document_number('invoice'),
-        'date': date.today().isoformat(),
-        'due_date': due_date,
-        'client_id': client_id,
-        'project_id': project_id,
-        'status': 'In sospeso', # Default status
-        'notes': notes,
-    }
-    
-    invoice.update(calculations) # Add calculated fields
-    
-    # --- Warehouse Stock Update ---
-    # After creating the invoice, decrease stock for linked items
-    stock_errors = []
-    for item in invoice['items']:
-        # 'articolo_id' is the new key, 'linked_item_id' is legacy
-        item_id = item.get('articolo_id') or item.get('linked_item_id') 
-        if item_id:
-            try:
-                # Create a negative delta for the stock update
-                qta_to_remove = Decimal(str(item.get('qty', '0'))) * -1 
-                if qta_to_remove != 0:
-                    success, msg = db_magazzino.update_stock(item_id, qta_to_remove)
-                    if not success:
-                        stock_errors.append(f"Item '{item['description']}': {msg}")
-            except Exception as e:
-                stock_errors.append(f"Item '{item['description']}': Error {e}")
-    
-    if stock_errors:
-        # If stock update fails, stop and report the error.
-        # The invoice is *not* saved.
-        raise ValueError("Stock update failed: " + ", ".join(stock_errors))
-    
-    # All good, save the invoice
-    documents = db.load_data(db.DOCUMENTI_DB)
-    documents.append(invoice)
-    db.save_data(db.DOCUMENTI_DB, documents)
+    with db.transaction(tx) as tx:
+        invoice = {
+            'id': str(uuid.uuid4()),
+            'doc_type': 'invoice',
+            'number': tx.get_next_document_number('invoice'),
+            'date': date.today().isoformat(),
+            'due_date': due_date,
+            'client_id': client_id,
+            'project_id': project_id,
+            'status': 'In sospeso', # Default status
+            'notes': notes,
+        }
+        
+        invoice.update(calculations) # Add calculated fields
+        
+        # --- Warehouse Stock Update ---
+        # Decrease stock for linked items
+        stock_errors = []
+        for item in invoice['items']:
+            # (the legacy 'linked_item_id' is migrated on load, see migrations.py)
+            item_id = item.get('articolo_id')
+            if item_id:
+                try:
+                    # Create a negative delta for the stock update
+                    qta_to_remove = Decimal(str(item.get('qty', '0'))) * -1 
+                    if qta_to_remove != 0:
+                        success, msg = db_magazzino.update_stock(item_id, qta_to_remove, tx=tx)
+                        if not success:
+                            stock_errors.append(f"Item '{item.get('description', item_id)}': {msg}")
+                except Exception as e:
+                    stock_errors.append(f"Item '{item.get('description', item_id)}': Error {e}")
+        
+        if stock_errors:
+            # If stock update fails, stop and report the error.
+            # The transaction is rolled back: no stock change, no invoice,
+            # and the invoice number is not consumed.
+            raise ValueError("Stock update failed: " + ", ".join(stock_errors))
+        
+        # All good, save the invoice (committed with the stock changes)
+        tx.insert_record(db.DOCUMENTI_DB, invoice)
     
     return invoice
 
@@ -279,34 +320,37 @@ def convert_quote_to_invoice(quote_id, due_date, ritenuta_perc):
         return False, "Quote has already been invoiced."
 
     try:
-        # Create the invoice. This will also handle stock reduction.
-        new_invoice = create_invoice(
-            client_id=quote['client_id'],
-            project_id=quote.get('project_id'),
-            items=quote['items'],
-            discount_perc=quote['discount_perc'],
-            vat_perc=quote['vat_perc'],
-            ritenuta_perc=ritenuta_perc, # Pass the new Ritenuta
-            due_date=due_date,
-            notes=quote.get('notes', '')
-        )
+        # The new invoice, its stock changes and the quote status
+        # are committed together
+        with db.transaction() as tx:
+            # Create the invoice. This will also handle stock reduction.
+            new_invoice = create_invoice(
+                client_id=quote['client_id'],
+                project_id=quote.get('project_id'),
+                items=quote['items'],
+                discount_perc=quote['discount_perc'],
+                vat_perc=quote['vat_perc'],
+                ritenuta_perc=ritenuta_perc, # Pass the new Ritenuta
+                due_date=due_date,
+                notes=quote.get('notes', ''),
+                tx=tx
+            )
+            # If invoice creation succeeds, update the quote status
+            update_document(quote_id, {'status': 'Fatturato'}, tx=tx)
     except Exception as e:
         # Catch errors from create_invoice (e.g., stock issues)
         return False, f"Error creating invoice: {e}"
     
-    # If invoice creation succeeds, update the quote status
-    quote['status'] = 'Fatturato'
-    update_document(quote_id, quote) # This saves the change
-    
     return True, new_invoice
 
-def update_document_status(doc_id, new_status):
+def update_document_status(doc_id, new_status, tx=None):
     """
     Updates the 'status' field of an existing document.
 
     Args:
         doc_id (str): The 'id' of the document to update.
         new_status (str): The new status (must be valid).
+        tx (persistence.Transaction, optional): Transaction to make the change in.
 
     Returns:
         tuple (bool, dict or str): (True, updated_document) on success,
@@ -314,28 +358,20 @@ def update_document_status(doc_id, new_status):
     Raises:
         ValueError: If the new status is not in the valid lists.
     """
-    documents = db.load_data(db.DOCUMENTI_DB)
-    doc_found = False
-    
-    for i, doc in enumerate(documents):
-        if doc['id'] == doc_id:
-            # Validate status based on document type
-            if doc['doc_type'] == 'invoice' and new_status not in VALID_INVOICE_STATUS:
-                raise ValueError(f"Invalid invoice status: {new_status}")
-            if doc['doc_type'] == 'quote' and new_status not in VALID_QUOTE_STATUS:
-                raise ValueError(f"Invalid quote status: {new_status}")
-
-            documents[i]['status'] = new_status
-            doc_found = True
-            break
-            
-    if doc_found:
-        db.save_data(db.DOCUMENTI_DB, documents)
-        return True, documents[i]
-    
-    return False, "Document not found."
+    store = tx if tx is not None else db
+    doc = store.find_record(db.DOCUMENTI_DB, doc_id)
+    if not doc:
+        return False, "Document not found."
+
+    # Validate status based on document type
+    if doc['doc_type'] == 'invoice' and new_status not in VALID_INVOICE_STATUS:
+        raise ValueError(f"Invalid invoice status: {new_status}")
+    if doc['doc_type'] == 'quote' and new_status not in VALID_QUOTE_STATUS:
+        raise ValueError(f"Invalid quote status: {new_status}")
 
-def update_document(doc_id, updated_data):
+    return True, store.update_record(db.DOCUMENTI_DB, doc_id, {'status': new_status})
+
+def update_document(doc_id, updated_data, tx=None):
     """
     Generic function to update a document (used internally by convert_quote).
     This function is less safe as it merges all data.
@@ -343,94 +379,748 @@ def update_document(doc_id, updated_data):
     Args:
         doc_id (str): The 'id' of the document to update.
         updated_data (dict): Dictionary of data to merge.
+        tx (persistence.Transaction, optional): Transaction to make the change in.
 
     Returns:
         bool: True on success, False if not found.
     """
-    documents = db.load_data(db.DOCUMENTI_DB)
-    doc_found = False
-    for i, doc in enumerate(documents):
-        if doc['id'] == doc_id:
-            doc.update(updated_data) # Merge new data into existing doc
-            documents[i] = doc
-            doc_found = True
-            break
-    if doc_found:
-        db.save_data(db.DOCUMENTI_DB, documents)
-        return True
-    return False
+    store = tx if tx is not None else db
+    # Merge new data into existing doc
+    return store.update_record(db.DOCUMENTI_DB, doc_id, updated_data) is not None
 
 # --- Exporting: PDF ---
 
-def export_to_pdf(doc_id):
+def _my_company_details(settings):
     """
-    Generates a PDF representation of the document using WeasyPrint
-    and an HTML template (invoice_template.html).
+    Parses the 'my company' details of the settings for the template.
+    Assumes format: Name\nAddress\nP.IVA: 123
 
     Args:
-        doc_id (str): The 'id' of the document to export.
+        settings (dict): The application settings.
 
     Returns:
-        tuple (bool, str): (True, "Path to PDF") on success,
-                           (False, "Error message") on failure.
+        dict: {'name', 'address', 'vat_id'}.
     """
-    doc = find_document_by_id(doc_id)
-    if not doc:
-        return False, "Document not found."
-
-    # Get client data
-    client = db_rubrica.find_contact_by_id(doc['client_id'])
-    if not client:
-        return False, "Associated client not found."
-
-    # Get 'my company' details from settings
-    settings = db.load_settings()
     my_details_str = settings.get('my_company_details', "My Company\nMy Address")
-    
-    # Parse my_company_details for the template
-    # Assumes format: Name\nAddress\nP.IVA: 123
     try:
         my_details_parts = my_details_str.split('\n')
-        my_details_data = {
+        return {
             'name': my_details_parts[0],
             'address': "\n".join(my_details_parts[1:-1]),
             'vat_id': my_details_parts[-1].replace("P.IVA: ", "")
         }
     except IndexError:
         # Fallback if the format in settings is wrong
-        my_details_data = {
+        return {
             'name': 'Company Data Not Configured',
             'address': 'Please check settings',
             'vat_id': 'N/A'
         }
 
-    # Setup PDF path and filename
-    os.makedirs(PDF_EXPORT_DIR, exist_ok=True)
+def _pdf_path(doc):
+    """Returns the path the PDF of a document is exported to."""
     filename = f"{doc['number'].replace('/', '-')}_{doc['doc_type']}.pdf"
-    filepath = os.path.join(PDF_EXPORT_DIR, filename)
-    
+    return os.path.join(PDF_EXPORT_DIR, filename)
+
+# --- Exporting: Render Pipeline ---
+# What doesn't change between documents is prepared once per process
+# (so once per batch worker too) and reused:
+# - the template, compiled by Jinja, recompiled only if the file changes;
+# - its <style> blocks, parsed once into a WeasyPrint CSS object and taken
+#   out of the HTML, so WeasyPrint doesn't parse them for every document;
+# - the fonts resolved by WeasyPrint (a shared FontConfiguration);
+# - the assets the template refers to (logos, fonts), fetched once by
+#   _url_fetcher and then served from memory.
+_STYLE_BLOCK = re.compile(r'<style[^>]*>(.*?)</style>', re.S | re.I)
+_pipeline = None # (template file stamp, compiled template, [CSS])
+_font_config = FontConfiguration() if FontConfiguration is not None else None
+_asset_cache = {} # {(url, file mtime): fetched asset}
+
+def _cached_asset(url, fetch):
+    """
+    Returns the asset at url from _asset_cache, calling fetch(url) the
+    first time. Local files are fetched again when they change.
+    """
+    mtime = None
+    if url.startswith('file:'):
+        try:
+            mtime = os.stat(url2pathname(urlsplit(url).path)).st_mtime_ns
+        except OSError:
+            pass
+    key = (url, mtime)
+    asset = _asset_cache.get(key)
+    if asset is None:
+        asset = _asset_cache[key] = fetch(url)
+    return asset
+
+def _cached_url_fetcher(url, *args, **kwargs):
+    """
+    WeasyPrint url_fetcher serving each asset from memory after the
+    first fetch (WeasyPrint versions with url_fetcher functions).
+    """
+    def fetch(url):
+        asset = dict(default_url_fetcher(url, *args, **kwargs))
+        file_obj = asset.pop('file_obj', None)
+        if file_obj is not None:
+            with file_obj:
+                asset['string'] = file_obj.read()
+        return asset
+    return dict(_cached_asset(url, fetch))
+
+if URLFetcher is not None:
+    class _CachedURLFetcher(URLFetcher):
+        """
+        The same cache for WeasyPrint versions with URLFetcher objects,
+        which no longer accept plain url_fetcher functions.
+        """
+        def fetch(self, url, headers=None):
+            def fetch(url):
+                response = super(_CachedURLFetcher, self).fetch(url, headers)
+                try:
+                    return {'url': response.url, 'body': response.read(),
+                            'headers': response.headers, 'status': response.status}
+                finally:
+                    response.close()
+            return URLFetcherResponse(**_cached_asset(url, fetch))
+
+    _url_fetcher = _CachedURLFetcher()
+else:
+    _url_fetcher = _cached_url_fetcher
+
+def _render_pipeline():
+    """
+    Returns the compiled template and its parsed stylesheets, preparing
+    them again only if the template file changed.
+
+    Returns:
+        tuple: (jinja2.Template, list of weasyprint.CSS).
+    """
+    global _pipeline
+    stat_result = os.stat(TEMPLATE_FILE)
+    stamp = (stat_result.st_mtime_ns, stat_result.st_size)
+    if _pipeline is None or _pipeline[0] != stamp:
+        with open(TEMPLATE_FILE, encoding='utf-8') as f:
+            source = f.read()
+        css_blocks = _STYLE_BLOCK.findall(source)
+        stylesheets = []
+        # Styles using template variables must stay in the rendered HTML
+        if css_blocks and not any('{{' in css or '{%' in css for css in css_blocks):
+            source = _STYLE_BLOCK.sub('', source)
+            stylesheets.append(CSS(string='\n'.join(css_blocks), base_url=os.path.abspath('.'),
+                                   url_fetcher=_url_fetcher, **_font_options()))
+        _pipeline = (stamp, env.from_string(source), stylesheets)
+    return _pipeline[1], _pipeline[2]
+
+def _font_options():
+    """Returns the keyword arguments sharing the font configuration with WeasyPrint."""
+    return {'font_config': _font_config} if _font_config is not None else {}
+
+def _render_weasyprint(doc, client, my_details, filepath, part=None):
+    """
+    The 'weasyprint' PDF engine: renders the HTML template
+    (invoice_template.html) with WeasyPrint.
+    """
+    if HTML is None:
+        raise RuntimeError("WeasyPrint is not installed: choose the 'reportlab' PDF engine.")
+
+    # The compiled template and its parsed CSS (see Render Pipeline)
+    template, stylesheets = _render_pipeline()
+
+    # Render the template with all the data ('part' only for large documents)
+    html_out = template.render(
+        doc=doc,
+        client=client,
+        my_details=my_details,
+        **({'part': part} if part is not None else {})
+    )
+
+    # Use WeasyPrint to generate the PDF from the rendered HTML string
+    html = HTML(string=html_out, base_url=os.path.abspath('.'), url_fetcher=_url_fetcher)
+    html.write_pdf(filepath, stylesheets=stylesheets, **_font_options())
+
+# --- Exporting: ReportLab Engine ---
+# Draws the layout of invoice_template.html directly with ReportLab
+# Platypus: no HTML, no CSS and no GTK. Missing totals are shown as zero.
+# Sizes are the template's (1px = 0.75pt).
+_RL_MARGIN = 1.5 * cm
+_RL_TEXT = colors.HexColor('#333333')
+_RL_BORDER = colors.HexColor('#cccccc')
+_RL_SHADE = colors.HexColor('#f2f2f2')
+_RL_BASE = ParagraphStyle('base', fontName='Helvetica', fontSize=10, leading=12, textColor=_RL_TEXT)
+_RL_STYLES = {
+    'company': ParagraphStyle('company', _RL_BASE, fontSize=9, leading=12.6),
+    'client': ParagraphStyle('client', _RL_BASE, leading=15, alignment=TA_RIGHT),
+    'title': ParagraphStyle('title', _RL_BASE, fontName='Helvetica-Bold', fontSize=24, leading=29,
+                            textColor=colors.black),
+    'detail': ParagraphStyle('detail', _RL_BASE, fontSize=11, leading=13, spaceBefore=1.5, spaceAfter=1.5),
+    'cell': _RL_BASE,
+    'notes': ParagraphStyle('notes', _RL_BASE, fontSize=9, leading=12.6),
+}
+_RL_ITEMS_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.75, _RL_BORDER),
+    ('BACKGROUND', (0, 0), (-1, 0), _RL_SHADE),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), _RL_TEXT),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+_RL_TOTALS_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.75, _RL_BORDER),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), _RL_TEXT),
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 3.75),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3.75),
+    # The last row is the grand total
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 12),
+    ('BACKGROUND', (0, -1), (-1, -1), _RL_SHADE),
+])
+_RL_NO_PADDING = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ('TOPPADDING', (0, 0), (-1, -1), 0),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+])
+
+def _rl_text(value):
+    """Escapes a value for a ReportLab Paragraph, keeping its line breaks."""
+    return xml_escape(str(value if value is not None else '')).replace('\n', '<br/>')
+
+def _money_text(value):
+    """Formats an amount like the template does ("%.2f" €); missing amounts are zero."""
+    return "%.2f €" % (value or 0)
+
+def _reportlab_header(doc, client, my_details, width):
+    """Returns the flowables of the company/client header and the document title."""
+    company = (f"<font size=11 color='#000000'><b>{_rl_text(my_details.get('name'))}</b></font><br/>"
+               f"{_rl_text(my_details.get('address'))}<br/>"
+               f"P.IVA: {_rl_text(my_details.get('vat_id'))}")
+    client_lines = ["<b>Spett.le</b>", _rl_text(client.get('name'))]
+    if client.get('company'):
+        client_lines.append(_rl_text(client['company']))
+    client_lines += [_rl_text(client.get('address')), f"P.IVA/CF: {_rl_text(client.get('vat_id'))}"]
+    header = Table([[Paragraph(company, _RL_STYLES['company']),
+                     Paragraph('<br/>'.join(client_lines), _RL_STYLES['client'])]],
+                   colWidths=[width / 2, width / 2])
+    header.setStyle(_RL_NO_PADDING)
+
+    story = [header, Spacer(1, 22.5), Paragraph(_rl_text(doc['doc_type_display']), _RL_STYLES['title'])]
+    details = [("Numero", doc.get('number')), ("Data", doc.get('date'))]
+    if doc['doc_type'] == 'invoice':
+        details.append(("Scadenza", doc.get('due_date')))
+    for label, value in details:
+        story.append(Paragraph(f"{label}: <b>{_rl_text(value)}</b>", _RL_STYLES['detail']))
+    story.append(Spacer(1, 18.75))
+    return story
+
+def _reportlab_items_row(item):
+    """Returns the row of a line item in the items table."""
+    return [Paragraph(_rl_text(item.get('description')), _RL_STYLES['cell']), str(item.get('qty', '')),
+            _money_text(item.get('unit_price')), _money_text(item.get('total'))]
+
+def _reportlab_items(rows, width):
+    """Returns the items table (header repeated on each page) for some item rows."""
+    header = ["DESCRIZIONE", "Q.TÀ", "PREZZO UNIT.", "TOTALE"]
+    table = Table([header] + rows, colWidths=[width * 0.45, width * 0.10, width * 0.20, width * 0.25],
+                  repeatRows=1)
+    table.setStyle(_RL_ITEMS_STYLE)
+    return table
+
+def _reportlab_page(page, width):
+    """
+    Returns the items table of a page of a large document, with the
+    carried, page and running subtotals (see Large Documents).
+    """
+    rows = []
+    if page['number'] > 1:
+        rows.append(["Riporto", "", "", _money_text(page['carried'])])
+    rows += [_reportlab_items_row(item) for item in page['items']]
+    rows.append(["Totale pagina", "", "", _money_text(page['subtotal'])])
+    rows.append(["Subtotale progressivo", "", "", _money_text(page['running'])])
+    table = _reportlab_items(rows, width)
+
+    # Table rows: the header is row 0
+    subtotal_rows = ([1] if page['number'] > 1 else []) + [len(rows) - 1, len(rows)]
+    commands = []
+    for row in subtotal_rows:
+        commands += [
+            ('SPAN', (0, row), (2, row)),
+            ('FONTNAME', (0, row), (-1, row), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, row), (-1, row), _RL_SHADE),
+            ('ALIGN', (0, row), (-1, row), 'RIGHT'),
+        ]
+    table.setStyle(TableStyle(commands))
+    return table
+
+def _reportlab_totals(doc, width):
+    """Returns the flowables of the totals table and the footer notes."""
+    rows = [
+        ["Imponibile (Subtotale)", _money_text(doc.get('subtotal'))],
+        [f"Sconto ({doc.get('discount_perc', 0)} %)", "-" + _money_text(doc.get('discount_amount'))],
+        ["Imponibile Netto", _money_text(doc.get('taxable_amount'))],
+        [f"IVA ({doc.get('vat_perc', 0)} %)", "+" + _money_text(doc.get('vat_amount'))],
+        ["Totale Documento", _money_text(doc.get('total'))],
+    ]
+    if (doc.get('ritenuta_amount') or 0) > 0:
+        rows.append([f"Ritenuta ({doc.get('ritenuta_perc', 0)} %)", "-" + _money_text(doc.get('ritenuta_amount'))])
+        rows.append(["TOTALE DA PAGARE", _money_text(doc.get('total_da_pagare'))])
+    else:
+        # If no ritenuta, the grand total is the same as the document total
+        rows.append(["TOTALE DA PAGARE", _money_text(doc.get('total'))])
+    totals = Table(rows, colWidths=[width * 0.45 - 75, 75], hAlign='RIGHT')
+    totals.setStyle(_RL_TOTALS_STYLE)
+
+    return [
+        Spacer(1, 15), totals, Spacer(1, 22.5),
+        HRFlowable(width='100%', thickness=1.5, color=colors.HexColor('#555555'), spaceAfter=11.25),
+        Paragraph("<b>Note e Termini di Pagamento:</b>", _RL_STYLES['notes']),
+        Paragraph(_rl_text(doc.get('notes')), _RL_STYLES['notes']),
+    ]
+
+def _render_reportlab(doc, client, my_details, filepath, part=None):
+    """
+    The 'reportlab' PDF engine: draws the layout of the HTML template
+    with ReportLab (see ReportLab Engine).
+    """
+    width = A4[0] - 2 * _RL_MARGIN
+    pdf = SimpleDocTemplate(filepath, pagesize=A4, leftMargin=_RL_MARGIN, rightMargin=_RL_MARGIN,
+                            topMargin=_RL_MARGIN, bottomMargin=_RL_MARGIN, title=doc['doc_type_display'])
+    if part is None:
+        story = _reportlab_header(doc, client, my_details, width)
+        story.append(_reportlab_items([_reportlab_items_row(item) for item in doc.get('items', [])], width))
+        story += _reportlab_totals(doc, width)
+    else:
+        # A page group of a large document (see Large Documents)
+        story = _reportlab_header(doc, client, my_details, width) if part['first'] else []
+        for page in part['pages']:
+            story += [_reportlab_page(page, width), PageBreak()]
+        story.pop() # The totals follow the last page, or the part ends
+        if part['last']:
+            story += _reportlab_totals(doc, width)
+    pdf.build(story)
+
+# --- Exporting: PDF Engines ---
+# A PDF engine is a function engine(doc, client, my_details, filepath,
+# part=None) writing the PDF of a document, or of a page group of a large
+# document ('part', see Large Documents), and raising on failure. 'weasyprint'
+# renders the HTML template (highest fidelity, needs WeasyPrint and GTK);
+# 'reportlab' draws the same layout directly, with no GTK. The engine
+# is chosen in the settings ('pdf_engine'); other engines are added to
+# PDF_ENGINES.
+PDF_ENGINES = {
+    'weasyprint': _render_weasyprint,
+    'reportlab': _render_reportlab,
+}
+DEFAULT_PDF_ENGINE = 'weasyprint' if HTML is not None else 'reportlab'
+
+def _pdf_engine(settings):
+    """Returns the name of the PDF engine chosen in these settings."""
+    engine = settings.get('pdf_engine', DEFAULT_PDF_ENGINE)
+    return engine if engine in PDF_ENGINES else DEFAULT_PDF_ENGINE
+
+def get_pdf_engine():
+    """
+    Returns the PDF engine used to export documents, as configured in settings.
+
+    Returns:
+        str: A key of PDF_ENGINES ('weasyprint' or 'reportlab').
+    """
+    return _pdf_engine(db.load_settings())
+
+def set_pdf_engine(engine):
+    """
+    Saves the PDF engine choice in settings.
+
+    Args:
+        engine (str): A key of PDF_ENGINES ('weasyprint' or 'reportlab').
+
+    Raises:
+        ValueError: If the engine name is not valid.
+    """
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"Invalid PDF engine: {engine}")
+    settings = db.load_settings()
+    settings['pdf_engine'] = engine
+    db.save_settings(settings)
+
+def _render_pdf(doc, client, my_details, filepath, engine=DEFAULT_PDF_ENGINE):
+    """
+    Renders a document to a PDF file with a PDF engine (see PDF Engines).
+    Needs no access to the data files, so it can run in a worker process
+    (see export_batch_pdf).
+
+    Args:
+        doc (dict): The document.
+        client (dict): Its client.
+        my_details (dict): The company details (see _my_company_details).
+        filepath (str): The PDF file to write.
+        engine (str): The PDF engine, a key of PDF_ENGINES.
+
+    Returns:
+        tuple (bool, str): (True, "Path to PDF") on success,
+                           (False, "Error message") on failure.
+    """
     try:
-        # Load the HTML template file
-        template = env.get_template('invoice_template.html')
-        
         # Add a display-friendly type to the doc for the template
         doc['doc_type_display'] = "FATTURA" if doc['doc_type'] == 'invoice' else "PREVENTIVO"
-        
-        # Render the template with all the data
-        html_out = template.render(
-            doc=doc,
-            client=client,
-            my_details=my_details_data
-        )
-        
-        # Use WeasyPrint to generate the PDF from the rendered HTML string
-        HTML(string=html_out).write_pdf(filepath)
-        
+
+        render = PDF_ENGINES[engine]
+        if len(doc.get('items', [])) >= LARGE_DOCUMENT_ITEMS:
+            _render_large(render, doc, client, my_details, filepath)
+        else:
+            render(doc, client, my_details, filepath)
         return True, filepath
     
     except Exception as e:
         return False, f"Error generating PDF: {e}"
 
+# --- Exporting: Large Documents ---
+# Documents with thousands of line items (e.g., from detailed time logs or
+# inventory picking) are not laid out in one pass: a huge table is slow to
+# paginate, and the whole document would be in memory at once. From
+# LARGE_DOCUMENT_ITEMS line items, the items are split into pages of
+# ITEMS_PER_PAGE (ITEMS_FIRST_PAGE under the header), each with its own
+# table: the header row, the subtotal carried from the previous pages
+# ("Riporto"), the page total and the running subtotal. The pages are
+# rendered PAGES_PER_GROUP at a time, each group to a part file, and the
+# parts are joined into the PDF file with pypdf (see _concatenate_pdfs).
+# What is bounded is the layout: the engine lays out one group at a time,
+# whatever the number of lines. The line items themselves (doc['items'])
+# are all in memory, as loaded from the store, and so are the pages of the
+# parts while pypdf joins them (compact PDF objects, not layout trees).
+# Without pypdf, all the pages are rendered as one part, with a warning:
+# the layout then grows with the number of lines again.
+# A page with long (wrapped) descriptions can take more than one sheet.
+LARGE_DOCUMENT_ITEMS = 500
+ITEMS_FIRST_PAGE = 15
+ITEMS_PER_PAGE = 25
+PAGES_PER_GROUP = 20
+
+def _item_pages(items):
+    """
+    Splits the line items of a large document into pages.
+
+    Yields:
+        dict: {'number': page number (from 1), 'items': its line items,
+               'carried': subtotal of the previous pages, 'subtotal':
+               subtotal of the page, 'running': subtotal up to the page}.
+    """
+    running = money.Money()
+    start, size, number = 0, ITEMS_FIRST_PAGE, 1
+    while start < len(items):
+        page_items = items[start:start + size]
+        subtotal = money.total(item.get('total') or 0 for item in page_items)
+        yield {
+            'number': number,
+            'items': page_items,
+            'carried': running.to_decimal(),
+            'subtotal': subtotal.to_decimal(),
+            'running': (running + subtotal).to_decimal(),
+        }
+        running += subtotal
+        start, size, number = start + size, ITEMS_PER_PAGE, number + 1
+
+def _item_parts(items):
+    """
+    Groups the pages of a large document into the parts rendered one at a time.
+
+    Yields:
+        dict: {'pages': list of pages (see _item_pages), 'first': bool,
+               'last': bool}.
+    """
+    pages = _item_pages(items)
+    group = PAGES_PER_GROUP if PdfWriter is not None else None # None: all in one part
+    part = list(islice(pages, group))
+    first = True
+    while part:
+        next_part = list(islice(pages, group))
+        yield {'pages': part, 'first': first, 'last': not next_part}
+        part, first = next_part, False
+
+def _render_large(render, doc, client, my_details, filepath):
+    """
+    Renders a large document part by part with a PDF engine, and joins
+    the parts into the PDF file (see Large Documents).
+    """
+    if PdfWriter is None:
+        print(f"Warning: pypdf is not installed: the {len(doc['items'])} line items of "
+              f"{doc.get('number')} are rendered in one pass, in memory.")
+    part_paths = []
+    try:
+        for part in _item_parts(doc['items']):
+            part_path = f"{filepath}.part{len(part_paths)}"
+            part_paths.append(part_path)
+            render(doc, client, my_details, part_path, part=part)
+        if len(part_paths) == 1:
+            os.replace(part_paths[0], filepath)
+        else:
+            # Written aside, so a failure doesn't leave a truncated PDF
+            part_paths.append(filepath + '.tmp')
+            _concatenate_pdfs(part_paths[:-1], part_paths[-1])
+            os.replace(part_paths[-1], filepath)
+    finally:
+        for part_path in part_paths:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+
+def _concatenate_pdfs(paths, filepath):
+    """
+    Writes the pages of some PDF files, in order, to a single PDF file.
+
+    Args:
+        paths (list): The PDF files to join.
+        filepath (str): The PDF file to write.
+    """
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(filepath, 'wb') as f:
+        writer.write(f)
+
+def export_to_pdf(doc_id, force=False):
+    """
+    Generates a PDF representation of the document with the PDF engine
+    chosen in settings (see PDF Engines).
+    The PDF already exported is returned as is if nothing it depends on
+    changed since (see Render Cache).
+
+    Args:
+        doc_id (str): The 'id' of the document to export.
+        force (bool): Render the PDF again even if it's up to date.
+
+    Returns:
+        tuple (bool, str): (True, "Path to PDF") on success,
+                           (False, "Error message") on failure.
+    """
+    doc = find_document_by_id(doc_id)
+    if not doc:
+        return False, "Document not found."
+
+    # Get client data
+    client = db_rubrica.find_contact_by_id(doc['client_id'])
+    if not client:
+        return False, "Associated client not found."
+
+    # Get 'my company' details and the PDF engine from settings
+    settings = db.load_settings()
+    my_details_data = _my_company_details(settings)
+    engine = _pdf_engine(settings)
+
+    # Setup PDF path and filename
+    os.makedirs(PDF_EXPORT_DIR, exist_ok=True)
+    filepath = _pdf_path(doc)
+    digest = _render_digest(doc, client, my_details_data, _template_bytes(), engine)
+    if not force and _is_rendered(filepath, digest):
+        return True, filepath
+    success, msg = _render_pdf(doc, client, my_details_data, filepath, engine)
+    if success:
+        _record_render(filepath, digest)
+    return success, msg
+
+# --- Exporting: Render Cache ---
+# A PDF depends only on the document, its client, the company details, the
+# template and the PDF engine. After each export, a hash of all of them is
+# saved in PDF_CACHE_DIR (next to PDF_EXPORT_DIR), with the size and
+# modification time of the PDF written. Exporting again with the same
+# hash, while the PDF is still the one written, just returns it:
+# re-exporting an archive costs only the hashing. Any change to an input
+# (or to the PDF) renders it again. Bump RENDER_CACHE_VERSION when a
+# change to the rendering code changes the PDFs.
+PDF_CACHE_DIR = PDF_EXPORT_DIR + ".cache"
+RENDER_CACHE_VERSION = 2
+
+def _canonical(value):
+    """Returns a stable representation of a record (key order doesn't matter)."""
+    if isinstance(value, Mapping):
+        return {'__map__': sorted((str(key), _canonical(item)) for key, item in value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return repr(value)
+
+def _template_bytes():
+    """Returns the content of the template (empty if missing)."""
+    try:
+        with open(TEMPLATE_FILE, 'rb') as f:
+            return f.read()
+    except OSError:
+        return b''
+
+def _render_digest(doc, client, my_details, template_bytes, engine):
+    """
+    Hashes everything a PDF depends on.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    inputs = repr(_canonical([RENDER_CACHE_VERSION, engine, doc, client, my_details])).encode()
+    return hashlib.sha256(inputs + b'\0' + template_bytes).hexdigest()
+
+def _render_record_path(filepath):
+    """Returns the file recording the render of a PDF."""
+    return os.path.join(PDF_CACHE_DIR, os.path.basename(filepath) + '.sha256')
+
+def _is_rendered(filepath, digest):
+    """Returns True if a PDF on disk was rendered from inputs with this digest."""
+    try:
+        with open(_render_record_path(filepath)) as f:
+            recorded = f.read().split()
+        stat_result = os.stat(filepath)
+    except OSError:
+        return False
+    return recorded == [digest, str(stat_result.st_size), str(stat_result.st_mtime_ns)]
+
+def _record_render(filepath, digest):
+    """Records the digest of the inputs a PDF was just rendered from (best effort)."""
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        stat_result = os.stat(filepath)
+        record_path = _render_record_path(filepath)
+        with open(record_path + '.tmp', 'w') as f:
+            f.write(f"{digest} {stat_result.st_size} {stat_result.st_mtime_ns}\n")
+        os.replace(record_path + '.tmp', record_path)
+    except OSError as e:
+        print(f"Warning: could not record the PDF render of {filepath}. {e}")
+
+# --- Exporting: Batch PDF ---
+# Rendering a PDF takes about a second of CPU, so exporting many documents
+# (e.g., a year of invoices for the accountant) is spread over a pool of
+# worker processes, one per core. The documents, clients and company
+# details are loaded once, in this process: the clients and the company
+# details are sent to each worker once, when it starts, and each task
+# only carries its document. The workers never touch the data files.
+
+_worker_clients = {} # In a worker process: {client id: client}
+_worker_my_details = None
+_worker_engine = DEFAULT_PDF_ENGINE
+
+def _init_export_worker(clients, my_details, engine):
+    """Initializer of the export worker processes: keeps the shared data."""
+    global _worker_clients, _worker_my_details, _worker_engine
+    _worker_clients = clients
+    _worker_my_details = my_details
+    _worker_engine = engine
+
+def _export_worker(doc, filepath):
+    """Renders one document in a worker process (see _render_pdf)."""
+    return _render_pdf(doc, _worker_clients[doc['client_id']], _worker_my_details, filepath, _worker_engine)
+
+def _select_documents(doc_ids=None, doc_type=None, year=None, status=None, client_id=None):
+    """Returns the documents matching the export_batch_pdf() filters."""
+    if doc_ids is not None:
+        documents = [doc for doc in map(find_document_by_id, doc_ids) if doc is not None]
+        if doc_type:
+            documents = [doc for doc in documents if doc.get('doc_type') == doc_type]
+        if year is not None:
+            documents = [doc for doc in documents if str(doc.get('date', '')).startswith(str(year))]
+    else:
+        documents = get_all_documents(doc_type=doc_type, year=year)
+    if status:
+        documents = [doc for doc in documents if doc.get('status') == status]
+    if client_id:
+        documents = [doc for doc in documents if doc.get('client_id') == client_id]
+    return documents
+
+def export_batch_pdf(doc_ids=None, doc_type=None, year=None, status=None, client_id=None,
+                     max_workers=None, progress=None, force=False):
+    """
+    Exports many documents to PDF at once, rendering them in parallel
+    on a process pool. The files are the same export_to_pdf() writes,
+    and the PDFs already up to date are not rendered again.
+
+    Args:
+        doc_ids (list, optional): The 'id's of the documents to export.
+        doc_type (str, optional): Only 'quote' or 'invoice' documents.
+        year (int, optional): Only documents dated in this year.
+        status (str, optional): Only documents with this status.
+        client_id (str, optional): Only documents of this client.
+        max_workers (int, optional): Worker processes (default: one per core).
+                                     1 renders everything in this process.
+        progress (callable, optional): Called as progress(done, total)
+                                       after each document.
+        force (bool): Render all the PDFs again, even those up to date.
+
+    Returns:
+        tuple (list, list): (paths of the PDFs written,
+                             [(doc id, "Error message")] for the failures).
+    """
+    documents = _select_documents(doc_ids, doc_type, year, status, client_id)
+    settings = db.load_settings()
+    my_details = _my_company_details(settings)
+    engine = _pdf_engine(settings)
+    clients = {}
+    for contact_id in {doc['client_id'] for doc in documents}:
+        client = db_rubrica.find_contact_by_id(contact_id)
+        if client:
+            clients[contact_id] = client
+
+    exported, errors = [], []
+    template_bytes = _template_bytes()
+    total = len(documents)
+    done = 0
+
+    def collect(doc, result, digest=None):
+        nonlocal done
+        success, msg = result
+        if success:
+            exported.append(msg)
+            if digest is not None:
+                _record_render(msg, digest)
+        else:
+            errors.append((doc['id'], msg))
+        done += 1
+        if progress:
+            progress(done, total)
+
+    tasks = []
+    for doc in documents:
+        if doc['client_id'] not in clients:
+            collect(doc, (False, "Associated client not found."))
+            continue
+        filepath = _pdf_path(doc)
+        digest = _render_digest(doc, clients[doc['client_id']], my_details, template_bytes, engine)
+        if not force and _is_rendered(filepath, digest):
+            collect(doc, (True, filepath))
+        else:
+            tasks.append((doc, filepath, digest))
+    if not tasks:
+        return exported, errors
+    os.makedirs(PDF_EXPORT_DIR, exist_ok=True)
+
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        # Not worth starting processes
+        for doc, filepath, digest in tasks:
+            collect(doc, _render_pdf(doc, clients[doc['client_id']], my_details, filepath, engine), digest)
+        return exported, errors
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_export_worker,
+                             initargs=(clients, my_details, engine)) as pool:
+        futures = {pool.submit(_export_worker, doc, filepath): (doc, digest) for doc, filepath, digest in tasks}
+        for future in as_completed(futures):
+            doc, digest = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # E.g., a worker process killed by the system
+                result = (False, f"Error generating PDF: {e}")
+            collect(doc, result, digest)
+    return exported, errors
+
 # --- Analysis: Statistics ---
 
 def get_annual_stats(year):
@@ -450,20 +1140,9 @@ def get_annual_stats(year):
     except ValueError:
         return None, "Invalid year."
 
-    invoices = get_all_documents(doc_type='invoice')
-    
-    # Filter for paid invoices in the specified year
-    paid_invoices = []
-    for inv in invoices:
-        if inv['status'] != 'Pagato':
-            continue
-        try:
-            # Check if the invoice *date* is in the target year
-            invoice_year = datetime.strptime(inv['date'], '%Y-%m-%d').year
-            if invoice_year == year:
-                paid_invoices.append(inv)
-        except ValueError:
-            continue
+    # Paid invoices dated in the specified year (reads only that year)
+    invoices = get_all_documents(doc_type='invoice', year=year)
+    paid_invoices = [inv for inv in invoices if inv['status'] == 'Pagato']
             
     if not paid_invoices:
         return {'total_revenue': 0, 'top_clients': pd.DataFrame()}, "No paid invoices found for this year."
@@ -1,10 +1,72 @@
 import smtplib
 import os
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
+SMTP_TIMEOUT = 30 # Seconds to wait for the server before giving up
+
+def _build_message(sender, recipient_email, subject, body, attachment_path=None):
+    """
+    Builds the email message: a plain text body and, optionally, one attachment.
+
+    Returns:
+        MIMEMultipart: The message, ready to send.
+    """
+    # Create the email message object
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    
+    # Attach the body as plain text
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Attach the file (if provided and exists)
+    if attachment_path and os.path.exists(attachment_path):
+        filename = os.path.basename(attachment_path)
+        # Open the file in read-binary mode
+        with open(attachment_path, "rb") as attachment:
+            # Create the attachment part
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(attachment.read())
+        
+        # Encode file in base64 for email transport
+        encoders.encode_base64(part)
+        
+        # Add the necessary header
+        part.add_header(
+            'Content-Disposition',
+            f'attachment; filename= {filename}',
+        )
+        # Attach the part to the message
+        msg.attach(part)
+    return msg
+
+def _connect(smtp_config):
+    """
+    Opens an authenticated connection to the SMTP server.
+    STARTTLS is used unless smtp_config['starttls'] is False
+    (e.g., a local test server).
+
+    Returns:
+        smtplib.SMTP: The connected server.
+    """
+    # The port is expected to be an integer
+    smtp_port = int(smtp_config.get('port', 587))
+    server = smtplib.SMTP(smtp_config['host'], smtp_port, timeout=SMTP_TIMEOUT)
+    try:
+        if smtp_config.get('starttls', True):
+            server.starttls() # Secure the connection
+        server.login(smtp_config['user'], smtp_config['password'])
+    except Exception:
+        server.close()
+        raise
+    return server
+
 def send_email(recipient_email, subject, body, smtp_config, attachment_path=None):
     """
     Connects to an SMTP server and sends an email.
@@ -27,41 +89,10 @@ def send_email(recipient_email, subject, body, smtp_config, attachment_path=None
         return False, "SMTP configuration (host, user, password) incomplete."
 
     try:
-        # Create the email message object
-        msg = MIMEMultipart()
-        msg['From'] = smtp_config['user']
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        
-        # Attach the body as plain text
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attach the file (if provided and exists)
-        if attachment_path and os.path.exists(attachment_path):
-            filename = os.path.basename(attachment_path)
-            # Open the file in read-binary mode
-            with open(attachment_path, "rb") as attachment:
-                # Create the attachment part
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-            
-            # Encode file in base64 for email transport
-            encoders.encode_base64(part)
-            
-            # Add the necessary header
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename= {filename}',
-            )
-            # Attach the part to the message
-            msg.attach(part)
+        msg = _build_message(smtp_config['user'], recipient_email, subject, body, attachment_path)
         
         # Connect to the SMTP server
-        # The port is expected to be an integer
-        smtp_port = int(smtp_config.get('port', 587))
-        server = smtplib.SMTP(smtp_config['host'], smtp_port)
-        server.starttls() # Secure the connection
-        server.login(smtp_config['user'], smtp_config['password'])
+        server = _connect(smtp_config)
         text = msg.as_string()
         
         # Send the email
@@ -71,4 +102,117 @@ def send_email(recipient_email, subject, body, smtp_config, attachment_path=None
         return True, "Email sent successfully."
 
     except Exception as e:
-        return False, f"Failed to send email: {e}"
\ No newline at end of file
+        return False, f"Failed to send email: {e}"
+
+# --- Connection Reuse ---
+# Opening an SMTP connection (TCP, STARTTLS, login) costs far more than
+# sending a short email over it. Senders of many emails (e.g., the
+# notification scheduler) keep one connection per SMTP account open and
+# reuse it. The server may close an idle connection at any time: a
+# connection idle for a while is checked (NOOP) before use, and an email
+# failing because the connection was dropped is retried once on a new one.
+IDLE_CHECK_AFTER = 60.0 # Seconds of inactivity after which the connection is checked
+
+class SMTPConnection:
+    """
+    A connection to an SMTP server, opened on first use and kept open
+    across emails. Safe to share between threads.
+    """
+
+    def __init__(self, smtp_config):
+        """
+        Args:
+            smtp_config (dict): A dictionary containing 'host', 'port', 'user', 'password'.
+        """
+        self.smtp_config = dict(smtp_config)
+        self.connections_opened = 0
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _drop(self):
+        """Closes the current connection, ignoring errors (it may be dead already)."""
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+    def _server_ready(self):
+        """Returns the open connection, opening or replacing it if needed."""
+        if self._server is not None and time.monotonic() - self._last_used > IDLE_CHECK_AFTER:
+            try:
+                self._server.noop()
+            except Exception:
+                self._drop()
+        if self._server is None:
+            self._server = _connect(self.smtp_config)
+            self.connections_opened += 1
+        return self._server
+
+    def send(self, recipient_email, subject, body, attachment_path=None):
+        """
+        Sends an email over the connection (see send_email).
+
+        Returns:
+            tuple (bool, str): (True, "Email sent successfully.") on success,
+                               (False, "Failed to send email: [error]") on failure.
+        """
+        config = self.smtp_config
+        if not config.get('host') or not config.get('user') or not config.get('password'):
+            return False, "SMTP configuration (host, user, password) incomplete."
+
+        with self._lock:
+            try:
+                text = _build_message(config['user'], recipient_email, subject, body, attachment_path).as_string()
+                for attempt in (1, 2):
+                    try:
+                        self._server_ready().sendmail(config['user'], recipient_email, text)
+                        break
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        # Dropped by the server meanwhile: retry once on a new connection
+                        self._drop()
+                        if attempt == 2:
+                            raise
+                self._last_used = time.monotonic()
+                return True, "Email sent successfully."
+            except Exception as e:
+                self._drop()
+                return False, f"Failed to send email: {e}"
+
+    def close(self):
+        """Closes the connection (it is reopened if the object is used again)."""
+        with self._lock:
+            self._drop()
+
+# {(host, port, user, password, starttls): SMTPConnection}
+_connections = {}
+_connections_lock = threading.Lock()
+
+def get_connection(smtp_config):
+    """
+    Returns the shared connection for an SMTP account, creating it if needed.
+    Changing any of the settings gives a new connection.
+
+    Args:
+        smtp_config (dict): A dictionary containing 'host', 'port', 'user', 'password'.
+
+    Returns:
+        SMTPConnection: The connection.
+    """
+    key = (smtp_config.get('host'), str(smtp_config.get('port', 587)), smtp_config.get('user'),
+           smtp_config.get('password'), bool(smtp_config.get('starttls', True)))
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = _connections[key] = SMTPConnection(smtp_config)
+        return connection
+
+def close_connections():
+    """Closes all the shared SMTP connections (e.g., when the program exits)."""
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for connection in connections:
+        connection.close()
@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+# --- Change Feed ---
+# The persistence layer publishes every change to the stored records here,
+# right after applying it: inserts, updates and deletes made through
+# insert_record, update_record, delete_record, save_data and transactions,
+# i.e. by every create/update/delete function of the backend. Caches and
+# indexes derived from the data subscribe to the entities they depend on
+# and update themselves incrementally instead of rescanning everything.
+#
+# Callbacks run synchronously, in the order the changes were applied,
+# while the data is still locked: they must be quick. They may read the
+# data (and even write it: the resulting changes are published in turn).
+# An error in a callback is reported and doesn't affect the write.
+#
+# When the records of an entity change in a way that can't be described
+# record by record (another process changed the files, or the cache was
+# dropped), a single 'reload' change with no id is published instead:
+# subscribers should then rebuild what they derived from that entity.
+
+Change = namedtuple('Change', ['entity', 'id', 'operation', 'before', 'after'])
+Change.__doc__ = """
+A change to one stored record.
+
+Attributes:
+    entity (str): The data list (e.g., persistence.PROGETTI_DB).
+    id (str): The 'id' of the record (None for 'reload').
+    operation (str): 'insert', 'update', 'delete' or 'reload'.
+    before (dict): A copy of the record before the change (None for 'insert').
+    after (dict): A copy of the record after the change (None for 'delete').
+"""
+
+OPERATIONS = ('insert', 'update', 'delete', 'reload')
+
+# {entity (None for all): tuple of callbacks}. Replaced, never modified in
+# place, so publishing needs no lock.
+_subscribers = {}
+
+def subscribe(entity, callback):
+    """
+    Registers a callback for the changes of an entity.
+
+    Args:
+        entity (str): The data list (e.g., persistence.DOCUMENTI_DB),
+                      or None for the changes of every entity.
+        callback (callable): Called with each Change.
+
+    Returns:
+        callable: The callback.
+    """
+    _subscribers[entity] = _subscribers.get(entity, ()) + (callback,)
+    return callback
+
+def unsubscribe(entity, callback):
+    """
+    Removes a callback registered with subscribe(). Does nothing if missing.
+
+    Args:
+        entity (str): The entity it was registered for (or None).
+        callback (callable): The callback.
+    """
+    callbacks = tuple(cb for cb in _subscribers.get(entity, ()) if cb is not callback)
+    if callbacks:
+        _subscribers[entity] = callbacks
+    else:
+        _subscribers.pop(entity, None)
+
+def has_subscribers(entity):
+    """
+    Returns True if anyone listens to the changes of an entity, so the
+    publisher can skip building the changes (e.g., copies of the records).
+    """
+    return entity in _subscribers or None in _subscribers
+
+def publish(change):
+    """
+    Delivers a change to the subscribers of its entity, then to those of
+    every entity. A 'reload' with entity None goes to all subscribers.
+
+    Args:
+        change (Change): The change.
+    """
+    if change.entity is None:
+        # Each callback once, even if registered for several entities
+        callbacks = dict.fromkeys(cb for group in list(_subscribers.values()) for cb in group)
+    else:
+        callbacks = _subscribers.get(change.entity, ()) + _subscribers.get(None, ())
+    for callback in callbacks:
+        try:
+            callback(change)
+        except Exception as e:
+            # The change is already applied: a subscriber can't undo it
+            print(f"Warning: change subscriber {getattr(callback, '__name__', callback)} failed. {e}")
+
+def reload(entity=None):
+    """
+    Publishes a 'reload' change: the records of an entity (or of every
+    entity, if None) may have changed in any way.
+    """
+    publish(Change(entity, None, 'reload', None, None))
@@ -0,0 +1,82 @@
+import pickle
+import os
+
+from . import writes
+
+# --- In-Process Cache ---
+# Decoded content of plain pickle files (e.g., SETTINGS_FILE),
+# keyed by path: {path: (stamp, data)}. Data lists use journal.stores.
+# The stamp is (mtime_ns, size, inode) of the file the data was read from,
+# so a change made by anyone else (another process, a manual copy) is
+# detected with a single fstat instead of a full unpickle.
+# Guarded by locking.lock, like all the in-process state.
+cache = {}
+# In-process version counters, bumped every time a file's cached data changes.
+versions = {}
+
+def file_stamp(stat_result):
+    """
+    Builds the cache validation stamp from an os.stat() result.
+
+    Args:
+        stat_result (os.stat_result): The stat of the data file.
+
+    Returns:
+        tuple: (mtime_ns, size, inode).
+    """
+    return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+def bump_version(path):
+    """Marks the cached data of a file (or store) as changed."""
+    versions[path] = versions.get(path, 0) + 1
+
+def read_cached(path, default):
+    """
+    Returns the decoded content of a pickle file, served from the cache
+    when the file has not changed since it was last read or written.
+
+    The returned object is the *cached* one: callers must copy it before
+    handing it out.
+
+    Args:
+        path (str): The pickle file to read.
+        default: The value to return if the file is missing or corrupt.
+
+    Returns:
+        The cached (shared) decoded object, or `default`.
+    """
+    if path in writes.deferred_writes:
+        # Not written yet (see writes.flush)
+        return writes.deferred_writes[path]
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        cache.pop(path, None)
+        return default
+
+    with f:
+        stamp = file_stamp(os.fstat(f.fileno()))
+        cached = cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            data = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            # File is empty or corrupt
+            cache.pop(path, None)
+            return default
+
+    cache[path] = (stamp, data)
+    bump_version(path)
+    return data
+
+def store_cached(path, data):
+    """
+    Records freshly written data in the cache, stamped with the new file state.
+
+    Args:
+        path (str): The pickle file that was just written.
+        data: A private copy of the data that was written.
+    """
+    cache[path] = (file_stamp(os.stat(path)), data)
+    bump_version(path)
@@ -18,8 +18,6 @@ def create_articolo(data):
     Raises:
         ValueError: If 'nome' is missing or price/quantity are not valid numbers.
     """
-    articoli = db.load_data(db.MAGAZZINO_DB)
-    
     try:
         # Create the new item dictionary, ensuring types are correct
         new_articolo = {
@@ -36,8 +34,7 @@ def create_articolo(data):
     if not new_articolo['nome']:
         raise ValueError("Name is mandatory.")
 
-    articoli.append(new_articolo)
-    db.save_data(db.MAGAZZINO_DB, articoli)
+    db.insert_record(db.MAGAZZINO_DB, new_articolo)
     return new_articolo
 
 def get_all_articoli():
@@ -59,11 +56,7 @@ def find_articolo_by_id(articolo_id):
     Returns:
         dict: The item dictionary if found, else None.
     """
-    articoli = db.load_data(db.MAGAZZINO_DB)
-    for art in articoli:
-        if art.get('id') == articolo_id:
-            return art
-    return None
+    return db.find_record(db.MAGAZZINO_DB, articolo_id)
 
 def update_articolo(articolo_id, updated_data):
     """
@@ -79,35 +72,21 @@ def update_articolo(articolo_id, updated_data):
     Raises:
         ValueError: If price is not a valid number.
     """
-    articoli = db.load_data(db.MAGAZZINO_DB)
-    articolo_found = False
-    
+    # Update fields but explicitly exclude qta_in_stock
+    # Stock should only be changed via update_stock()
+    if 'qta_in_stock' in updated_data:
+        del updated_data['qta_in_stock']
+
     try:
-        for i, art in enumerate(articoli):
-            if art.get('id') == articolo_id:
-                # Update fields but explicitly exclude qta_in_stock
-                # Stock should only be changed via update_stock()
-                if 'qta_in_stock' in updated_data:
-                    del updated_data['qta_in_stock']
-                    
-                art.update(updated_data)
-                
-                # Ensure price is converted back to Decimal
-                if 'prezzo_acquisto' in updated_data:
-                    art['prezzo_acquisto'] = Decimal(str(updated_data['prezzo_acquisto']))
-                    
-                articoli[i] = art
-                articolo_found = True
-                break
-                
-        if articolo_found:
-            db.save_data(db.MAGAZZINO_DB, articoli)
-            return articoli[i]
-        return None
-        
+        # Ensure price is converted back to Decimal
+        if 'prezzo_acquisto' in updated_data:
+            updated_data['prezzo_acquisto'] = Decimal(str(updated_data['prezzo_acquisto']))
     except InvalidOperation as e:
          raise ValueError(f"Invalid price: {e}")
 
+    # None if the item is not found
+    return db.update_record(db.MAGAZZINO_DB, articolo_id, updated_data)
+
 def delete_articolo(articolo_id):
     """
     Removes an item from the database by its ID.
@@ -118,14 +97,7 @@ def delete_articolo(articolo_id):
     Returns:
         bool: True if deletion was successful, False otherwise.
     """
-    articoli = db.load_data(db.MAGAZZINO_DB)
-    # Rebuild the list excluding the item to delete
-    new_articoli = [art for art in articoli if art.get('id') != articolo_id]
-    
-    if len(new_articoli) < len(articoli):
-        db.save_data(db.MAGAZZINO_DB, new_articoli)
-        return True
-    return False
+    return db.delete_record(db.MAGAZZINO_DB, articolo_id)
 
 def search_articoli(query):
     """
@@ -150,7 +122,7 @@ def search_articoli(query):
 
 # --- Stock Management ---
 
-def update_stock(articolo_id, quantita_delta):
+def update_stock(articolo_id, quantita_delta, tx=None):
     """
     Adjusts the stock for an item by a delta (positive or negative).
     This is the only function that should modify 'qta_in_stock'.
@@ -159,33 +131,28 @@ def update_stock(articolo_id, quantita_delta):
         articolo_id (str): The 'id' of the item to adjust.
         quantita_delta (Decimal, float, or str): The amount to add (e.g., 10) or
                                                  subtract (e.g., -1.5).
+        tx (persistence.Transaction, optional): Transaction to make the change in.
 
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    articoli = db.load_data(db.MAGAZZINO_DB)
-    articolo_found = False
-    
     try:
         qta_delta = Decimal(str(quantita_delta))
     except InvalidOperation as e:
         return False, f"Invalid quantity: {e}"
 
-    for i, art in enumerate(articoli):
-        if art.get('id') == articolo_id:
-            current_stock = art.get('qta_in_stock', Decimal('0'))
-            new_stock = current_stock + qta_delta
-            
-            if new_stock < 0:
-                # Prevent negative stock
-                return False, f"Insufficient stock. Available: {current_stock}"
-                
-            art['qta_in_stock'] = new_stock
-            articoli[i] = art
-            articolo_found = True
-            break
-            
-    if articolo_found:
-        db.save_data(db.MAGAZZINO_DB, articoli)
-        return True, f"Stock updated. New quantity: {new_stock}"
-    return False, "Item not found."
\ No newline at end of file
+    # A transaction has the same record API as the persistence module
+    store = tx if tx is not None else db
+    art = store.find_record(db.MAGAZZINO_DB, articolo_id)
+    if not art:
+        return False, "Item not found."
+
+    current_stock = art.get('qta_in_stock', Decimal('0'))
+    new_stock = current_stock + qta_delta
+
+    if new_stock < 0:
+        # Prevent negative stock
+        return False, f"Insufficient stock. Available: {current_stock}"
+
+    store.update_record(db.MAGAZZINO_DB, articolo_id, {'qta_in_stock': new_stock})
+    return True, f"Stock updated. New quantity: {new_stock}"
\ No newline at end of file
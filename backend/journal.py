@@ -0,0 +1,374 @@
+import pickle
+import os
+
+from . import events
+from . import locking
+from . import file_cache
+from . import writes
+from . import partitions
+from . import migrations
+from . import transactions
+
+# --- Journaled Stores ---
+# Each data list (RUBRICA_DB, PROGETTI_DB, ...) is stored as a snapshot
+# (the .pkl file itself) plus an append-only journal next to it.
+# Single-record changes (insert/update/delete) are appended to the journal
+# as small pickled entries, so their cost doesn't depend on the size of the
+# database. On load, the journal is replayed on top of the snapshot.
+# When the journal grows past half the size of the data, it is compacted
+# into a new snapshot (amortized O(1) per write).
+# The snapshot also records the schema version of its data (see migrations.py).
+# All the functions below must be called holding locking.lock.
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_COMPACT_MIN_ENTRIES = 1000
+
+# Cached stores, keyed by db_name:
+# {'stamp': snapshot stamp, 'journal': (inode, bytes replayed) or None,
+#  'entries': journal entries replayed, 'data': list of records,
+#  'index': {id: position in 'data'}, built on first lookup}
+stores = {}
+
+def journal_path(db_name):
+    """Returns the journal filename for a data file (e.g., 'primanota.pkl.journal')."""
+    return db_name + JOURNAL_SUFFIX
+
+def dump_snapshot(data):
+    """Serializes the records of a store, tagged with the current schema version."""
+    return pickle.dumps({'schema': migrations.SCHEMA_VERSION, 'records': data})
+
+def _parse_snapshot(content):
+    """
+    Splits a loaded snapshot into its schema version and records.
+
+    Args:
+        content: The unpickled snapshot file.
+
+    Returns:
+        tuple (int, list): (schema version, records). Plain lists, written
+                           before schema versions existed, are version 0.
+    """
+    if isinstance(content, dict):
+        return content.get('schema', 0), content.get('records', [])
+    return 0, content
+
+def stat_or_none(path):
+    """Returns os.stat(path), or None if the file doesn't exist."""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+def stamp_or_none(path):
+    """Returns the stamp of a file (see file_cache.file_stamp), or None if it doesn't exist."""
+    stat_result = stat_or_none(path)
+    return file_cache.file_stamp(stat_result) if stat_result is not None else None
+
+def _read_snapshot(db_name):
+    """
+    Reads the snapshot of a store.
+
+    Returns:
+        tuple (int, list, tuple): (schema version, records, stamp of the file
+                                  read), or (0, [], None) if there is none.
+    """
+    try:
+        f = open(db_name, 'rb')
+    except FileNotFoundError:
+        return 0, [], None
+    with f:
+        stamp = file_cache.file_stamp(os.fstat(f.fileno()))
+        try:
+            version, data = _parse_snapshot(pickle.load(f))
+        except (EOFError, pickle.UnpicklingError):
+            # File is empty or corrupt, start from an empty list
+            version, data = 0, []
+    return version, data, stamp
+
+def _apply_journal_entry(records_by_id, entry):
+    """
+    Applies one journal entry to a dict of records keyed by ID.
+    Replay is idempotent: re-applying entries already contained in the
+    snapshot (e.g., after a crash during compaction) leaves the data unchanged.
+
+    Args:
+        records_by_id (dict): {id: record}, in list order.
+        entry (tuple): ('insert', record), ('update', id, fields) or ('delete', id).
+    """
+    op = entry[0]
+    if op == 'insert':
+        records_by_id[entry[1]['id']] = entry[1]
+    elif op == 'update':
+        record = records_by_id.get(entry[1])
+        if record is not None:
+            record.update(entry[2])
+    elif op == 'delete':
+        records_by_id.pop(entry[1], None)
+
+def _replay_journal(db_name, data, offset=0):
+    """
+    Replays the journal of a store on top of its data, starting at a byte offset.
+    A torn entry at the end of the file (crash during an append) is ignored,
+    and truncated away when holding the write lock.
+
+    Args:
+        db_name (str): The data file whose journal is replayed.
+        data (list): The records to apply the journal to.
+        offset (int): Where to start reading the journal.
+
+    Returns:
+        tuple (list, tuple, int): (new data, (inode, end offset), entries replayed),
+                                  or (data, None, 0) if there is no journal.
+    """
+    try:
+        f = open(journal_path(db_name), 'r+b')
+    except FileNotFoundError:
+        return data, None, 0
+
+    with f:
+        f.seek(offset)
+        entries = []
+        good_offset = offset
+        while True:
+            try:
+                entries.append(pickle.load(f))
+                good_offset = f.tell()
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                break
+        if good_offset != os.fstat(f.fileno()).st_size and locking.holds_write_lock():
+            # Drop the torn tail, so that new entries aren't appended after garbage.
+            # Without the lock it may be an append still in progress: leave it
+            f.truncate(good_offset)
+        inode = os.fstat(f.fileno()).st_ino
+
+    if entries:
+        records_by_id = {record.get('id'): record for record in data}
+        for entry in entries:
+            _apply_journal_entry(records_by_id, entry)
+        data = list(records_by_id.values())
+    return data, (inode, good_offset), len(entries)
+
+def load_store(db_name):
+    """
+    Returns the cached store for a data file, (re)loading it if needed.
+
+    The snapshot is revalidated by stat; if only the journal grew (another
+    process appended to it), just the new entries are replayed.
+    Needs no inter-process lock (see locking.read_lock).
+
+    Args:
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+
+    Returns:
+        dict: The cache entry. Its 'data' list is shared and must not be
+              handed out without copying.
+    """
+    transactions.ensure_recovered()
+    if db_name in writes.deferred_writes:
+        # Not written yet (see writes.flush): the pending data is authoritative
+        store = stores.get(db_name)
+        if store is None:
+            store = {'stamp': None, 'journal': None, 'entries': 0,
+                     'data': writes.deferred_writes[db_name], 'index': None}
+            stores[db_name] = store
+        return store
+    snapshot_stamp = stamp_or_none(db_name)
+    journal_stat = stat_or_none(journal_path(db_name))
+
+    store = stores.get(db_name)
+    if store is not None and store['stamp'] == snapshot_stamp:
+        journal = store['journal']
+        if journal_stat is None and journal is None:
+            return store
+        if journal_stat is not None and journal is not None and journal[0] == journal_stat.st_ino:
+            if journal_stat.st_size == journal[1]:
+                return store
+            if journal_stat.st_size > journal[1]:
+                # Someone else appended: replay only the new entries
+                data, new_journal, count = _replay_journal(db_name, store['data'], journal[1])
+                if new_journal is not None and new_journal[0] == journal[0]:
+                    store.update(data=data, journal=new_journal, entries=store['entries'] + count, index=None)
+                    file_cache.bump_version(db_name)
+                    events.reload(partitions.logical_db(db_name))
+                    return store
+                # Compacted by another process meanwhile: full reload
+
+    # A cached store is stale: someone else (another process) changed the files
+    stale = store is not None
+
+    # Full (re)load: snapshot + whole journal. A writer may replace the
+    # snapshot (and start a new journal) while we read: retry until the
+    # journal read belongs to the snapshot read
+    while True:
+        version, data, snapshot_stamp = _read_snapshot(db_name)
+        data, journal, count = _replay_journal(db_name, data)
+        if locking.holds_write_lock() or stamp_or_none(db_name) == snapshot_stamp:
+            break
+    store = {'stamp': snapshot_stamp, 'journal': journal, 'entries': count, 'data': data, 'index': None}
+    stores[db_name] = store
+    file_cache.bump_version(db_name)
+    if version < migrations.SCHEMA_VERSION and (snapshot_stamp is not None or journal is not None):
+        if not locking.holds_write_lock():
+            # Upgraded by one process only, from the latest data
+            with locking.file_lock():
+                stores.pop(db_name, None)
+                store = load_store(db_name)
+        else:
+            # Older data: upgraded once and written back
+            # (a legacy partitioned file is split right after, instead)
+            migrations.migrate(db_name, data, version)
+            if db_name not in partitions.PARTITIONED_DBS:
+                write_snapshot(db_name, data)
+                store = stores[db_name]
+    if stale:
+        events.reload(partitions.logical_db(db_name))
+    return store
+
+def write_snapshot(db_name, data):
+    """
+    Writes a full snapshot of a store and discards its journal.
+    Inside group_commit() or with the write-behind writer running,
+    the write is deferred to the next flush().
+
+    Args:
+        db_name (str): The data file to write.
+        data (list): The records to write. Kept as the new cached data,
+                     so it must be a private copy.
+    """
+    if writes.deferring():
+        writes.deferred_writes[db_name] = data
+        stores[db_name] = {'stamp': None, 'journal': None, 'entries': 0, 'data': data, 'index': None}
+        file_cache.bump_version(db_name)
+        writes.mark_dirty()
+        return
+
+    writes.atomic_write(db_name, dump_snapshot(data))
+    # The snapshot now contains every journaled change
+    if os.path.exists(journal_path(db_name)):
+        os.remove(journal_path(db_name))
+
+    stores[db_name] = {
+        'stamp': file_cache.file_stamp(os.stat(db_name)),
+        'journal': None,
+        'entries': 0,
+        'data': data,
+        'index': None
+    }
+    file_cache.bump_version(db_name)
+
+def append_journal(db_name, *entries):
+    """
+    Appends changes to a store's journal and applies them to the cache.
+    Compacts the journal into a new snapshot when it gets too long.
+
+    Args:
+        db_name (str): The data file to change.
+        *entries (tuple): The journal entries (see _apply_journal_entry).
+    """
+    store = load_store(db_name)
+    if store['stamp'] is None and db_name not in writes.deferred_writes:
+        # A new store starts with a snapshot, which records its schema version:
+        # a journal without a snapshot can only come from an older version
+        write_snapshot(db_name, store['data'])
+        store = stores[db_name]
+    if db_name in writes.deferred_writes:
+        # A full write of this store is pending: it will include the changes
+        for entry in entries:
+            _apply_to_store(store, entry)
+        file_cache.bump_version(db_name)
+        writes.mark_dirty()
+        return
+
+    # Serialize first, so the entries are appended with a single write
+    payload = b''.join(pickle.dumps(entry) for entry in entries)
+    with open(journal_path(db_name), 'ab') as f:
+        f.write(payload)
+        f.flush()
+        if writes.deferring():
+            # Synced once, by the next flush
+            writes.unsynced_journals.add(journal_path(db_name))
+            writes.mark_dirty()
+        else:
+            os.fsync(f.fileno())
+        journal_stat = os.fstat(f.fileno())
+
+    journal = store['journal']
+    expected_size = (journal[1] if journal else 0) + len(payload)
+    if journal_stat.st_size != expected_size:
+        # Another writer appended in the meantime: rebuild from disk
+        stores.pop(db_name, None)
+        store = load_store(db_name)
+        events.reload(partitions.logical_db(db_name))
+    else:
+        for entry in entries:
+            _apply_to_store(store, entry)
+        store.update(
+            journal=(journal_stat.st_ino, journal_stat.st_size),
+            entries=store['entries'] + len(entries)
+        )
+        file_cache.bump_version(db_name)
+
+    if store['entries'] > max(JOURNAL_COMPACT_MIN_ENTRIES, len(store['data']) // 2):
+        write_snapshot(db_name, store['data'])
+
+# --- Primary Key Index ---
+
+def _store_index(store):
+    """
+    Returns the {id: position} index of a cached store, building it if needed.
+    After that, the index is kept up to date by _apply_to_store.
+
+    Args:
+        store (dict): The cache entry (see load_store).
+
+    Returns:
+        dict: {record id: position in store['data']}.
+    """
+    if store['index'] is None:
+        store['index'] = {record.get('id'): i for i, record in enumerate(store['data'])}
+    return store['index']
+
+def _apply_to_store(store, entry):
+    """
+    Applies a journal entry to a cached store in place, using (and
+    maintaining) its primary key index: inserts and updates are O(1).
+    Deletes are O(n): the records keep their order (the order of the
+    lists and of the snapshot), so the records after the deleted one
+    move up and their positions in the index are updated.
+
+    Args:
+        store (dict): The cache entry (see load_store).
+        entry (tuple): The journal entry (see _apply_journal_entry).
+    """
+    data = store['data']
+    index = _store_index(store)
+    op = entry[0]
+    if op == 'insert':
+        record = entry[1]
+        position = index.get(record['id'])
+        if position is None:
+            index[record['id']] = len(data)
+            data.append(record)
+        else:
+            data[position] = record
+    elif op == 'update':
+        position = index.get(entry[1])
+        if position is not None:
+            data[position].update(entry[2])
+    elif op == 'delete':
+        position = index.pop(entry[1], None)
+        if position is not None:
+            del data[position]
+            # Shift the positions of the records that followed it
+            for i in range(position, len(data)):
+                index[data[i].get('id')] = i
+
+def find_cached_record(db_name, record_id):
+    """
+    Returns the cached (shared) record with the given ID, or None.
+    Constant time, thanks to the primary key index.
+    """
+    store = load_store(db_name)
+    position = _store_index(store).get(record_id)
+    return store['data'][position] if position is not None else None
@@ -1,5 +1,5 @@
 import uuid
-from datetime import datetime
+from datetime import date
 from decimal import Decimal, InvalidOperation
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -8,26 +8,9 @@ import os
 # Import centralized modules using relative imports
 from . import persistence as db
 from . import documents as db_docs
+from . import ledger_columns
 
-def _get_movimenti():
-    """
-    Helper to load all financial transactions from the database.
-    
-    Returns:
-        list: A list of all transaction dictionaries.
-    """
-    return db.load_data(db.PRIMANOTA_DB)
-
-def _save_movimenti(movimenti):
-    """
-    Helper to save all financial transactions to the database.
-    
-    Args:
-        movimenti (list): The complete list of transactions to save.
-    """
-    db.save_data(db.PRIMANOTA_DB, movimenti)
-
-def create_movimento(data):
+def create_movimento(data, tx=None):
     """
     Creates a new manual financial transaction (income or expense).
     
@@ -35,6 +18,7 @@ def create_movimento(data):
         data (dict): A dict containing: date, type ('Entrata'/'Uscita'), 
                      description, amount_netto, amount_iva, amount_ritenuta, 
                      amount_totale, notes.
+        tx (persistence.Transaction, optional): Transaction to make the change in.
 
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
@@ -58,15 +42,16 @@ def create_movimento(data):
     except Exception as e:
         return False, f"Error validating data: {e}"
 
-    movimenti = _get_movimenti()
-    movimenti.append(movimento)
-    _save_movimenti(movimenti)
+    # Appended to the ledger journal, without rewriting the whole ledger
+    store = tx if tx is not None else db
+    store.insert_record(db.PRIMANOTA_DB, movimento)
     return True, "Transaction recorded successfully."
 
 def create_movimento_from_invoice(invoice_id, payment_date):
     """
     Creates an 'Entrata' (income) transaction linked to an invoice.
     This function also updates the invoice status to 'Pagato'.
+    Both changes are committed together, or not at all.
 
     Args:
         invoice_id (str): The 'id' of the invoice being paid.
@@ -82,26 +67,33 @@ def create_movimento_from_invoice(invoice_id, payment_date):
     if invoice['status'] == 'Pagato':
         return False, "Invoice is already marked as paid."
         
-    # 2. Update invoice status to 'Pagato'
-    success, _ = db_docs.update_document_status(invoice_id, 'Pagato')
-    if not success:
-        return False, "Error updating invoice status."
-
-    # 3. Create the linked transaction
-    movimento_data = {
-        'date': payment_date,
-        'type': 'Entrata',
-        'description': f"Payment for Invoice N. {invoice['number']}",
-        'amount_netto': invoice['taxable_amount'],
-        'amount_iva': invoice['vat_amount'],
-        'amount_ritenuta': invoice.get('ritenuta_amount', Decimal('0')),
-        # The amount received is the 'total_da_pagare'
-        'amount_totale': invoice.get('total_da_pagare', invoice['total']), 
-        'linked_invoice_id': invoice_id,
-        'notes': f"Ref. Client ID: {invoice['client_id']}"
-    }
-    
-    return create_movimento(movimento_data)
+    with db.transaction() as tx:
+        # 2. Update invoice status to 'Pagato'
+        success, _ = db_docs.update_document_status(invoice_id, 'Pagato', tx=tx)
+        if not success:
+            tx.rollback()
+            return False, "Error updating invoice status."
+
+        # 3. Create the linked transaction
+        movimento_data = {
+            'date': payment_date,
+            'type': 'Entrata',
+            'description': f"Payment for Invoice N. {invoice['number']}",
+            'amount_netto': invoice['taxable_amount'],
+            'amount_iva': invoice['vat_amount'],
+            'amount_ritenuta': invoice.get('ritenuta_amount', Decimal('0')),
+            # The amount received is the 'total_da_pagare'
+            # (older invoices may only have the gross 'total')
+            'amount_totale': invoice.get('total_da_pagare', invoice.get('total')),
+            'linked_invoice_id': invoice_id,
+            'notes': f"Ref. Client ID: {invoice['client_id']}"
+        }
+        
+        success, msg = create_movimento(movimento_data, tx=tx)
+        if not success:
+            # Don't mark the invoice as paid without its movement
+            tx.rollback()
+        return success, msg
 
 def delete_movimento(movimento_id):
     """
@@ -114,17 +106,9 @@ def delete_movimento(movimento_id):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    movimenti = _get_movimenti()
-    movimento_found = None
-    new_movimenti = []
-    
-    # Find the movement and rebuild the list without it
-    for m in movimenti:
-        if m['id'] == movimento_id:
-            movimento_found = m
-        else:
-            new_movimenti.append(m)
-            
+    # Find the movement (needed to check its invoice link)
+    movimento_found = db.find_record(db.PRIMANOTA_DB, movimento_id)
+
     if not movimento_found:
         return False, "Transaction not found."
         
@@ -137,7 +121,7 @@ def delete_movimento(movimento_id):
         except Exception as e:
             print(f"Warning: could not reset invoice {linked_id}. {e}")
 
-    _save_movimenti(new_movimenti)
+    db.delete_record(db.PRIMANOTA_DB, movimento_id)
     return True, "Transaction deleted."
 
 def get_movimenti(start_date, end_date):
@@ -151,19 +135,8 @@ def get_movimenti(start_date, end_date):
     Returns:
         list: A sorted list of transaction dictionaries.
     """
-    movimenti = _get_movimenti()
-    results = []
-    
-    for m in movimenti:
-        try:
-            m_date = datetime.strptime(m['date'], '%Y-%m-%d').date()
-            if start_date <= m_date <= end_date:
-                results.append(m)
-        except ValueError:
-            continue
-            
-    # Sort by date before returning
-    return sorted(results, key=lambda x: x['date'])
+    # The date range and the sorting are handled by the storage backend
+    return db.query_data(db.PRIMANOTA_DB, date_from=start_date, date_to=end_date, order_by='date')
 
 def _get_dataframe(year):
     """
@@ -176,9 +149,10 @@ def _get_dataframe(year):
     Returns:
         tuple (pd.DataFrame, str): (DataFrame, "Status message").
     """
-    movimenti = _get_movimenti()
+    # Only the transactions of the year (reads just that year's partition)
+    movimenti = db.query_data(db.PRIMANOTA_DB, date_from=date(year, 1, 1), date_to=date(year, 12, 31))
     if not movimenti:
-        return pd.DataFrame(columns=['date']), "No transactions found."
+        return pd.DataFrame(columns=['date']), f"No transactions found for year {year}."
         
     df = pd.DataFrame(movimenti)
     
@@ -186,7 +160,7 @@ def _get_dataframe(year):
     df['date'] = pd.to_datetime(df['date'])
     for col in ['amount_netto', 'amount_iva', 'amount_ritenuta', 'amount_totale']:
         # Convert Decimal to float
-        df[col] = df[col].apply(lambda x: float(x))
+        df[col] = df[col].astype(float)
         
     # Filter by year
     df_year = df[df['date'].dt.year == year].copy()
@@ -206,19 +180,20 @@ def generate_monthly_stats(year):
     Returns:
         tuple (pd.DataFrame, str): (Stats DataFrame, "Status message").
     """
-    df, msg = _get_dataframe(year)
-    if df.empty:
-        return pd.DataFrame(), msg
-
-    # Resample by Month End ('ME') and sum the 'amount_totale'
-    entrate = df[df['type'] == 'Entrata']['amount_totale'].resample('ME').sum()
-    uscite = df[df['type'] == 'Uscita']['amount_totale'].resample('ME').sum()
-    
-    # Combine, rename, and clean
-    stats_df = pd.DataFrame({'Entrate': entrate, 'Uscite': uscite})
-    stats_df.index.name = 'Mese'
-    stats_df.index = stats_df.index.strftime('%Y-%m') # Format index as string
-    stats_df = stats_df.fillna(0) # Replace NaN with 0 for months with no activity
+    months = ledger_columns.active_months(year)
+    if not months:
+        return pd.DataFrame(), f"No transactions found for year {year}."
+
+    # Vectorized sums over the columnar ledger (exact, then float for plotting)
+    entrate = ledger_columns.monthly_sums(year, 'Entrata')
+    uscite = ledger_columns.monthly_sums(year, 'Uscita')
+    stats_df = pd.DataFrame(
+        {
+            'Entrate': [float(entrate[month - 1]) for month in months],
+            'Uscite': [float(uscite[month - 1]) for month in months],
+        },
+        index=pd.Index([f"{year}-{month:02d}" for month in months], name='Mese')
+    )
     
     # Add a total row
     stats_df.loc['TOTALE'] = stats_df.sum()
@@ -0,0 +1,192 @@
+from datetime import date
+from decimal import Decimal
+import os
+import numpy as np
+
+# Import centralized modules using relative imports
+from . import persistence as db
+from . import money
+
+# --- Columnar Ledger ---
+# Analytics (monthly stats, YTD sums, tax bases) only need a few numeric
+# fields of every movement. Instead of building a DataFrame of dicts and
+# converting each Decimal on every call, each year of the ledger is kept
+# as a set of NumPy columns:
+#   'date':  int32 date ordinals (the records' 'date_ord')
+#   'type':  int8 codes into 'types' (e.g., 'Entrata', 'Uscita')
+#   amounts: int64 fixed-point values, scaled by 10**'scales'[column]
+# Amounts are exact integers (cents, or finer if some value has more
+# decimals), so sums match the Decimal math to the last digit.
+# The columns are rebuilt only when the ledger changes, and saved next
+# to the year partition (e.g., 'primanota_2025.cols.npz') so closed years
+# load without unpickling their records.
+AMOUNT_COLUMNS = ('amount_netto', 'amount_iva', 'amount_ritenuta', 'amount_totale')
+COLUMNS_SUFFIX = '.cols.npz'
+
+# {year: ((ledger data version, partition stamp), columns)}
+_columns_cache = {}
+
+def _columns_path(year):
+    """Returns the file the columns of a year are saved to."""
+    root = os.path.splitext(db.PRIMANOTA_DB)[0]
+    return f"{root}_{year}{COLUMNS_SUFFIX}"
+
+def build_columns(movimenti):
+    """
+    Builds the columnar representation of a list of movements.
+
+    Args:
+        movimenti (list): Movement dictionaries with a valid 'date'.
+
+    Returns:
+        dict: {'date', 'type', 'types', 'scales', and one array per AMOUNT_COLUMNS}.
+    """
+    types = sorted({m.get('type') or '' for m in movimenti})
+    codes = {name: i for i, name in enumerate(types)}
+    columns = {
+        'date': np.array([m['date_ord'] for m in movimenti], dtype=np.int32),
+        'type': np.array([codes[m.get('type') or ''] for m in movimenti], dtype=np.int8),
+        'types': types,
+        'scales': {},
+    }
+    for col in AMOUNT_COLUMNS:
+        columns[col], columns['scales'][col] = money.to_array(m.get(col) for m in movimenti)
+    return columns
+
+def _load_saved_columns(year, stamp):
+    """
+    Loads the saved columns of a year, if they match the partition on disk.
+
+    Returns:
+        dict: The columns, or None if missing, stale or unreadable.
+    """
+    try:
+        with np.load(_columns_path(year)) as saved:
+            if tuple(saved['stamp'].tolist()) != stamp:
+                return None
+            columns = {
+                'date': saved['date'],
+                'type': saved['type'],
+                'types': saved['types'].tolist(),
+                'scales': dict(zip(AMOUNT_COLUMNS, saved['scales'].tolist())),
+            }
+            for col in AMOUNT_COLUMNS:
+                columns[col] = saved[col]
+            return columns
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _save_columns(year, stamp, columns):
+    """Saves the columns of a year next to its partition (best effort)."""
+    path = _columns_path(year)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                stamp=np.array(stamp, dtype=np.int64),
+                date=columns['date'],
+                type=columns['type'],
+                types=np.array(columns['types'], dtype=str),
+                scales=np.array([columns['scales'][col] for col in AMOUNT_COLUMNS], dtype=np.int64),
+                **{col: columns[col] for col in AMOUNT_COLUMNS}
+            )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Only a cache: the columns are rebuilt from the records next time
+        print(f"Warning: could not save ledger columns for {year}. {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_columns(year):
+    """
+    Returns the columnar representation of the movements of a year.
+
+    Args:
+        year (int): The year.
+
+    Returns:
+        dict: The columns (see build_columns). Shared: do not modify.
+    """
+    stamp = db.get_partition_stamp(db.PRIMANOTA_DB, year)
+    cached = _columns_cache.get(year)
+    # Versions and stamps only track the pickle backend: with SQLite, always rebuild
+    if (cached is not None and cached[0] == (db.get_data_version(db.PRIMANOTA_DB), stamp)
+            and db.get_storage_backend() == 'pickle'):
+        return cached[1]
+
+    columns = _load_saved_columns(year, stamp) if stamp is not None else None
+    if columns is None:
+        movimenti = db.query_data(db.PRIMANOTA_DB, date_from=date(year, 1, 1), date_to=date(year, 12, 31))
+        columns = build_columns(movimenti)
+        if stamp is not None and stamp == db.get_partition_stamp(db.PRIMANOTA_DB, year):
+            _save_columns(year, stamp, columns)
+
+    _columns_cache[year] = (
+        (db.get_data_version(db.PRIMANOTA_DB), db.get_partition_stamp(db.PRIMANOTA_DB, year)),
+        columns
+    )
+    return columns
+
+def _type_mask(columns, movement_type):
+    """Returns the boolean mask of the rows of one type."""
+    if movement_type not in columns['types']:
+        return np.zeros(len(columns['type']), dtype=bool)
+    return columns['type'] == columns['types'].index(movement_type)
+
+def sum_by_type(year, column='amount_totale'):
+    """
+    Sums an amount column by movement type.
+
+    Args:
+        year (int): The year.
+        column (str): One of AMOUNT_COLUMNS.
+
+    Returns:
+        dict: {type: Decimal total}, with 'Entrata' and 'Uscita' always present.
+    """
+    columns = get_columns(year)
+    totals = {'Entrata': Decimal('0'), 'Uscita': Decimal('0')}
+    for movement_type in columns['types']:
+        total = columns[column][_type_mask(columns, movement_type)].sum()
+        totals[movement_type] = money.Money(int(total), columns['scales'][column]).to_decimal()
+    return totals
+
+def monthly_sums(year, movement_type, column='amount_totale'):
+    """
+    Sums an amount column by month, for one movement type.
+
+    Args:
+        year (int): The year.
+        movement_type (str): E.g., 'Entrata' or 'Uscita'.
+        column (str): One of AMOUNT_COLUMNS.
+
+    Returns:
+        list: 12 Decimal totals, January first.
+    """
+    columns = get_columns(year)
+    mask = _type_mask(columns, movement_type)
+    # Ordinals -> calendar months, vectorized through datetime64
+    days = columns['date'][mask].astype(np.int64) - date(1970, 1, 1).toordinal()
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12
+    totals = np.zeros(12, dtype=np.int64)
+    np.add.at(totals, months, columns[column][mask])
+    scale = columns['scales'][column]
+    return [money.Money(int(total), scale).to_decimal() for total in totals]
+
+def active_months(year):
+    """
+    Returns the months (1-12) between the first and the last movement of a year.
+
+    Args:
+        year (int): The year.
+
+    Returns:
+        range: The months, empty if the year has no movements.
+    """
+    columns = get_columns(year)
+    if len(columns['date']) == 0:
+        return range(0)
+    first = date.fromordinal(int(columns['date'].min())).month
+    last = date.fromordinal(int(columns['date'].max())).month
+    return range(first, last + 1)
@@ -0,0 +1,154 @@
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# --- Lock Order ---
+# All the locks of the persistence layer are defined here. Whoever needs
+# several of them takes them in this order, and never the other way round:
+#
+#   numbering_lock -> commit_lock -> file lock -> flush_lock -> lock
+#
+# numbering_lock: document numbering, held from reading a sequence until
+#     its new value is on disk (to the end of a transaction, see numbering.py).
+# commit_lock: one transaction commit at a time (see transactions.py).
+# file lock: the inter-process lock on LOCK_FILE (see below).
+# flush_lock: one flush of the deferred writes at a time (see writes.py).
+# lock: all the in-process state (caches, stores, pending writes).
+#
+# lock and numbering_lock are reentrant, and so is the file lock (nested
+# holds are counted). flush_lock is never taken while holding lock.
+
+# Guards all the in-process state (caches, pending writes): with the
+# write-behind writer (see writes.start_write_behind), the public
+# functions run concurrently with a background flush.
+lock = threading.RLock()
+# Serializes flushes
+flush_lock = threading.Lock()
+# Serializes transaction commits
+commit_lock = threading.Lock()
+# Serializes document numbering
+numbering_lock = threading.RLock()
+
+def synchronized(func):
+    """Decorator: runs the function while holding the persistence lock."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+# --- Inter-Process Locking ---
+# Several processes may use the same data at once (e.g., the GUI and a
+# scheduled notification job). Writers hold an exclusive lock on LOCK_FILE
+# for their whole read-modify-write, so their changes are serialized and
+# each one starts from the latest data on disk. Readers take no lock:
+# snapshots are immutable once renamed into place and journals are
+# append-only, so a reader always rebuilds a consistent state (see
+# journal.load_store) and long reports never wait for, or delay, a writer.
+# read_lock() takes a shared lock, for the few reads that must see several
+# stores at the same point in time; write_lock() keeps the exclusive lock
+# across several calls (e.g., load_data() then save_data()).
+# While writes are deferred (group_commit, write-behind) the exclusive
+# lock is kept until they are flushed, so no other process can write over
+# changes this process has already accepted.
+# Without fcntl (Windows), only the in-process locking applies.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_FILE = 'gestionale.lock'
+_file_lock_guard = threading.Lock() # Guards the file lock state below
+_file_lock_fd = None
+_file_lock_depth = 0 # Nested holds, by any thread of this process
+_file_lock_exclusive = False
+_file_lock_pinned = False # Held until the deferred writes are flushed
+
+def acquire_file_lock(exclusive):
+    """
+    Takes (or re-enters) the inter-process lock, blocking while another
+    process holds a conflicting one. The lock belongs to the process:
+    the threads of this process are serialized by lock instead.
+
+    Args:
+        exclusive (bool): True for writers, False for a shared read lock.
+    """
+    global _file_lock_fd, _file_lock_depth, _file_lock_exclusive
+    with _file_lock_guard:
+        if _file_lock_depth == 0 or (exclusive and not _file_lock_exclusive):
+            if fcntl is not None:
+                if _file_lock_fd is None:
+                    _file_lock_fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+                # Upgrading shared -> exclusive is not atomic, which is fine:
+                # writers only read their data once they hold the lock
+                fcntl.flock(_file_lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            _file_lock_exclusive = exclusive
+        _file_lock_depth += 1
+
+def release_file_lock():
+    """Leaves the inter-process lock, releasing it with the last hold."""
+    global _file_lock_fd, _file_lock_depth, _file_lock_exclusive
+    with _file_lock_guard:
+        _file_lock_depth -= 1
+        if _file_lock_depth == 0:
+            if _file_lock_fd is not None:
+                os.close(_file_lock_fd) # Also releases the flock
+                _file_lock_fd = None
+            _file_lock_exclusive = False
+
+def holds_write_lock():
+    """Returns True if this process holds the exclusive lock (no other process is writing)."""
+    return _file_lock_depth > 0 and _file_lock_exclusive
+
+@contextmanager
+def file_lock(exclusive=True):
+    """Holds the inter-process lock for the duration of the block."""
+    acquire_file_lock(exclusive)
+    try:
+        yield
+    finally:
+        release_file_lock()
+
+def exclusive(func):
+    """Decorator: like synchronized, also holding the inter-process write lock."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with file_lock(), lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def read_lock():
+    """
+    Holds a shared inter-process lock: other processes can't write
+    during the block, so several reads see the same state of the data.
+    Plain reads don't need it. Writes made by this process inside the
+    block upgrade it to exclusive.
+    """
+    with file_lock(exclusive=False):
+        yield
+
+@contextmanager
+def write_lock():
+    """
+    Holds the exclusive inter-process lock for a read-modify-write spanning
+    several calls (e.g., load_data() then save_data()): no other process
+    can change the data in between. Single calls don't need it.
+    """
+    with file_lock():
+        yield
+
+def pin_file_lock():
+    """Keeps the exclusive lock until the next complete flush."""
+    global _file_lock_pinned
+    if not _file_lock_pinned:
+        acquire_file_lock(True)
+        _file_lock_pinned = True
+
+def unpin_file_lock():
+    """Releases the hold taken by pin_file_lock, if any."""
+    global _file_lock_pinned
+    if _file_lock_pinned:
+        _file_lock_pinned = False
+        release_file_lock()
@@ -0,0 +1,118 @@
+import os
+from datetime import datetime
+
+from . import partitions
+from . import numbering
+from . import settings as app_settings
+from . import record_format
+from .data_files import DOCUMENTI_DB, PROGETTI_DB, SETTINGS_FILE, SEQUENCES_FILE
+
+# --- Schema Migrations ---
+# Every store records the schema version of its data: in the snapshot
+# (pickle), in the 'schema_versions' table (SQLite) or in the
+# 'schema_version' key (settings). Data older than SCHEMA_VERSION is
+# upgraded once, when it is loaded, by running the registered migrations
+# in order, and then written back. So the rest of the code can rely on the
+# current shape of the records, without per-row compatibility checks.
+# To change the shape of stored data, register a migration with the next
+# version number. Migrations must be idempotent: a store created empty by
+# an older version (e.g., a new SQLite table) may be migrated again.
+_migrations = [] # [(version, db_names or None for all data lists, function)]
+
+def migration(version, *db_names):
+    """
+    Decorator: registers a function upgrading records to a schema version.
+    The function gets the list of records and changes them in place.
+
+    Args:
+        version (int): The schema version the migration upgrades to.
+        *db_names (str): The stores it applies to (e.g., PROGETTI_DB), or
+                         SETTINGS_FILE (the records are then [settings]).
+                         None given means every data list (not the settings).
+    """
+    def register(func):
+        _migrations.append((version, db_names or None, func))
+        _migrations.sort(key=lambda m: m[0])
+        return func
+    return register
+
+def migrate(name, records, version):
+    """
+    Upgrades records from a schema version to SCHEMA_VERSION, in place.
+
+    Args:
+        name (str): The store (a data list, a partition or SETTINGS_FILE).
+        records (list): The records to upgrade.
+        version (int): Their current schema version.
+    """
+    db_name = partitions.logical_db(name)
+    for target, db_names, func in _migrations:
+        if target <= version:
+            continue
+        if (db_names is None and db_name != SETTINGS_FILE) or (db_names is not None and db_name in db_names):
+            func(records)
+
+@migration(1)
+def _migrate_date_ordinals(records):
+    """Adds the date ordinals (see record_format.DATE_ORDINAL_FIELDS)."""
+    for record in records:
+        record_format.add_date_ordinals(record)
+
+@migration(2, PROGETTI_DB)
+def _migrate_billable_flag(records):
+    """Activities logged before the 'fatturabile' flag existed are billable."""
+    for project in records:
+        for attivita in project.get('attivita', []):
+            attivita.setdefault('fatturabile', True)
+
+@migration(3, DOCUMENTI_DB)
+def _migrate_item_link(records):
+    """Renames the legacy 'linked_item_id' of line items to 'articolo_id'."""
+    for document in records:
+        for item in document.get('items', []):
+            if 'linked_item_id' in item:
+                legacy_id = item.pop('linked_item_id')
+                if not item.get('articolo_id'):
+                    item['articolo_id'] = legacy_id
+
+@migration(4, SETTINGS_FILE)
+def _migrate_settings_defaults(records):
+    """Adds the settings (and sub-settings) missing from older installs."""
+    for settings in records:
+        for key, value in app_settings.default_settings().items():
+            if key not in settings:
+                settings[key] = value
+            elif isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    settings[key].setdefault(sub_key, sub_value)
+
+@migration(6, SETTINGS_FILE)
+def _migrate_document_sequences(records):
+    """
+    Moves the document counters from the settings to SEQUENCES_FILE
+    (written here, unless it already exists).
+    """
+    for settings in records:
+        sequences = {}
+        for doc_type, key, prefix_key in (('invoice', 'last_invoice_num', 'invoice_prefix'),
+                                          ('quote', 'last_quote_num', 'quote_prefix')):
+            if key in settings or prefix_key in settings:
+                default_prefix = f"{numbering.DOCUMENT_NUMBER_PREFIXES[doc_type]}{datetime.now().year}/"
+                sequences[doc_type] = {
+                    'prefix': settings.pop(prefix_key, default_prefix),
+                    'last': settings.pop(key, 0)
+                }
+        if sequences and not os.path.exists(SEQUENCES_FILE):
+            numbering.save_sequences(sequences)
+
+def _compact_migration(db_name):
+    """Registers the migration converting the records of a data list to their compact classes."""
+    @migration(5, db_name)
+    def _migrate_compact_records(records):
+        records[:] = [record_format.to_compact(db_name, record) for record in records]
+    return _migrate_compact_records
+
+for _db_name in record_format.COMPACT_RECORDS:
+    _compact_migration(_db_name)
+
+SCHEMA_VERSION = _migrations[-1][0]
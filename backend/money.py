@@ -0,0 +1,256 @@
+from decimal import Decimal, InvalidOperation
+from functools import total_ordering
+import numpy as np
+
+# --- Money ---
+# Amounts are exact fixed-point integers: a number of units of 10**-scale
+# euros, with scale 2 (integer cents) for every rounded amount. Products
+# that are not whole cents (e.g., 1.5 x 45.33 = 67.995) keep a finer scale,
+# exactly like the Decimal math they replace, so results are bit-identical.
+# Rounding (percent, rounded) is ROUND_HALF_UP to the cent, as in
+# Decimal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).
+# Records keep storing Decimal: Money is used for the arithmetic and
+# converted back with to_decimal() at the boundary.
+CENTS = 2 # The scale of a rounded amount
+
+def _fixed(value):
+    """
+    Splits a number into an exact (integer, exponent) pair.
+
+    Args:
+        value (Money, Decimal, int, str or float): The number.
+
+    Returns:
+        tuple (int, int): (units, exponent), with value == units * 10**exponent.
+
+    Raises:
+        InvalidOperation: If the value is not a finite number.
+    """
+    if isinstance(value, Money):
+        return value.units, -value.scale
+    if isinstance(value, int):
+        return value, 0
+    if not isinstance(value, Decimal):
+        # Same parsing as Decimal(str(value)), for floats and strings
+        value = Decimal(str(value))
+    if not value.is_finite():
+        raise InvalidOperation(f"Not a finite amount: {value}")
+    exponent = value.as_tuple().exponent
+    return int(value.scaleb(-exponent)), exponent
+
+def _round_half_up(numerator, denominator):
+    """Integer division rounded half away from zero (ROUND_HALF_UP)."""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if 2 * remainder >= denominator:
+        quotient += 1
+    return quotient if numerator >= 0 else -quotient
+
+@total_ordering
+class Money:
+    """
+    An exact amount of money, stored as an integer number of cents
+    (or of a finer unit, see the module comment). Immutable.
+
+    Attributes:
+        units (int): The amount in units of 10**-scale.
+        scale (int): The number of decimals (2 for cents).
+    """
+    __slots__ = ('units', 'scale')
+
+    def __init__(self, units=0, scale=CENTS):
+        # Normalized: at least cents, no trailing zeros below the cent
+        if scale < CENTS:
+            units *= 10 ** (CENTS - scale)
+            scale = CENTS
+        while scale > CENTS and units % 10 == 0:
+            units //= 10
+            scale -= 1
+        object.__setattr__(self, 'units', units)
+        object.__setattr__(self, 'scale', scale)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable.")
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Converts a Decimal, int, str or float amount to Money, exactly.
+
+        Args:
+            value: The amount (None counts as zero).
+
+        Returns:
+            Money: The amount.
+
+        Raises:
+            InvalidOperation: If the value is not a valid number.
+        """
+        if isinstance(value, Money):
+            return value
+        if value is None:
+            return ZERO
+        units, exponent = _fixed(value)
+        return cls(units, -exponent)
+
+    def to_decimal(self):
+        """Returns the amount as a Decimal (e.g., Decimal('39.60'))."""
+        return Decimal(self.units).scaleb(-self.scale)
+
+    def _aligned(self, other):
+        """Returns (self units, other units, common scale)."""
+        other = Money.parse(other)
+        scale = max(self.scale, other.scale)
+        return (self.units * 10 ** (scale - self.scale),
+                other.units * 10 ** (scale - other.scale), scale)
+
+    # --- Arithmetic ---
+
+    def __add__(self, other):
+        if not isinstance(other, (Money, Decimal, int)):
+            return NotImplemented
+        a, b, scale = self._aligned(other)
+        return Money(a + b, scale)
+
+    __radd__ = __add__ # Also makes sum() work
+
+    def __sub__(self, other):
+        if not isinstance(other, (Money, Decimal, int)):
+            return NotImplemented
+        a, b, scale = self._aligned(other)
+        return Money(a - b, scale)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __neg__(self):
+        return Money(-self.units, self.scale)
+
+    def __mul__(self, factor):
+        """Exact product by a quantity (e.g., qty x unit price). Not rounded."""
+        if isinstance(factor, Money) or not isinstance(factor, (Decimal, int, str, float)):
+            return NotImplemented
+        units, exponent = _fixed(factor)
+        return Money(self.units * units, self.scale - exponent)
+
+    __rmul__ = __mul__
+
+    def percent(self, perc):
+        """
+        Returns perc% of the amount, rounded half up to the cent.
+
+        Args:
+            perc (Decimal, int or str): The percentage (e.g., Decimal('22')).
+
+        Returns:
+            Money: The rounded amount.
+        """
+        units, exponent = _fixed(perc)
+        # In cents: self * perc / 100 * 100
+        shift = exponent - self.scale
+        if shift >= 0:
+            return Money(self.units * units * 10 ** shift)
+        return Money(_round_half_up(self.units * units, 10 ** -shift))
+
+    def rounded(self):
+        """Returns the amount rounded half up to the cent."""
+        if self.scale == CENTS:
+            return self
+        return Money(_round_half_up(self.units, 10 ** (self.scale - CENTS)))
+
+    # --- Comparison and Conversion ---
+
+    def __eq__(self, other):
+        if not isinstance(other, (Money, Decimal, int)):
+            return NotImplemented
+        a, b, _ = self._aligned(other)
+        return a == b
+
+    def __lt__(self, other):
+        if not isinstance(other, (Money, Decimal, int)):
+            return NotImplemented
+        a, b, _ = self._aligned(other)
+        return a < b
+
+    def __hash__(self):
+        # Equal to the hash of the equal Decimal
+        return hash(self.to_decimal())
+
+    def __bool__(self):
+        return self.units != 0
+
+    def __float__(self):
+        return float(self.to_decimal())
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec)
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __reduce__(self):
+        return (Money, (self.units, self.scale))
+
+ZERO = Money(0)
+
+# --- Batch Operations ---
+# Columns of amounts as NumPy int64 arrays sharing one scale, so sums and
+# percentages over many records are single vectorized operations.
+
+def to_array(values):
+    """
+    Converts amounts to an int64 array with a common scale.
+
+    Args:
+        values (iterable): Decimal/Money/str amounts (None counts as zero).
+
+    Returns:
+        tuple (np.ndarray, int): (units, scale), each amount being units / 10**scale.
+
+    Raises:
+        InvalidOperation: If a value is not a valid number.
+    """
+    amounts = [Money.parse(value) for value in values]
+    scale = max([CENTS] + [amount.scale for amount in amounts])
+    units = [amount.units * 10 ** (scale - amount.scale) for amount in amounts]
+    return np.array(units, dtype=np.int64), scale
+
+def array_total(units, scale):
+    """Returns the exact sum of an array of amounts (see to_array) as Money."""
+    return Money(int(units.sum()), scale)
+
+def array_percent(units, scale, perc):
+    """
+    Vectorized Money.percent: perc% of each amount, rounded half up to the cent.
+
+    Args:
+        units (np.ndarray): The amounts (see to_array).
+        scale (int): Their scale.
+        perc (Decimal, int or str): The percentage.
+
+    Returns:
+        np.ndarray: The rounded amounts, in cents (int64).
+    """
+    perc_units, exponent = _fixed(perc)
+    shift = exponent - scale
+    products = units * perc_units
+    if shift >= 0:
+        return products * 10 ** shift
+    denominator = 10 ** -shift
+    quotient, remainder = np.divmod(np.abs(products), denominator)
+    quotient += (2 * remainder >= denominator)
+    return np.where(products < 0, -quotient, quotient)
+
+def total(values):
+    """
+    Exact sum of many amounts.
+
+    Args:
+        values (iterable): Decimal/Money/str amounts (None counts as zero).
+
+    Returns:
+        Money: The sum.
+    """
+    return array_total(*to_array(values))
@@ -0,0 +1,110 @@
+import pickle
+from datetime import datetime
+
+from . import locking
+from . import file_cache
+from . import writes
+from . import settings as app_settings
+from .record_format import copy_record
+from .data_files import SEQUENCES_FILE
+
+# --- Document Numbering ---
+# Document numbers come from a dedicated sequence store (SEQUENCES_FILE):
+# {doc_type: {'prefix': 'F2025/', 'last': 41}}. It is tiny, so taking a
+# number is one small durable write instead of a rewrite of the settings,
+# and a batch reserves a whole block of numbers with a single write.
+# The numbering stays locked (locking.numbering_lock, in this process, and
+# the file lock, across processes) from reading a sequence until its new
+# value is on disk, so a number is never handed out twice. Inside a
+# transaction it stays locked until the transaction ends, so a rolled back
+# transaction leaves no gap.
+DOCUMENT_NUMBER_PREFIXES = {'invoice': 'F', 'quote': 'P'}
+
+def load_sequences():
+    """
+    Returns the document number sequences.
+
+    Returns:
+        dict: The cached (shared) sequences, {doc_type: {'prefix', 'last'}}.
+    """
+    sequences = file_cache.read_cached(SEQUENCES_FILE, None)
+    if sequences is None:
+        # Older installs kept the counters in the settings (see migration 6)
+        app_settings.load_settings()
+        sequences = file_cache.read_cached(SEQUENCES_FILE, {})
+    return sequences
+
+def save_sequences(sequences):
+    """
+    Writes the document number sequences. Never deferred: a number
+    handed out must be durable, or it could be handed out again.
+
+    Args:
+        sequences (dict): A private copy of the sequences.
+    """
+    writes.atomic_write(SEQUENCES_FILE, pickle.dumps(sequences))
+    file_cache.store_cached(SEQUENCES_FILE, sequences)
+
+def reserve_numbers(sequences, doc_type, count):
+    """
+    Reserves the next numbers of a document type in a sequences dictionary.
+    Handles the automatic year change reset (e.g., F2024/999 -> F2025/001).
+
+    Args:
+        sequences (dict): The sequences (modified in place).
+        doc_type (str): 'invoice' or 'quote'.
+        count (int): How many consecutive numbers to reserve.
+
+    Returns:
+        list: The formatted document numbers (e.g., ["F2025/001", "F2025/002"]).
+    """
+    if doc_type != 'invoice':
+        doc_type = 'quote'
+    current_year = datetime.now().year
+    default_prefix = f"{DOCUMENT_NUMBER_PREFIXES[doc_type]}{current_year}/"
+    sequence = sequences.setdefault(doc_type, {'prefix': default_prefix, 'last': 0})
+
+    # Check if the year has changed since the last number was issued
+    if str(current_year) not in sequence['prefix']:
+        # Reset counter and update prefix to the new year
+        sequence['prefix'] = default_prefix
+        sequence['last'] = 0
+
+    first = sequence['last'] + 1
+    sequence['last'] += count
+    return [f"{sequence['prefix']}{str(number).zfill(3)}" for number in range(first, first + count)]
+
+def reserve_document_numbers(doc_type="invoice", count=1):
+    """
+    Atomically reserves a block of consecutive document numbers, with a
+    single durable write (e.g., for generating many invoices at once).
+
+    Args:
+        doc_type (str): 'invoice' or 'quote'.
+        count (int): How many numbers to reserve.
+
+    Returns:
+        list: The formatted document numbers, in order (e.g., ["F2025/042", ...]).
+    """
+    with locking.numbering_lock, locking.file_lock():
+        with locking.lock:
+            sequences = copy_record(load_sequences())
+            numbers = reserve_numbers(sequences, doc_type, count)
+            save_sequences(sequences)
+    return numbers
+
+def get_next_document_number(doc_type="invoice"):
+    """
+    Atomically retrieves, increments, and saves the next sequential
+    document number for invoices or quotes.
+
+    This function also handles automatic year change reset.
+    (e.g., F2024/999 -> F2025/001).
+
+    Args:
+        doc_type (str): 'invoice' or 'quote'.
+
+    Returns:
+        str: The formatted, incremented document number (e.g., "F2025/001").
+    """
+    return reserve_document_numbers(doc_type, 1)[0]
@@ -0,0 +1,236 @@
+import pickle
+import os
+from datetime import date
+
+from . import locking
+from . import file_cache
+from . import writes
+from . import journal
+from .data_files import DOCUMENTI_DB, PRIMANOTA_DB
+
+# --- Year-Partitioned Stores ---
+# Documents and ledger movements are split by fiscal year: one journaled
+# store per year (e.g., 'documenti_2025.pkl'), plus '<name>_undated.pkl'
+# for records without a valid date. The list of existing partitions is
+# kept in a small index file next to them (e.g., 'documenti.pkl.years').
+# Year-scoped queries only load the partitions they need and closed years
+# are never rewritten; load_data() transparently returns their union.
+# A legacy single file is split on first access (and kept as '.bak').
+# All the functions below must be called holding locking.lock.
+PARTITIONED_DBS = (DOCUMENTI_DB, PRIMANOTA_DB)
+PARTITION_INDEX_SUFFIX = '.years'
+
+def partition_path(db_name, year):
+    """Returns the file of one partition (e.g., 'documenti_2025.pkl')."""
+    root, ext = os.path.splitext(db_name)
+    return f"{root}_{year if year is not None else 'undated'}{ext}"
+
+def logical_db(name):
+    """Maps a physical store to its data list (e.g., 'documenti_2025.pkl' -> DOCUMENTI_DB)."""
+    for db_name in PARTITIONED_DBS:
+        if name == db_name or name.startswith(os.path.splitext(db_name)[0] + '_'):
+            return db_name
+    return name
+
+def _record_year(record):
+    """Returns the partition key of a record: its year, or None if undated."""
+    ordinal = record.get('date_ord')
+    return date.fromordinal(ordinal).year if ordinal is not None else None
+
+def _save_partition_index(db_name, years):
+    """
+    Writes the list of partitions of a store (undated last).
+
+    Returns:
+        list: The sorted partition keys.
+    """
+    years = sorted(set(years), key=lambda year: (year is None, year or 0))
+    path = db_name + PARTITION_INDEX_SUFFIX
+    # Written synchronously (it changes once a year): a partition listed
+    # here but not written yet simply loads as empty
+    writes.atomic_write(path, pickle.dumps(years))
+    file_cache.store_cached(path, years)
+    return years
+
+def partition_years(db_name):
+    """
+    Returns the partition keys of a partitioned store, oldest first,
+    splitting a legacy single-file store on first access.
+
+    Args:
+        db_name (str): DOCUMENTI_DB or PRIMANOTA_DB.
+
+    Returns:
+        list: The years (int), plus None for the undated partition.
+    """
+    years = file_cache.read_cached(db_name + PARTITION_INDEX_SUFFIX, None)
+    if years is None:
+        with locking.file_lock():
+            # Split by one process only: check again under the lock
+            years = file_cache.read_cached(db_name + PARTITION_INDEX_SUFFIX, None)
+            if years is None:
+                years = _split_legacy_store(db_name)
+    return years
+
+def _split_legacy_store(db_name):
+    """
+    One-shot migration of a single-file store into year partitions.
+    The old snapshot and journal are kept with a '.bak' suffix.
+
+    Returns:
+        list: The partition keys created.
+    """
+    groups = {}
+    if os.path.exists(db_name) or os.path.exists(journal.journal_path(db_name)):
+        for record in journal.load_store(db_name)['data']:
+            groups.setdefault(_record_year(record), []).append(record)
+    for year, records in groups.items():
+        # Written synchronously: the legacy file goes away right after
+        partition = partition_path(db_name, year)
+        writes.atomic_write(partition, journal.dump_snapshot(records))
+        if os.path.exists(journal.journal_path(partition)):
+            os.remove(journal.journal_path(partition))
+        journal.stores.pop(partition, None)
+    years = _save_partition_index(db_name, groups)
+    for path in (db_name, journal.journal_path(db_name)):
+        if os.path.exists(path):
+            os.replace(path, path + '.bak')
+    journal.stores.pop(db_name, None)
+    return years
+
+def _add_partitions(db_name, years):
+    """Adds new partition keys to the index of a store, if missing."""
+    known = partition_years(db_name)
+    if not set(years) <= set(known):
+        _save_partition_index(db_name, list(known) + list(years))
+
+def store_names(db_name, date_from=None, date_to=None):
+    """
+    Returns the physical stores holding a data list: the file itself or,
+    for a partitioned store, the partitions overlapping the date range.
+    The undated partition is only included when there is no range.
+
+    Args:
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        date_from (date, optional): Inclusive lower bound.
+        date_to (date, optional): Inclusive upper bound.
+
+    Returns:
+        list: The store filenames, oldest partition first.
+    """
+    if db_name not in PARTITIONED_DBS:
+        return [db_name]
+    has_range = date_from is not None or date_to is not None
+    names = []
+    for year in partition_years(db_name):
+        if year is None:
+            if has_range:
+                continue
+        elif ((date_from is not None and year < date_from.year) or
+              (date_to is not None and year > date_to.year)):
+            continue
+        names.append(partition_path(db_name, year))
+    return names
+
+def locate(db_name, record_id):
+    """
+    Finds the cached (shared) record with the given ID.
+    Partitions are searched newest first, where most lookups end.
+
+    Returns:
+        tuple (str, dict): (store filename, record), or None if not found.
+    """
+    if db_name in PARTITIONED_DBS:
+        years = partition_years(db_name)
+        # Newest year first, the undated partition last
+        years = [year for year in reversed(years) if year is not None] + [None] * (None in years)
+        names = [partition_path(db_name, year) for year in years]
+    else:
+        names = [db_name]
+    for name in names:
+        record = journal.find_cached_record(name, record_id)
+        if record is not None:
+            return name, record
+    return None
+
+def journal_changes(db_name, entries):
+    """
+    Appends journal entries to a data list, routing them to the right
+    partition for partitioned stores. A record whose date moves to another
+    year is moved to that year's partition.
+
+    Args:
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        entries (list): The journal entries (see journal.append_journal).
+    """
+    if db_name not in PARTITIONED_DBS:
+        journal.append_journal(db_name, *entries)
+        return
+
+    by_store = {}
+    years = set()
+    # Where each record touched by this batch lives: {id: (store, record) or None}
+    located = {}
+
+    def locate_once(record_id):
+        if record_id not in located:
+            located[record_id] = locate(db_name, record_id)
+        return located[record_id]
+
+    def route(year, entry):
+        years.add(year)
+        name = partition_path(db_name, year)
+        by_store.setdefault(name, []).append(entry)
+        return name
+
+    for entry in entries:
+        op = entry[0]
+        if op == 'insert':
+            record = entry[1]
+            current = locate_once(record['id'])
+            year = _record_year(record)
+            if current is not None and current[0] != partition_path(db_name, year):
+                by_store.setdefault(current[0], []).append(('delete', record['id']))
+            located[record['id']] = (route(year, entry), record)
+            continue
+
+        current = locate_once(entry[1])
+        if current is None:
+            continue
+        name, record = current
+        if op == 'delete':
+            by_store.setdefault(name, []).append(entry)
+            located[entry[1]] = None
+        elif op == 'update':
+            merged = dict(record)
+            merged.update(entry[2])
+            year = _record_year(merged)
+            if partition_path(db_name, year) == name:
+                by_store.setdefault(name, []).append(entry)
+                located[entry[1]] = (name, merged)
+            else:
+                by_store.setdefault(name, []).append(('delete', entry[1]))
+                located[entry[1]] = (route(year, ('insert', merged)), merged)
+
+    _add_partitions(db_name, years)
+    for name, store_entries in by_store.items():
+        journal.append_journal(name, *store_entries)
+
+def save_partitioned(db_name, data):
+    """
+    Saves a whole partitioned data list. Only the partitions whose
+    content changed are rewritten (typically just the current year).
+
+    Args:
+        db_name (str): DOCUMENTI_DB or PRIMANOTA_DB.
+        data (list): Private copies of all the records.
+    """
+    groups = {}
+    for record in data:
+        groups.setdefault(_record_year(record), []).append(record)
+    for year in set(partition_years(db_name)) | set(groups):
+        name = partition_path(db_name, year)
+        records = groups.get(year, [])
+        if journal.load_store(name)['data'] != records:
+            journal.write_snapshot(name, records)
+    _add_partitions(db_name, groups)
@@ -26,8 +26,6 @@ def create_project(project_data):
     Raises:
         ValueError: If the 'client_id' does not exist in the address book.
     """
-    projects = db.load_data(db.PROGETTI_DB)
-    
     # Validate client existence
     client = db_rubrica.find_contact_by_id(project_data.get('client_id'))
     if not client:
@@ -46,8 +44,7 @@ def create_project(project_data):
         'file_archiviati': [] # List to store filenames
     }
     
-    projects.append(new_project)
-    db.save_data(db.PROGETTI_DB, projects)
+    db.insert_record(db.PROGETTI_DB, new_project)
     return new_project
 
 def get_all_projects(status_filter=None):
@@ -75,11 +72,7 @@ def find_project_by_id(project_id):
     Returns:
         dict: The project dictionary if found, else None.
     """
-    projects = db.load_data(db.PROGETTI_DB)
-    for project in projects:
-        if project.get('id') == project_id:
-            return project
-    return None
+    return db.find_record(db.PROGETTI_DB, project_id)
 
 def update_project(project_id, updated_data):
     """
@@ -96,24 +89,12 @@ def update_project(project_id, updated_data):
     Raises:
         ValueError: If 'status' is provided but is not a valid status.
     """
-    projects = db.load_data(db.PROGETTI_DB)
-    project_found = False
-    
-    for i, project in enumerate(projects):
-        if project.get('id') == project_id:
-            # Validate status if it's being changed
-            if 'status' in updated_data and updated_data['status'] not in STATI_PROGETTO:
-                raise ValueError(f"Invalid status: '{updated_data['status']}'.")
-                
-            project.update(updated_data)
-            projects[i] = project
-            project_found = True
-            break
-            
-    if project_found:
-        db.save_data(db.PROGETTI_DB, projects)
-        return projects[i]
-    return None
+    # Validate status if it's being changed
+    if 'status' in updated_data and updated_data['status'] not in STATI_PROGETTO:
+        raise ValueError(f"Invalid status: '{updated_data['status']}'.")
+
+    # Only the changed fields are written (None if not found)
+    return db.update_record(db.PROGETTI_DB, project_id, updated_data)
 
 def delete_project(project_id):
     """
@@ -126,12 +107,7 @@ def delete_project(project_id):
     Returns:
         bool: True if deletion was successful, False otherwise.
     """
-    projects = db.load_data(db.PROGETTI_DB)
-    new_projects = [p for p in projects if p.get('id') != project_id]
-    
-    if len(new_projects) < len(projects):
-        db.save_data(db.PROGETTI_DB, new_projects)
-        
+    if db.delete_record(db.PROGETTI_DB, project_id):
         # Also delete associated files directory
         try:
             project_files_path = get_project_files_path(project_id)
@@ -159,21 +135,21 @@ def add_fase_to_project(project_id, nome_fase, scadenza):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project:
-        return False, "Project not found."
-        
     fase = {
         'id': str(uuid.uuid4()),
         'nome': nome_fase,
         'scadenza': scadenza,
         'completata': False
     }
-    project['fasi'].append(fase)
-    
-    # We must save the *entire* projects list back to the DB
-    # We do this by calling update_project with the modified project object
-    update_project(project_id, project) 
+
+    def append_fase(project):
+        project['fasi'].append(fase)
+        # Save only the modified 'fasi' list, not the whole project
+        return {'fasi': project['fasi']}
+
+    # One call reads and writes the project (see persistence.modify_record)
+    if db.modify_record(db.PROGETTI_DB, project_id, append_fase) is None:
+        return False, "Project not found."
     return True, "Phase added."
 
 def toggle_fase_status(project_id, fase_id):
@@ -187,18 +163,20 @@ def toggle_fase_status(project_id, fase_id):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project: return False, "Project not found."
-
     fase_found = False
-    for fase in project['fasi']:
-        if fase['id'] == fase_id:
-            fase['completata'] = not fase['completata'] # The toggle logic
-            fase_found = True
-            break
-    
+
+    def toggle(project):
+        nonlocal fase_found
+        for fase in project['fasi']:
+            if fase['id'] == fase_id:
+                fase['completata'] = not fase['completata'] # The toggle logic
+                fase_found = True
+                return {'fasi': project['fasi']}
+        return None
+
+    if db.modify_record(db.PROGETTI_DB, project_id, toggle) is None:
+        return False, "Project not found."
     if fase_found:
-        update_project(project_id, project)
         return True, "Phase status updated."
     return False, "Phase not found."
 
@@ -213,15 +191,18 @@ def delete_fase(project_id, fase_id):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project: return False, "Project not found."
-    
-    original_len = len(project['fasi'])
-    # Rebuild the list without the matching phase
-    project['fasi'] = [f for f in project['fasi'] if f['id'] != fase_id]
-    
-    if len(project['fasi']) < original_len:
-        update_project(project_id, project)
+    fase_found = False
+
+    def remove_fase(project):
+        nonlocal fase_found
+        # Rebuild the list without the matching phase
+        fasi = [f for f in project['fasi'] if f['id'] != fase_id]
+        fase_found = len(fasi) < len(project['fasi'])
+        return {'fasi': fasi} if fase_found else None
+
+    if db.modify_record(db.PROGETTI_DB, project_id, remove_fase) is None:
+        return False, "Project not found."
+    if fase_found:
         return True, "Phase deleted."
     return False, "Phase not found."
 
@@ -242,10 +223,6 @@ def add_attivita_to_project(project_id, data, ore, descrizione, fatturabile=True
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project:
-        return False, "Project not found."
-        
     try:
         ore_float = float(ore)
     except ValueError:
@@ -258,8 +235,14 @@ def add_attivita_to_project(project_id, data, ore, descrizione, fatturabile=True
         'descrizione': descrizione,
         'fatturabile': fatturabile
     }
-    project['attivita'].append(attivita)
-    update_project(project_id, project) # Save changes
+
+    def append_attivita(project):
+        project['attivita'].append(attivita)
+        return {'attivita': project['attivita']}
+
+    # One call reads and writes the project (see persistence.modify_record)
+    if db.modify_record(db.PROGETTI_DB, project_id, append_attivita) is None:
+        return False, "Project not found."
     return True, "Activity added."
 
 def delete_attivita(project_id, attivita_id):
@@ -273,15 +256,18 @@ def delete_attivita(project_id, attivita_id):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project: return False, "Project not found."
-    
-    original_len = len(project['attivita'])
-    # Rebuild the list without the matching activity
-    project['attivita'] = [a for a in project['attivita'] if a['id'] != attivita_id]
-    
-    if len(project['attivita']) < original_len:
-        update_project(project_id, project)
+    attivita_found = False
+
+    def remove_attivita(project):
+        nonlocal attivita_found
+        # Rebuild the list without the matching activity
+        attivita = [a for a in project['attivita'] if a['id'] != attivita_id]
+        attivita_found = len(attivita) < len(project['attivita'])
+        return {'attivita': attivita} if attivita_found else None
+
+    if db.modify_record(db.PROGETTI_DB, project_id, remove_attivita) is None:
+        return False, "Project not found."
+    if attivita_found:
         return True, "Activity deleted."
     return False, "Activity not found."
 
@@ -340,9 +326,18 @@ def add_file_to_project(project_id, source_file_path):
         return False, f"Could not copy file: {e}"
 
     # If copy succeeds, register the filename in the project data
-    if filename not in project['file_archiviati']:
+    registered = False
+
+    def register_file(project):
+        nonlocal registered
+        if filename in project['file_archiviati']:
+            return None
         project['file_archiviati'].append(filename)
-        update_project(project_id, project)
+        registered = True
+        return {'file_archiviati': project['file_archiviati']}
+
+    db.modify_record(db.PROGETTI_DB, project_id, register_file)
+    if registered:
         return True, f"File copied and registered successfully."
     
     return False, "File already registered (but copy was executed)."
@@ -359,15 +354,21 @@ def delete_file_from_project(project_id, filename):
     Returns:
         tuple (bool, str): (True, "Success message") or (False, "Error message").
     """
-    project = find_project_by_id(project_id)
-    if not project:
+    registered = False
+
+    def unregister_file(project):
+        nonlocal registered
+        if filename not in project['file_archiviati']:
+            return None
+        project['file_archiviati'].remove(filename)
+        registered = True
+        return {'file_archiviati': project['file_archiviati']}
+
+    # 1. Remove from data registration
+    if db.modify_record(db.PROGETTI_DB, project_id, unregister_file) is None:
         return False, "Project not found."
     
-    if filename in project['file_archiviati']:
-        # 1. Remove from data registration
-        project['file_archiviati'].remove(filename)
-        update_project(project_id, project)
-        
+    if registered:
         # 2. Remove from disk
         try:
             file_path = os.path.join(get_project_files_path(project_id), filename)
@@ -406,9 +407,8 @@ def calculate_project_totals(project_id):
     ore_fatturabili = 0.0
     for a in project.get('attivita', []):
         total_ore += a['ore']
-        # Handle old data created before 'fatturabile' flag existed
-        # Default to True if the flag is missing
-        if a.get('fatturabile', True): 
+        # Old data without the flag is migrated on load (see migrations.py)
+        if a['fatturabile']:
             ore_fatturabili += a['ore']
 
     # 2. Calculate Cost
@@ -0,0 +1,121 @@
+from datetime import date, datetime
+
+from . import records as compact
+from .data_files import DOCUMENTI_DB, PRIMANOTA_DB, PROGETTI_DB
+
+# --- Record Copies ---
+
+def copy_record(record):
+    """
+    Returns a private copy of a single record (or the settings dict).
+
+    Records are dicts (or compact records, see records.py) whose values are
+    scalars or lists of dicts (e.g., 'items', 'fasi', 'attivita'), so
+    copying two levels deep is enough to keep callers from mutating the
+    cached objects.
+
+    Args:
+        record (dict): The cached record.
+
+    Returns:
+        dict: An independent copy of the record.
+    """
+    record = record.copy()
+    for key, value in record.items():
+        if isinstance(value, list):
+            record[key] = [
+                item.copy() if isinstance(item, (dict, compact.CompactRecord)) else item
+                for item in value
+            ]
+        elif isinstance(value, dict):
+            record[key] = value.copy()
+    return record
+
+# --- Date Ordinals ---
+# Dates are stored as 'YYYY-MM-DD' strings (what the UI shows and edits).
+# Next to each of them, every record carries the same date as an integer
+# ordinal (date.toordinal(), or None if the string is not a valid date),
+# computed once when the record is written. Range filters, partition
+# routing and analytics compare these integers instead of parsing the
+# strings of every record on every query. Data written before the
+# ordinals existed is upgraded once, when it is loaded (see migrations.py).
+DATE_ORDINAL_FIELDS = {'date': 'date_ord', 'due_date': 'due_date_ord'}
+
+def as_date(value):
+    """
+    Converts a date, datetime or 'YYYY-MM-DD' string to a date object.
+
+    Args:
+        value (date, datetime or str): The value to convert.
+
+    Returns:
+        datetime.date: The date, or None if the value can't be parsed.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+def _date_ordinal(value):
+    """Returns the ordinal of a date value, or None if it is not a valid date."""
+    value_date = as_date(value)
+    return value_date.toordinal() if value_date is not None else None
+
+def add_date_ordinals(record):
+    """
+    Sets the ordinal fields for the date fields present in a record
+    (or in the fields of an update), in place.
+
+    Args:
+        record (dict): A private copy of the record or fields.
+
+    Returns:
+        dict: The same record.
+    """
+    for field, ordinal_field in DATE_ORDINAL_FIELDS.items():
+        if field in record:
+            record[ordinal_field] = _date_ordinal(record[field])
+    return record
+
+# --- Compact Records ---
+# The most numerous records are stored as slotted classes instead of dicts
+# (see records.py): {data list: (class of its records, {list field: class of its entries})}.
+COMPACT_RECORDS = {
+    PRIMANOTA_DB: (compact.Movimento, {}),
+    PROGETTI_DB: (None, {'attivita': compact.Attivita}),
+    DOCUMENTI_DB: (None, {'items': compact.LineItem}),
+}
+
+def to_compact(db_name, record, whole=True):
+    """
+    Converts a record (or the fields of an update) to its compact classes.
+
+    Args:
+        db_name (str): The data list (e.g., PRIMANOTA_DB).
+        record (dict): A private copy of the record or fields.
+        whole (bool): False for update fields, which stay a plain dict.
+
+    Returns:
+        dict: The converted record.
+    """
+    record_class, list_classes = COMPACT_RECORDS.get(db_name, (None, {}))
+    for field, item_class in list_classes.items():
+        if isinstance(record.get(field), list):
+            record[field] = [item_class.from_mapping(item) for item in record[field]]
+    if whole and record_class is not None:
+        record = record_class.from_mapping(record)
+    return record
+
+def prepared(record, db_name=None, whole=True):
+    """
+    Returns a private copy of a record (or update fields), with its date
+    ordinals and, if db_name is given, in its compact form.
+    """
+    record = add_date_ordinals(copy_record(record))
+    return to_compact(db_name, record, whole) if db_name is not None else record
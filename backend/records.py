@@ -0,0 +1,166 @@
+from collections.abc import MutableMapping
+
+# --- Compact Records ---
+# Ledger movements, time-tracking activities and invoice lines are by far
+# the most numerous records, and as plain dicts each one carries its own
+# hash table of keys. These classes store the usual fields in __slots__
+# instead (one pointer per field) and behave like dicts everywhere else:
+# record['ore'], record.get('notes'), 'fatturabile' in record, update(),
+# copy(), iteration, equality with plain dicts, pandas DataFrames, Jinja2
+# templates. Fields outside the declared ones are kept in a small extra dict.
+# The persistence layer converts records to these classes when they are
+# written (see record_format.to_compact) and pickles them compactly as well.
+
+class _Missing:
+    """Marks a declared field that is not set (the key is absent)."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING' # Pickled by reference: always the same object
+
+MISSING = _Missing()
+
+class CompactRecord(MutableMapping):
+    """
+    Base class of the slotted records. Subclasses declare FIELDS and
+    __slots__ = slots_for(FIELDS).
+    """
+    __slots__ = ('_extra',)
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # {field: slot descriptor}, for fast access without getattr()
+        cls._slots = {field: getattr(cls, '_' + field) for field in cls.FIELDS}
+
+    def __init__(self, *args, **kwargs):
+        for descriptor in self._slots.values():
+            descriptor.__set__(self, MISSING)
+        self._extra = None
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """
+        Converts a dict (or another record) to this class.
+
+        Args:
+            mapping (Mapping): The record.
+
+        Returns:
+            CompactRecord: The compact record (the same object if already one).
+        """
+        if type(mapping) is cls:
+            return mapping
+        return cls(mapping)
+
+    @classmethod
+    def _restore(cls, values, extra):
+        """Rebuilds a record from its pickled state (see __reduce__)."""
+        record = cls.__new__(cls)
+        for descriptor, value in zip(cls._slots.values(), values):
+            descriptor.__set__(record, value)
+        record._extra = extra
+        return record
+
+    def __reduce__(self):
+        values = tuple(descriptor.__get__(self) for descriptor in self._slots.values())
+        return (self._restore, (values, self._extra))
+
+    # --- Mapping Protocol ---
+
+    def __getitem__(self, key):
+        descriptor = self._slots.get(key)
+        if descriptor is not None:
+            value = descriptor.__get__(self)
+            if value is not MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        descriptor = self._slots.get(key)
+        if descriptor is not None:
+            descriptor.__set__(self, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        descriptor = self._slots.get(key)
+        if descriptor is not None:
+            if descriptor.__get__(self) is MISSING:
+                raise KeyError(key)
+            descriptor.__set__(self, MISSING)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for field, descriptor in self._slots.items():
+            if descriptor.__get__(self) is not MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        count = sum(1 for descriptor in self._slots.values() if descriptor.__get__(self) is not MISSING)
+        return count + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key):
+        descriptor = self._slots.get(key)
+        if descriptor is not None:
+            return descriptor.__get__(self) is not MISSING
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        descriptor = self._slots.get(key)
+        if descriptor is not None:
+            value = descriptor.__get__(self)
+            return default if value is MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def copy(self):
+        """Returns a shallow copy, like dict.copy()."""
+        values = tuple(descriptor.__get__(self) for descriptor in self._slots.values())
+        return self._restore(values, dict(self._extra) if self._extra else None)
+
+    def to_dict(self):
+        """Returns the record as a plain dict."""
+        return dict(self.items())
+
+    __hash__ = None # Mutable, like a dict
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def slots_for(fields):
+    """Returns the __slots__ of a CompactRecord subclass with the given fields."""
+    return tuple('_' + field for field in fields)
+
+class Movimento(CompactRecord):
+    """A ledger (Prima Nota) movement."""
+    FIELDS = (
+        'id', 'date', 'date_ord', 'type', 'description', 'amount_netto', 'amount_iva',
+        'amount_ritenuta', 'amount_totale', 'linked_invoice_id', 'notes'
+    )
+    __slots__ = slots_for(FIELDS)
+
+class Attivita(CompactRecord):
+    """A time-tracking entry of a project."""
+    FIELDS = ('id', 'data', 'ore', 'descrizione', 'fatturabile')
+    __slots__ = slots_for(FIELDS)
+
+class LineItem(CompactRecord):
+    """A line of a quote or invoice."""
+    FIELDS = ('description', 'qty', 'unit_price', 'total', 'articolo_id')
+    __slots__ = slots_for(FIELDS)
@@ -0,0 +1,181 @@
+import argparse
+import heapq
+import threading
+from datetime import date, datetime, timedelta
+
+# Import centralized modules using relative imports
+from . import persistence as db
+from . import events
+from . import email_utils
+from . import calendar as db_calendario
+
+# --- Notification Scheduler ---
+# A long-running job sending the deadline reminders: every day with
+# calendar events gets one digest email, sent 'giorni_anticipo' days
+# before, at NOTIFY_HOUR. The scheduler keeps a priority queue of the
+# upcoming digests, (send time, day), and sleeps until the first one is
+# due. Changes to the calendar made in the same process wake it up to
+# rebuild the queue; changes made by other processes (e.g., the GUI) are
+# picked up at least every RECHECK_INTERVAL. All the digests due at once
+# are sent over the same reused SMTP connection (see email_utils).
+# The last day notified is saved in the settings ('last_notified_date'),
+# so a restart never sends a digest twice, and digests missed while the
+# scheduler was not running are sent as soon as it starts (never for days
+# already past).
+#
+# Run it headless from the project root:
+#     python -m backend.scheduler [--giorni 1] [--ora 8]
+NOTIFY_HOUR = 8 # Digests are sent at 08:00
+HORIZON_DAYS = 60 # How far ahead the queue is filled
+RECHECK_INTERVAL = 900.0 # Max seconds between checks of the calendar
+RETRY_DELAY = 300.0 # Seconds before retrying a digest that couldn't be sent
+
+def _as_date(value):
+    """Returns the date of an ISO date string ('YYYY-MM-DD'), or None."""
+    return date.fromisoformat(value) if value else None
+
+class NotificationScheduler(threading.Thread):
+    """
+    Background thread sending the daily deadline digests.
+    """
+
+    def __init__(self, giorni_anticipo=1, notify_hour=NOTIFY_HOUR, clock=datetime.now):
+        """
+        Args:
+            giorni_anticipo (int): How many days before a deadline to notify it.
+            notify_hour (int): The hour of the day the digests are sent.
+            clock (callable): Returns the current local datetime.
+        """
+        super().__init__(name='notification-scheduler', daemon=True)
+        self.giorni_anticipo = giorni_anticipo
+        self.notify_hour = notify_hour
+        self._clock = clock
+        self._queue = [] # Heap of (send time, day)
+        self._queue_built_at = None
+        self._stale = True
+        self._wake = threading.Event()
+        self._stopping = False
+
+    def notify(self):
+        """Wakes the scheduler to rebuild its queue (e.g., after a change)."""
+        self._stale = True
+        self._wake.set()
+
+    def stop(self):
+        """Asks the scheduler to finish; returns without waiting (see join())."""
+        self._stopping = True
+        self._wake.set()
+
+    def _on_calendar_change(self, change):
+        """Change feed callback (see events.py): the queue may be out of date."""
+        self.notify()
+
+    def _send_time(self, day):
+        """Returns when the digest of a day is due."""
+        return datetime.combine(day - timedelta(days=self.giorni_anticipo), datetime.min.time()).replace(hour=self.notify_hour)
+
+    def _rebuild_queue(self, now):
+        """Fills the queue with the days having events, from the first not notified yet."""
+        self._stale = False
+        self._queue_built_at = now
+        # Keeps the automatic deadlines current (cheap when nothing changed)
+        db_calendario.generate_scadenze_automatiche()
+        last_notified = _as_date(db.load_settings().get('last_notified_date'))
+        first_day = now.date()
+        if last_notified is not None and last_notified >= first_day:
+            first_day = last_notified + timedelta(days=1)
+        last_day = now.date() + timedelta(days=self.giorni_anticipo + HORIZON_DAYS)
+        self._queue = [(self._send_time(day), day) for day in db_calendario.count_eventi_per_giorno(first_day, last_day)]
+        heapq.heapify(self._queue)
+
+    def _send_digests(self, days):
+        """
+        Sends the digests of some days, in order, over one connection.
+
+        Returns:
+            list: The days whose digest couldn't be sent.
+        """
+        smtp_config = db.load_settings().get('smtp_config', {})
+        notify_email = smtp_config.get('notify_email') or smtp_config.get('user')
+        if not notify_email or not smtp_config.get('host'):
+            print("Warning: deadline reminders not sent: SMTP configuration incomplete in settings.")
+            return days
+        connection = email_utils.get_connection(smtp_config)
+        for position, day in enumerate(days):
+            eventi = db_calendario.get_eventi(day, day)
+            if eventi:
+                subject, body = db_calendario.componi_digest_scadenze(day, eventi)
+                success, msg = connection.send(notify_email, subject, body)
+                if not success:
+                    print(f"Warning: deadline reminders for {day.isoformat()} not sent. {msg}")
+                    return days[position:]
+            self._mark_notified(day)
+        return []
+
+    def _mark_notified(self, day):
+        """Records in the settings that the digest of a day was sent."""
+        with db.write_lock():
+            settings = db.load_settings()
+            last_notified = _as_date(settings.get('last_notified_date'))
+            if last_notified is None or day > last_notified:
+                settings['last_notified_date'] = day.isoformat()
+                db.save_settings(settings)
+
+    def run_pending(self):
+        """
+        Sends the digests that are due and returns how long to sleep.
+        Called in a loop by run(); may also be called directly.
+
+        Returns:
+            float: Seconds until the next digest is due (or the next recheck).
+        """
+        now = self._clock()
+        if self._stale or now - self._queue_built_at >= timedelta(seconds=RECHECK_INTERVAL):
+            self._rebuild_queue(now)
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[1])
+        if due:
+            for day in self._send_digests(sorted(due)):
+                heapq.heappush(self._queue, (now + timedelta(seconds=RETRY_DELAY), day))
+        wait = RECHECK_INTERVAL - (now - self._queue_built_at).total_seconds()
+        if self._queue:
+            wait = min(wait, (self._queue[0][0] - now).total_seconds())
+        return max(wait, 0.0)
+
+    def run(self):
+        events.subscribe(db.CALENDARIO_DB, self._on_calendar_change)
+        try:
+            while not self._stopping:
+                try:
+                    wait = self.run_pending()
+                except Exception as e:
+                    # Keep running: the next attempt may succeed (e.g., file locked, network down)
+                    print(f"Warning: notification scheduler error. {e}")
+                    wait = RETRY_DELAY
+                self._wake.wait(wait)
+                self._wake.clear()
+        finally:
+            events.unsubscribe(db.CALENDARIO_DB, self._on_calendar_change)
+            email_utils.close_connections()
+
+def main(argv=None):
+    """Runs the notification scheduler in the foreground, until interrupted."""
+    parser = argparse.ArgumentParser(description="Sends the daily deadline reminder emails.")
+    parser.add_argument('--giorni', type=int, default=1, help="days of notice (default: 1, the day before)")
+    parser.add_argument('--ora', type=int, default=NOTIFY_HOUR, choices=range(24), metavar='HOUR',
+                        help=f"hour of the day the reminders are sent (default: {NOTIFY_HOUR})")
+    args = parser.parse_args(argv)
+
+    scheduler = NotificationScheduler(giorni_anticipo=args.giorni, notify_hour=args.ora)
+    scheduler.start()
+    print(f"Notification scheduler running (reminders at {args.ora:02d}:00, {args.giorni} day(s) before). Ctrl+C to stop.")
+    try:
+        while scheduler.is_alive():
+            scheduler.join(1.0)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        scheduler.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import pickle
+
+from . import locking
+from . import file_cache
+from . import writes
+from . import migrations
+from . import storage_backend
+from . import transactions
+from .record_format import copy_record
+from .data_files import SETTINGS_FILE
+
+# --- Application Settings Management ---
+
+@locking.synchronized
+def load_settings():
+    """
+    Loads application settings (e.g., counters, API keys, user prefs).
+
+    Settings saved by older versions are upgraded once (see migrations.py),
+    so new settings (added during development) are always present.
+
+    Returns:
+        dict: The complete settings dictionary.
+    """
+    transactions.ensure_recovered()
+    # Served from the in-process cache when the file is unchanged
+    settings = file_cache.read_cached(SETTINGS_FILE, None)
+    if settings is None:
+        return default_settings() # File missing or corrupt
+    if settings.get('schema_version', 0) < migrations.SCHEMA_VERSION:
+        with locking.file_lock():
+            # Upgraded by one process only: read them again under the lock
+            settings = file_cache.read_cached(SETTINGS_FILE, None)
+            version = settings.get('schema_version', 0) if settings is not None else migrations.SCHEMA_VERSION
+            if version < migrations.SCHEMA_VERSION:
+                settings = copy_record(settings)
+                migrations.migrate(SETTINGS_FILE, [settings], version)
+                settings['schema_version'] = migrations.SCHEMA_VERSION
+                save_settings(settings)
+            if settings is None:
+                return default_settings()
+    return copy_record(settings)
+
+def default_settings():
+    """
+    Returns the default value of all application settings.
+
+    Returns:
+        dict: A new settings dictionary.
+    """
+    return {
+        'my_company_details': "Your Name / Your Company\nStreet, City, ZIP\nVAT ID: 0123456789",
+        'smtp_config': {
+            'host': '',
+            'port': 587,
+            'user': '',
+            'password': '',
+            'notify_email': '' # Email to send notifications to
+        },
+        'tax_config': {
+            'inps_perc': 26.07,
+            'irpef_perc': 23.0
+        },
+        'storage_backend': 'pickle', # 'pickle' or 'sqlite'
+        'scadenze_sync': {}, # Data stamps the automatic deadlines match (see calendar.py)
+        'last_notified_date': None, # Last day whose reminders were sent (see scheduler.py)
+        'schema_version': migrations.SCHEMA_VERSION
+    }
+
+@locking.exclusive
+def save_settings(settings_data):
+    """
+    Saves the application settings dictionary to its pickle file.
+
+    Args:
+        settings_data (dict): The settings dictionary to save.
+    """
+    data = copy_record(settings_data)
+    if writes.deferring():
+        writes.deferred_writes[SETTINGS_FILE] = data
+        file_cache.bump_version(SETTINGS_FILE)
+        writes.mark_dirty()
+    else:
+        writes.atomic_write(SETTINGS_FILE, pickle.dumps(data))
+        file_cache.store_cached(SETTINGS_FILE, data)
+    storage_backend.forget() # Re-read the backend choice on next access
@@ -0,0 +1,374 @@
+import sqlite3
+import pickle
+import threading
+
+# --- Constants ---
+# Columns copied out of each record so they can be indexed and filtered in SQL.
+# The full record is always stored as a pickled blob in the 'data' column.
+INDEXED_COLUMNS = ('date', 'status', 'client_id', 'doc_type', 'linked_invoice_id', 'type')
+
+# A single shared connection per database file, guarded by a lock.
+_connections = {}
+_lock = threading.RLock()
+# Tables already created/checked, as (connection id, table name)
+_ready_tables = set()
+
+# --- Connection and Schema ---
+
+def _table_name(db_name):
+    """
+    Maps a data file constant to its table name (e.g., 'documenti.pkl' -> 'documenti').
+
+    Args:
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+
+    Returns:
+        str: The table name.
+    """
+    return db_name.rsplit('.', 1)[0]
+
+def get_connection(path):
+    """
+    Returns the (cached) connection to an SQLite database file.
+
+    Args:
+        path (str): The SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The open connection.
+    """
+    with _lock:
+        conn = _connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            _connections[path] = conn
+        return conn
+
+def close_all():
+    """Closes all open SQLite connections."""
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+        _ready_tables.clear()
+
+def ensure_table(conn, db_name):
+    """
+    Creates the table for a data file and its indexes, if they don't exist.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+    """
+    table = _table_name(db_name)
+    if (id(conn), table) in _ready_tables:
+        return
+    columns = ", ".join(f"{col} TEXT" for col in INDEXED_COLUMNS)
+    with _lock, conn:
+        # 'seq' keeps the insertion order of the original list
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, {columns}, data BLOB NOT NULL)"
+        )
+        for col in INDEXED_COLUMNS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table}({col})")
+        # Most period queries are "invoices (or expenses) between two dates"
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_doc_type_date ON {table}(doc_type, date)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_type_date ON {table}(type, date)")
+    _ready_tables.add((id(conn), table))
+
+def _ensure_schema_table(conn):
+    """Creates the table holding the schema version of each table, if missing."""
+    if (id(conn), 'schema_versions') in _ready_tables:
+        return
+    with _lock, conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    _ready_tables.add((id(conn), 'schema_versions'))
+
+def get_schema_version(conn, db_name):
+    """
+    Returns the schema version of the data in a table.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+
+    Returns:
+        int: The version (0 if never recorded).
+    """
+    _ensure_schema_table(conn)
+    with _lock:
+        row = conn.execute(
+            "SELECT version FROM schema_versions WHERE name = ?", (_table_name(db_name),)
+        ).fetchone()
+    return row[0] if row else 0
+
+def _write_schema_version(conn, table, version):
+    """Records the schema version of a table. Must be called inside a transaction."""
+    conn.execute("INSERT OR REPLACE INTO schema_versions (name, version) VALUES (?, ?)", (table, version))
+
+def set_schema_version(conn, db_name, version):
+    """
+    Records the schema version of the data in a table.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        version (int): The schema version.
+    """
+    _ensure_schema_table(conn)
+    with _lock, conn:
+        _write_schema_version(conn, _table_name(db_name), version)
+
+def _row_values(record):
+    """
+    Extracts the indexed column values and the pickled blob from a record.
+
+    Args:
+        record (dict): The record to store.
+
+    Returns:
+        list: [id, *indexed columns, data blob].
+    """
+    values = [record.get('id')]
+    for col in INDEXED_COLUMNS:
+        value = record.get(col)
+        values.append(str(value) if value is not None else None)
+    values.append(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+    return values
+
+# --- Reads ---
+
+def load_all(conn, db_name):
+    """
+    Loads every record of a table, in insertion order.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+
+    Returns:
+        list: The list of record dictionaries.
+    """
+    ensure_table(conn, db_name)
+    with _lock:
+        rows = conn.execute(f"SELECT data FROM {_table_name(db_name)} ORDER BY seq").fetchall()
+    return [pickle.loads(row[0]) for row in rows]
+
+def find(conn, db_name, record_id):
+    """
+    Finds a single record by ID, using the primary key index.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+        record_id (str): The 'id' of the record.
+
+    Returns:
+        dict: The record if found, else None.
+    """
+    ensure_table(conn, db_name)
+    with _lock:
+        row = conn.execute(
+            f"SELECT data FROM {_table_name(db_name)} WHERE id = ?", (record_id,)
+        ).fetchone()
+    return pickle.loads(row[0]) if row else None
+
+def query(conn, db_name, filters, date_from=None, date_to=None, order_by=None):
+    """
+    Loads the records matching equality filters and an optional date range.
+    All conditions are evaluated by SQLite on indexed columns.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        filters (dict): {column: value} equality conditions (INDEXED_COLUMNS only).
+        date_from (str, optional): Inclusive lower bound on 'date' ('YYYY-MM-DD').
+        date_to (str, optional): Inclusive upper bound on 'date' ('YYYY-MM-DD').
+        order_by (str, optional): An indexed column to sort by.
+
+    Returns:
+        list: The matching record dictionaries.
+    """
+    clauses = []
+    params = []
+    for col, value in filters.items():
+        if col not in INDEXED_COLUMNS:
+            raise ValueError(f"Column '{col}' is not indexed.")
+        clauses.append(f"{col} = ?")
+        params.append(str(value))
+    if date_from is not None or date_to is not None:
+        # Ignore malformed dates, like the Python date parsing does
+        clauses.append("date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'")
+    if date_from is not None:
+        clauses.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("date <= ?")
+        params.append(date_to)
+
+    sql = f"SELECT data FROM {_table_name(db_name)}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if order_by is not None:
+        if order_by not in INDEXED_COLUMNS:
+            raise ValueError(f"Column '{order_by}' is not indexed.")
+        sql += f" ORDER BY {order_by}, seq"
+    else:
+        sql += " ORDER BY seq"
+
+    ensure_table(conn, db_name)
+    with _lock:
+        rows = conn.execute(sql, params).fetchall()
+    return [pickle.loads(row[0]) for row in rows]
+
+# --- Writes ---
+
+def replace_all(conn, db_name, data):
+    """
+    Replaces the whole content of a table in a single transaction.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+        data (list): The complete list of records.
+    """
+    ensure_table(conn, db_name)
+    table = _table_name(db_name)
+    placeholders = ", ".join("?" * (len(INDEXED_COLUMNS) + 2))
+    columns = ", ".join(INDEXED_COLUMNS)
+    with _lock, conn:
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT INTO {table} (id, {columns}, data) VALUES ({placeholders})",
+            (_row_values(record) for record in data)
+        )
+
+def _insert_row(conn, db_name, record):
+    """Inserts (or replaces) a record. Must be called inside a transaction."""
+    placeholders = ", ".join("?" * (len(INDEXED_COLUMNS) + 2))
+    columns = ", ".join(INDEXED_COLUMNS)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {_table_name(db_name)} (id, {columns}, data) VALUES ({placeholders})",
+        _row_values(record)
+    )
+
+def _update_row(conn, db_name, record_id, fields):
+    """Merges fields into a record. Must be called inside a transaction."""
+    record = find(conn, db_name, record_id)
+    if record is None:
+        return None
+    record.update(fields)
+    assignments = ", ".join(f"{col} = ?" for col in INDEXED_COLUMNS)
+    conn.execute(
+        f"UPDATE {_table_name(db_name)} SET {assignments}, data = ? WHERE id = ?",
+        _row_values(record)[1:] + [record_id]
+    )
+    return record
+
+def _delete_row(conn, db_name, record_id):
+    """Deletes a record. Must be called inside a transaction."""
+    cursor = conn.execute(f"DELETE FROM {_table_name(db_name)} WHERE id = ?", (record_id,))
+    return cursor.rowcount > 0
+
+def insert(conn, db_name, record):
+    """
+    Inserts a single record (replacing any record with the same ID).
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., PRIMANOTA_DB).
+        record (dict): The record to insert. Must have an 'id'.
+    """
+    ensure_table(conn, db_name)
+    with _lock, conn:
+        _insert_row(conn, db_name, record)
+
+def update(conn, db_name, record_id, fields):
+    """
+    Merges new field values into a stored record.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., PROGETTI_DB).
+        record_id (str): The 'id' of the record.
+        fields (dict): The fields to set.
+
+    Returns:
+        dict: The updated record, or None if not found.
+    """
+    ensure_table(conn, db_name)
+    with _lock, conn:
+        return _update_row(conn, db_name, record_id, fields)
+
+def delete(conn, db_name, record_id):
+    """
+    Deletes a single record by ID.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., RUBRICA_DB).
+        record_id (str): The 'id' of the record.
+
+    Returns:
+        bool: True if a record was deleted, False otherwise.
+    """
+    ensure_table(conn, db_name)
+    with _lock, conn:
+        return _delete_row(conn, db_name, record_id)
+
+def upgrade_records(conn, db_name, upgrade, version):
+    """
+    Runs a data upgrade over every record of a table and records the new
+    schema version, in a single transaction. Only the records the upgrade
+    changed are rewritten.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        db_name (str): The filename constant (e.g., DOCUMENTI_DB).
+        upgrade (callable): upgrade(records) changes the list of records in place.
+        version (int): The schema version of the upgraded data.
+
+    Returns:
+        int: The number of records rewritten.
+    """
+    ensure_table(conn, db_name)
+    _ensure_schema_table(conn)
+    table = _table_name(db_name)
+    assignments = ", ".join(f"{col} = ?" for col in INDEXED_COLUMNS)
+    changed = 0
+    with _lock, conn:
+        rows = conn.execute(f"SELECT seq, data FROM {table} ORDER BY seq").fetchall()
+        records = [pickle.loads(row[1]) for row in rows]
+        upgrade(records)
+        for (seq, blob), record in zip(rows, records):
+            values = _row_values(record)
+            if values[-1] != blob:
+                conn.execute(f"UPDATE {table} SET {assignments}, data = ? WHERE seq = ?", values[1:] + [seq])
+                changed += 1
+        _write_schema_version(conn, table, version)
+    return changed
+
+def apply_changes(conn, changes):
+    """
+    Applies a batch of journal-style changes, possibly to several tables,
+    in a single SQLite transaction.
+
+    Args:
+        conn (sqlite3.Connection): The open connection.
+        changes (list): [(db_name, entry)], where entry is ('insert', record),
+                        ('update', id, fields) or ('delete', id).
+    """
+    # Create the tables first: ensure_table commits on its own
+    for db_name in {db_name for db_name, _ in changes}:
+        ensure_table(conn, db_name)
+    with _lock, conn:
+        for db_name, entry in changes:
+            op = entry[0]
+            if op == 'insert':
+                _insert_row(conn, db_name, entry[1])
+            elif op == 'update':
+                _update_row(conn, db_name, entry[1], entry[2])
+            elif op == 'delete':
+                _delete_row(conn, db_name, entry[1])
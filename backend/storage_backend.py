@@ -0,0 +1,105 @@
+from . import sqlite_store
+from . import locking
+from . import settings as app_settings
+from . import data_access
+from . import migrations
+from . import transactions
+from .data_files import (
+    RUBRICA_DB, PROGETTI_DB, DOCUMENTI_DB, CALENDARIO_DB, MAGAZZINO_DB, PRIMANOTA_DB, SQLITE_FILE
+)
+
+# --- Storage Backends ---
+# 'pickle' (default): one .pkl snapshot + journal per data list.
+# 'sqlite': all data lists in SQLITE_FILE, with indexed columns so that
+# query_data() filters run inside SQLite. Selected by the
+# 'storage_backend' setting (see set_storage_backend / migrate_to_sqlite).
+STORAGE_BACKENDS = ('pickle', 'sqlite')
+SQLITE_DBS = (RUBRICA_DB, PROGETTI_DB, DOCUMENTI_DB, CALENDARIO_DB, MAGAZZINO_DB, PRIMANOTA_DB)
+_active_backend = None # Resolved lazily from settings
+_sqlite_upgraded = False # SQLite schema versions checked in this process
+
+@locking.synchronized
+def get_storage_backend():
+    """
+    Returns the active storage backend, as configured in settings.
+
+    Returns:
+        str: 'pickle' or 'sqlite'.
+    """
+    global _active_backend
+    if _active_backend is None:
+        _active_backend = app_settings.load_settings().get('storage_backend', 'pickle')
+    return _active_backend
+
+def forget():
+    """Makes the next access re-read the backend choice from the settings."""
+    global _active_backend
+    _active_backend = None
+
+@locking.exclusive
+def set_storage_backend(backend):
+    """
+    Saves the storage backend choice in settings.
+    This does not move any data: use migrate_to_sqlite() for that.
+
+    Args:
+        backend (str): 'pickle' or 'sqlite'.
+
+    Raises:
+        ValueError: If the backend name is not valid.
+    """
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Invalid storage backend: {backend}")
+    settings = app_settings.load_settings()
+    settings['storage_backend'] = backend
+    app_settings.save_settings(settings)
+
+def use_sqlite(db_name):
+    """Returns True if this data list is stored in SQLite."""
+    return db_name in SQLITE_DBS and get_storage_backend() == 'sqlite'
+
+def sqlite():
+    """Returns the shared connection to SQLITE_FILE."""
+    global _sqlite_upgraded
+    transactions.ensure_recovered()
+    conn = sqlite_store.get_connection(SQLITE_FILE)
+    if not _sqlite_upgraded:
+        # Older data is upgraded once (see migrations.py)
+        _sqlite_upgraded = True
+        for db_name in SQLITE_DBS:
+            version = sqlite_store.get_schema_version(conn, db_name)
+            if version < migrations.SCHEMA_VERSION:
+                sqlite_store.upgrade_records(
+                    conn, db_name, lambda records: migrations.migrate(db_name, records, version),
+                    migrations.SCHEMA_VERSION
+                )
+    return conn
+
+@locking.exclusive
+def migrate_to_sqlite():
+    """
+    One-shot migration of all .pkl data files into the SQLite database.
+    The .pkl files are left untouched as a backup.
+    On success, the storage backend is switched to 'sqlite'.
+
+    Returns:
+        tuple (bool, str): (True, "Success message") or (False, "Error message").
+    """
+    if get_storage_backend() == 'sqlite':
+        return False, "Data is already stored in SQLite."
+
+    try:
+        conn = sqlite()
+        total = 0
+        for db_name in SQLITE_DBS:
+            # Still reads from the pickle backend at this point
+            data = data_access.load_data(db_name)
+            sqlite_store.replace_all(conn, db_name, data)
+            # Already upgraded by the pickle backend
+            sqlite_store.set_schema_version(conn, db_name, migrations.SCHEMA_VERSION)
+            total += len(data)
+    except Exception as e:
+        return False, f"Error during migration: {e}"
+
+    set_storage_backend('sqlite')
+    return True, f"Migrated {total} records to {SQLITE_FILE}."
@@ -3,8 +3,8 @@ from datetime import datetime
 
 # Import centralized modules using relative imports
 from . import persistence as db
-from . import documents as db_docs
-from . import ledger as db_ledger
+from . import ledger_columns
+from . import money
 
 # --- Private Calculation Helpers ---
 
@@ -51,29 +51,14 @@ def _get_dati_iva(start_date, end_date):
     Returns:
         dict: A dictionary with 'iva_debito', 'iva_credito', 'iva_da_versare'.
     """
-    iva_debito = Decimal('0')
-    iva_credito = Decimal('0')
-    
     # 1. VAT Debit (from Invoices issued in the period)
-    all_invoices = db_docs.get_all_documents(doc_type='invoice')
-    for inv in all_invoices:
-        try:
-            inv_date = datetime.strptime(inv['date'], '%Y-%m-%d').date()
-            if start_date <= inv_date <= end_date:
-                iva_debito += inv.get('vat_amount', Decimal('0'))
-        except ValueError:
-            continue
+    # Type and period filters are pushed down to the storage backend
+    invoices = db.query_data(db.DOCUMENTI_DB, date_from=start_date, date_to=end_date, doc_type='invoice')
+    iva_debito = money.total(inv.get('vat_amount') for inv in invoices).to_decimal()
             
     # 2. VAT Credit (from 'Uscita' entries in Prima Nota in the period)
-    all_movimenti = db_ledger._get_movimenti()
-    for mov in all_movimenti:
-        if mov.get('type') == 'Uscita': # Only expenses
-            try:
-                mov_date = datetime.strptime(mov['date'], '%Y-%m-%d').date()
-                if start_date <= mov_date <= end_date:
-                    iva_credito += mov.get('amount_iva', Decimal('0'))
-            except ValueError:
-                continue
+    expenses = db.query_data(db.PRIMANOTA_DB, date_from=start_date, date_to=end_date, type='Uscita')
+    iva_credito = money.total(mov.get('amount_iva') for mov in expenses).to_decimal()
                 
     # Calculate the net VAT to be paid
     iva_da_versare = iva_debito - iva_credito
@@ -103,21 +88,9 @@ def _get_dati_contributivi(year, tax_config):
     except InvalidOperation:
         raise ValueError("Invalid tax rates in settings.")
 
-    # Load the financial ledger (Prima Nota) for the year
-    df_movimenti, msg = db_ledger._get_dataframe(year)
-    
-    if df_movimenti.empty:
-        return {
-            'imponibile_cassa': Decimal('0'),
-            'contributi_inps': Decimal('0'),
-            'imponibile_irpef': Decimal('0'),
-            'stima_irpef': Decimal('0')
-        }
-        
     # Calculate Taxable Income (Cash basis): Sum of 'amount_netto' from 'Entrata'
-    imponibile_cassa = Decimal(str(
-        df_movimenti[df_movimenti['type'] == 'Entrata']['amount_netto'].sum()
-    ))
+    # (exact sum over the columnar ledger of the year)
+    imponibile_cassa = ledger_columns.sum_by_type(year, 'amount_netto')['Entrata']
     
     # Calculate estimated INPS contributions
     contributi_inps = imponibile_cassa * inps_perc
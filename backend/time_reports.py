@@ -33,13 +33,6 @@ def _get_all_attivita_df():
             new_att['project_id'] = project['id']
             new_att['project_name'] = project_name
             new_att['client_name'] = client_name
-            
-            # --- BACKWARDS COMPATIBILITY ---
-            # If 'fatturabile' key doesn't exist (for old data),
-            # default it to True.
-            if 'fatturabile' not in new_att:
-                new_att['fatturabile'] = True
-            
             all_activities.append(new_att)
             
     if not all_activities:
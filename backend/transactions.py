@@ -0,0 +1,252 @@
+import pickle
+import os
+from contextlib import contextmanager
+
+from . import events
+from . import sqlite_store
+from . import locking
+from . import writes
+from . import partitions
+from . import numbering
+from . import storage_backend
+from . import settings as app_settings
+from . import data_access
+from .record_format import copy_record, prepared
+from .data_files import TRANSACTION_FILE
+
+# --- Transactions (Unit of Work) ---
+# A Transaction collects changes to several stores (and to the settings)
+# and commits them together. Until commit, the changes only live in the
+# transaction's private working copies, so an error simply discards them.
+# On commit, all the changes are first written to TRANSACTION_FILE (a redo
+# log), then applied to each store with a single batched write, then the
+# redo log is removed. If the process dies in between, the redo log is
+# replayed on next access (every change is idempotent), so either all the
+# changes of a transaction are applied or none is.
+recovery_checked = False # Reset by persistence.invalidate_cache
+
+class Transaction:
+    """
+    A unit of work spanning multiple data files.
+    It has the same record/settings API as the persistence module, so a
+    transaction can be passed wherever the functions take an optional
+    'tx' argument. Use it through transaction().
+    """
+
+    def __init__(self):
+        # Working copies of the records read/written, keyed by (db_name, id).
+        # None marks a missing or deleted record.
+        self._records = {}
+        # Journal entries to commit, in order: [(db_name, entry)]
+        self._changes = []
+        self._settings = None
+        self._settings_changed = False
+        # Working copy of the number sequences: the numbering is locked
+        # from the first number taken until the transaction ends
+        self._sequences = None
+        self._closed = False
+
+    def _working_record(self, db_name, record_id):
+        """Returns the transaction's own copy of a record, loading it once."""
+        key = (db_name, record_id)
+        if key not in self._records:
+            self._records[key] = data_access.find_record(db_name, record_id)
+        return self._records[key]
+
+    def find_record(self, db_name, record_id):
+        """Like persistence.find_record, but sees the uncommitted changes."""
+        record = self._working_record(db_name, record_id)
+        return copy_record(record) if record is not None else None
+
+    def insert_record(self, db_name, record):
+        """Like persistence.insert_record, applied on commit."""
+        record = prepared(record, db_name)
+        self._records[(db_name, record['id'])] = copy_record(record)
+        self._changes.append((db_name, ('insert', record)))
+
+    def update_record(self, db_name, record_id, fields):
+        """Like persistence.update_record, applied on commit."""
+        record = self._working_record(db_name, record_id)
+        if record is None:
+            return None
+        fields = prepared(fields, db_name, whole=False)
+        record.update(copy_record(fields))
+        self._changes.append((db_name, ('update', record_id, fields)))
+        return copy_record(record)
+
+    def delete_record(self, db_name, record_id):
+        """Like persistence.delete_record, applied on commit."""
+        if self._working_record(db_name, record_id) is None:
+            return False
+        self._records[(db_name, record_id)] = None
+        self._changes.append((db_name, ('delete', record_id)))
+        return True
+
+    def load_settings(self):
+        """Like persistence.load_settings, but sees the uncommitted changes."""
+        if self._settings is None:
+            self._settings = app_settings.load_settings()
+        return copy_record(self._settings)
+
+    def save_settings(self, settings_data):
+        """Like persistence.save_settings, applied on commit."""
+        self._settings = copy_record(settings_data)
+        self._settings_changed = True
+
+    def reserve_document_numbers(self, doc_type="invoice", count=1):
+        """
+        Like persistence.reserve_document_numbers, applied on commit:
+        a rolled back transaction doesn't consume any number.
+        """
+        if self._sequences is None:
+            # Released when the transaction ends (see _release_numbering)
+            locking.numbering_lock.acquire()
+            locking.acquire_file_lock(True)
+            with locking.lock:
+                self._sequences = copy_record(numbering.load_sequences())
+        return numbering.reserve_numbers(self._sequences, doc_type, count)
+
+    def get_next_document_number(self, doc_type="invoice"):
+        """Like persistence.get_next_document_number, applied on commit."""
+        return self.reserve_document_numbers(doc_type, 1)[0]
+
+    def _release_numbering(self):
+        """Unlocks the numbering, if this transaction took a number."""
+        if self._sequences is not None:
+            self._sequences = None
+            locking.release_file_lock()
+            locking.numbering_lock.release()
+
+    def commit(self):
+        """
+        Applies all the changes. Does nothing if the transaction was
+        already committed or rolled back.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._commit()
+        finally:
+            self._release_numbering()
+
+    def _commit(self):
+        """Writes the redo log and applies it (see commit)."""
+        if not self._changes and not self._settings_changed and self._sequences is None:
+            return
+        pending = {
+            'changes': self._changes,
+            'settings': self._settings if self._settings_changed else None,
+            'sequences': self._sequences
+        }
+        # One commit at a time: they share the redo log file (and other
+        # processes must not take the log for an interrupted commit)
+        with locking.commit_lock, locking.file_lock():
+            with locking.lock:
+                # The redo log must be on disk before any store is touched
+                writes.atomic_write(TRANSACTION_FILE, pickle.dumps(pending))
+                _apply_transaction(pending)
+                deferred = writes.deferring()
+            if deferred:
+                # The log may only go once the changes are durable
+                writes.flush()
+            os.remove(TRANSACTION_FILE)
+
+    def rollback(self):
+        """Discards all the changes."""
+        self._closed = True
+        self._records.clear()
+        self._changes = []
+        self._settings = None
+        self._settings_changed = False
+        self._release_numbering()
+
+@contextmanager
+def transaction(tx=None):
+    """
+    Opens a unit of work: commits on normal exit, rolls back on exception.
+
+    Args:
+        tx (Transaction, optional): An outer transaction to join. In that
+            case the changes are committed (or not) by the outer one.
+
+    Yields:
+        Transaction: The transaction to read and write through.
+    """
+    if tx is not None:
+        yield tx
+        return
+    tx = Transaction()
+    try:
+        yield tx
+    except BaseException:
+        tx.rollback()
+        raise
+    tx.commit()
+
+def _apply_transaction(pending):
+    """
+    Applies the changes of a committed transaction to the stores.
+    Each store is written once, with all its entries batched together.
+
+    Args:
+        pending (dict): {'changes': [(db_name, entry)], 'settings': dict or None,
+                         'sequences': dict or None}.
+    """
+    sqlite_changes = []
+    entries_by_db = {}
+    touched = {} # The records before the transaction: {(db_name, id): record}
+    for db_name, entry in pending['changes']:
+        if storage_backend.use_sqlite(db_name):
+            sqlite_changes.append((db_name, entry))
+        else:
+            entries_by_db.setdefault(db_name, []).append(entry)
+        if events.has_subscribers(db_name):
+            record_id = entry[1]['id'] if entry[0] == 'insert' else entry[1]
+            if (db_name, record_id) not in touched:
+                touched[(db_name, record_id)] = data_access.find_record(db_name, record_id)
+
+    if sqlite_changes:
+        sqlite_store.apply_changes(storage_backend.sqlite(), sqlite_changes)
+    for db_name, entries in entries_by_db.items():
+        partitions.journal_changes(db_name, entries)
+    # One change per record, from before to after the whole transaction
+    for (db_name, record_id), before in touched.items():
+        data_access.publish_change(db_name, record_id, before, data_access.find_record(db_name, record_id))
+    if pending['settings'] is not None:
+        app_settings.save_settings(pending['settings'])
+    if pending.get('sequences') is not None:
+        numbering.save_sequences(pending['sequences'])
+
+def ensure_recovered():
+    """Completes an interrupted transaction, if not checked yet (see _recover_transaction)."""
+    if not recovery_checked:
+        _recover_transaction()
+
+def _recover_transaction():
+    """
+    Completes a transaction interrupted during commit (see TRANSACTION_FILE).
+    Called once, before the first access to the data.
+    """
+    global recovery_checked
+    recovery_checked = True
+    if not os.path.exists(TRANSACTION_FILE):
+        return
+    # A process committing holds the lock until its log is removed:
+    # a log still there once we hold it is from an interrupted commit
+    with locking.file_lock():
+        try:
+            with open(TRANSACTION_FILE, 'rb') as f:
+                pending = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+            # Unreadable redo log: it was never completely written
+            # (see writes.atomic_write), so nothing was applied yet
+            pending = None
+        if pending is not None:
+            # Written synchronously, even with the write-behind writer running:
+            # the log is removed right after
+            with writes.synchronous_writes():
+                _apply_transaction(pending)
+        os.remove(TRANSACTION_FILE)
@@ -0,0 +1,235 @@
+import pickle
+import os
+import atexit
+import threading
+from contextlib import contextmanager
+
+from . import locking
+from . import file_cache
+from . import journal
+from . import transactions
+from .data_files import SETTINGS_FILE
+
+# --- Atomic Writes, Group Commit and Write-Behind ---
+# Files are never rewritten in place: the new content goes to a temporary
+# file which is fsync'd and then renamed over the old one, so a crash
+# leaves either the old or the new version on disk, never a truncated one.
+# Inside group_commit(), full writes are deferred and coalesced (only the
+# last save of each file is written) and journal fsyncs are batched, so a
+# bulk operation pays for one durable write per file instead of one per call.
+# With the write-behind writer running (see start_write_behind), writes are
+# always deferred this way and a background thread flushes them shortly
+# after, so the caller (the GUI) never waits for the disk.
+# flush() is the durability barrier: it returns once everything is on disk.
+WRITE_BEHIND_DELAY = 0.5 # Seconds to wait for more saves before flushing
+_group_depth = 0
+deferred_writes = {} # {path: data}, written by the next flush
+unsynced_journals = set()
+_writer = None # The running _WriteBehindWriter, if any
+_synchronous = False # Writes are never deferred (see synchronous_writes)
+
+def _fsync_dir(path):
+    """Makes a rename in the directory of 'path' durable (POSIX only)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, payload):
+    """
+    Writes a file atomically: temporary file + fsync + os.replace.
+
+    Args:
+        path (str): The file to (re)write.
+        payload (bytes): The new content (pickled data).
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
+
+def deferring():
+    """Returns True if writes are currently deferred to the next flush."""
+    return (_group_depth > 0 or _writer is not None) and not _synchronous
+
+@contextmanager
+def synchronous_writes():
+    """
+    Writes made inside the block are never deferred, even with the
+    write-behind writer running (e.g., the recovery of a transaction,
+    whose redo log is removed right after).
+    """
+    global _synchronous
+    _synchronous = True
+    try:
+        yield
+    finally:
+        _synchronous = False
+
+def mark_dirty():
+    """
+    Called when a write is left pending: keeps the inter-process write
+    lock until it is flushed, and wakes the write-behind writer, if running.
+    """
+    locking.pin_file_lock()
+    if _writer is not None:
+        _writer.notify()
+
+@contextmanager
+def group_commit():
+    """
+    Coalesces the writes made inside the block: each file is written
+    (durably) once, when the outermost group ends. Reads inside the block
+    see the pending changes. Groups can be nested.
+    """
+    global _group_depth
+    with locking.lock:
+        _group_depth += 1
+    try:
+        yield
+    finally:
+        with locking.lock:
+            _group_depth -= 1
+            done = _group_depth == 0
+        if done and _writer is None:
+            flush()
+
+def flush():
+    """
+    Durability barrier: writes every deferred change to disk now, and
+    returns once it is durable. Cheap when nothing is pending.
+    Must not be called while holding the persistence lock.
+    """
+    with locking.flush_lock:
+        with locking.lock:
+            paths = list(deferred_writes)
+        for path in paths:
+            _flush_file(path)
+        with locking.lock:
+            journals = list(unsynced_journals)
+            unsynced_journals.clear()
+        for path in journals:
+            try:
+                with open(path, 'rb') as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass # Compacted into a (durable) snapshot in the meantime
+        with locking.lock:
+            if not deferred_writes and not unsynced_journals:
+                # Everything is on disk: other processes may write again
+                locking.unpin_file_lock()
+
+def _flush_file(path):
+    """
+    Writes one deferred file. The data is pickled under the lock (so it
+    can't change halfway), the slow disk write and fsync run without it.
+
+    Args:
+        path (str): A key of deferred_writes.
+    """
+    with locking.lock:
+        if path not in deferred_writes:
+            return
+        data = deferred_writes[path]
+        version = file_cache.versions.get(path, 0)
+        payload = pickle.dumps(data) if path == SETTINGS_FILE else journal.dump_snapshot(data)
+
+    atomic_write(path, payload)
+
+    with locking.lock:
+        # Changed again while writing: keep it pending for the next flush
+        unchanged = file_cache.versions.get(path, 0) == version
+        if path == SETTINGS_FILE:
+            if unchanged:
+                del deferred_writes[path]
+                file_cache.store_cached(path, data)
+            return
+        # The snapshot contains every journaled change
+        if os.path.exists(journal.journal_path(path)):
+            os.remove(journal.journal_path(path))
+        if unchanged:
+            del deferred_writes[path]
+            stamp = file_cache.file_stamp(os.stat(path))
+            store = journal.stores.get(path)
+            if store is not None and store['data'] is data:
+                store.update(stamp=stamp, journal=None, entries=0)
+            else:
+                journal.stores[path] = {'stamp': stamp, 'journal': None, 'entries': 0, 'data': data, 'index': None}
+
+class _WriteBehindWriter(threading.Thread):
+    """
+    Background thread that flushes the deferred writes a short while
+    after they are made (see start_write_behind).
+    """
+
+    def __init__(self, delay):
+        super().__init__(name='persistence-write-behind', daemon=True)
+        self.delay = delay
+        self._dirty = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self):
+        """Signals that there is something to flush."""
+        self._dirty.set()
+
+    def stop(self):
+        """Stops the thread (pending writes are left to the caller's flush)."""
+        self._stopping.set()
+        self._dirty.set()
+        self.join()
+
+    def run(self):
+        while True:
+            self._dirty.wait()
+            # Coalescing window: saves made meanwhile are written together
+            self._stopping.wait(self.delay)
+            if self._stopping.is_set():
+                return
+            self._dirty.clear()
+            try:
+                flush()
+            except Exception as e:
+                # Still pending: retried by the next flush
+                print(f"Warning: background save failed. {e}")
+
+def start_write_behind(delay=WRITE_BEHIND_DELAY):
+    """
+    Starts the background writer: from now on, saves only update the
+    in-memory data and return immediately; the files are written by a
+    background thread. Call stop_write_behind() (or flush()) before exiting.
+
+    Args:
+        delay (float): Seconds to wait for more saves before flushing.
+    """
+    global _writer
+    with locking.lock:
+        if _writer is not None:
+            return
+        transactions.ensure_recovered()
+        _writer = _WriteBehindWriter(delay)
+        _writer.start()
+    # Last resort if the application exits without stopping the writer
+    atexit.register(stop_write_behind)
+
+def stop_write_behind():
+    """
+    Stops the background writer and writes everything still pending.
+    Saves are synchronous again afterwards. Does nothing if not running.
+    """
+    global _writer
+    with locking.lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+    flush()
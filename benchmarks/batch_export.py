@@ -0,0 +1,48 @@
+"""
+Throughput benchmark of the batch PDF export (backend/documents.py):
+the same documents rendered by one worker process vs. one per core,
+through the worker pool of export_batch_pdf().
+
+Run from the project root:
+    python -m benchmarks.batch_export [count] [engine]
+
+The engine defaults to documents.DEFAULT_PDF_ENGINE ('weasyprint' when
+it is installed). On a single-core machine there is nothing to compare.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backend import documents
+from benchmarks.pdf_render import CLIENT, MY_DETAILS, _document
+
+def _export(docs, folder, workers, engine):
+    """Returns the seconds taken to render docs on 'workers' processes."""
+    paths = [os.path.join(folder, f"{workers}-{doc['id']}.pdf") for doc in docs]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=documents._init_export_worker,
+                             initargs=({CLIENT['id']: CLIENT}, MY_DETAILS, engine)) as pool:
+        for success, message in pool.map(documents._export_worker, docs, paths):
+            if not success:
+                raise RuntimeError(message)
+    return time.perf_counter() - start
+
+def main(count=40, engine=documents.DEFAULT_PDF_ENGINE):
+    cores = os.cpu_count() or 1
+    docs = [_document(i) for i in range(count)]
+    with tempfile.TemporaryDirectory() as folder:
+        serial = _export(docs, folder, 1, engine)
+        parallel = _export(docs, folder, cores, engine) if cores > 1 else None
+    print(f"{count} invoices, 12 lines each, '{engine}' engine")
+    print(f"{'1 worker':<12}{serial:>8.2f} s  ({count / serial:.1f} documents/s)")
+    if parallel is None:
+        print("1 core: no parallel run")
+    else:
+        print(f"{f'{cores} workers':<12}{parallel:>8.2f} s  ({count / parallel:.1f} documents/s, "
+              f"{serial / parallel:.1f}x)")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+         sys.argv[2] if len(sys.argv) > 2 else documents.DEFAULT_PDF_ENGINE)
@@ -0,0 +1,88 @@
+"""
+Render-time benchmark: the plain WeasyPrint export (template loaded and
+CSS parsed for every document) vs. the cached render pipeline of
+backend/documents.py (compiled template, pre-parsed CSS, shared fonts
+and cached assets) vs. the ReportLab PDF engine.
+
+Run from the project root:
+    python -m benchmarks.pdf_render [count]
+
+The WeasyPrint rows need WeasyPrint and its GTK libraries: without them
+they are skipped.
+"""
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+from backend import documents
+
+MY_DETAILS = {
+    'name': 'Studio Tecnico Rossi',
+    'address': 'Via Roma 1\n00100 Roma',
+    'vat_id': '01234567890',
+}
+
+CLIENT = {
+    'id': 'c1',
+    'name': 'Mario Bianchi',
+    'company': 'Bianchi S.r.l.',
+    'address': 'Via Milano 2, Torino',
+    'vat_id': '09876543210',
+}
+
+def _document(i):
+    items = [
+        {'description': f"Consulenza tecnica {n}", 'qty': Decimal(n % 5 + 1),
+         'unit_price': Decimal('45.50'), 'total': Decimal(n % 5 + 1) * Decimal('45.50')}
+        for n in range(12)
+    ]
+    totals = documents._calculate_totals(items, Decimal('5'), Decimal('22'), Decimal('20'))
+    return {
+        'id': f"doc-{i}", 'doc_type': 'invoice', 'number': f"F2025/{i:03d}",
+        'date': '2025-03-01', 'due_date': '2025-03-31', 'client_id': 'c1',
+        'items': items, 'notes': 'Pagamento a 30 giorni.', **totals,
+    }
+
+def _render_plain(doc, filepath):
+    """The export as it was before the render pipeline."""
+    template = documents.env.get_template(documents.TEMPLATE_FILE)
+    doc['doc_type_display'] = "FATTURA" if doc['doc_type'] == 'invoice' else "PREVENTIVO"
+    html_out = template.render(doc=doc, client=CLIENT, my_details=MY_DETAILS)
+    documents.HTML(string=html_out).write_pdf(filepath)
+
+def _engine(engine):
+    """Returns a render function using a PDF engine of documents.PDF_ENGINES."""
+    def render(doc, filepath):
+        success, message = documents._render_pdf(doc, CLIENT, MY_DETAILS, filepath, engine)
+        if not success:
+            raise RuntimeError(message)
+    return render
+
+def _measure(render, count, folder):
+    """Returns the mean seconds per document, after one warm-up render."""
+    render(_document(0), os.path.join(folder, 'warmup.pdf'))
+    start = time.perf_counter()
+    for i in range(1, count + 1):
+        render(_document(i), os.path.join(folder, f"{i}.pdf"))
+    return (time.perf_counter() - start) / count
+
+def main(count=20):
+    weasyprint = documents.HTML is not None
+    with tempfile.TemporaryDirectory() as folder:
+        if weasyprint:
+            before = _measure(_render_plain, count, folder)
+            after = _measure(_engine('weasyprint'), count, folder)
+        fast = _measure(_engine('reportlab'), count, folder)
+    print(f"{count} invoices, 12 lines each (mean per document)")
+    if weasyprint:
+        print(f"{'plain':<10}{before * 1000:>10.1f} ms")
+        print(f"{'cached':<10}{after * 1000:>10.1f} ms  ({1 - after / before:.0%} saved)")
+        print(f"{'reportlab':<10}{fast * 1000:>10.1f} ms  ({after / fast:.0f}x faster than cached)")
+    else:
+        print("plain, cached: skipped (WeasyPrint is not available)")
+        print(f"{'reportlab':<10}{fast * 1000:>10.1f} ms")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,72 @@
+"""
+Memory benchmark: plain dict records vs. the compact slotted records
+(backend/records.py), on a large synthetic dataset.
+
+Run from the project root:
+    python -m benchmarks.record_memory [count]
+"""
+import sys
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from backend import records
+
+def _movimento(i):
+    day = date(2025, 1, 1) + timedelta(days=i % 365)
+    netto = Decimal(i % 100000) / 100
+    return {
+        'id': f"mov-{i:08d}",
+        'date': day.isoformat(),
+        'date_ord': day.toordinal(),
+        'type': 'Entrata' if i % 3 else 'Uscita',
+        'description': f"Pagamento fattura F-2025/{i % 1000:03d}",
+        'amount_netto': netto,
+        'amount_iva': netto * Decimal('0.22'),
+        'amount_ritenuta': Decimal('0'),
+        'amount_totale': netto * Decimal('1.22'),
+        'linked_invoice_id': None,
+        'notes': '',
+    }
+
+def _attivita(i):
+    return {
+        'id': f"att-{i:08d}",
+        'data': (date(2025, 1, 1) + timedelta(days=i % 365)).isoformat(),
+        'ore': (i % 16) / 2,
+        'descrizione': 'Sopralluogo e rilievi',
+        'fatturabile': bool(i % 4),
+    }
+
+def _line_item(i):
+    return {
+        'description': 'Consulenza tecnica',
+        'qty': Decimal(i % 10 + 1),
+        'unit_price': Decimal('45.50'),
+        'total': Decimal(i % 10 + 1) * Decimal('45.50'),
+        'articolo_id': None,
+    }
+
+def _measure(build, count):
+    """Returns the bytes allocated by a list of 'count' records, kept alive."""
+    tracemalloc.start()
+    data = [build(i) for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+def main(count=200000):
+    print(f"{count} records per kind (tracemalloc, values included)")
+    print(f"{'kind':<12}{'dict MB':>10}{'slots MB':>10}{'saved':>8}")
+    for name, make, record_class in (
+        ('Movimento', _movimento, records.Movimento),
+        ('Attivita', _attivita, records.Attivita),
+        ('LineItem', _line_item, records.LineItem),
+    ):
+        before = _measure(make, count)
+        after = _measure(lambda i: record_class(make(i)), count)
+        print(f"{name:<12}{before / 2**20:>10.1f}{after / 2**20:>10.1f}{1 - after / before:>8.0%}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -141,10 +141,10 @@ class PaginaCalendario(PageBase):
                     
                     ctk.CTkLabel(frame_evento, text=testo_evento, anchor="w").grid(row=0, column=0, sticky="w")
                     
-                    # Add a 'Delete' button only for 'manual' events
-                    if event['type'] == 'manuale':
+                    # Add a 'Delete' button only for user-created events
+                    if event['type'] in db_calendario.TIPI_EVENTO_MANUALE:
                         btn_del = ctk.CTkButton(frame_evento, text="X", width=30, fg_color="#D32F2F", hover_color="#B71C1C",
-                                                command=lambda id=event['id']: self.elimina_evento_manuale(id))
+                                                command=lambda ev=event: self.elimina_evento_manuale(ev))
                         btn_del.grid(row=0, column=1, padx=(5,0))
             
         except Exception as e:
@@ -157,7 +157,7 @@ class PaginaCalendario(PageBase):
         """
         try:
             count, msg = db_calendario.generate_scadenze_automatiche()
-            tkmb.showinfo("Successo", f"{msg} ({count} eventi generati)")
+            tkmb.showinfo("Successo", f"{msg} ({count} eventi aggiornati)")
             self.aggiorna_vista_eventi(7) # Refresh the view
         except Exception as e:
             tkmb.showerror("Errore", f"Impossibile aggiornare scadenze: {e}")
@@ -166,7 +166,7 @@ class PaginaCalendario(PageBase):
         """Opens a modal Toplevel window to add a new manual event."""
         popup = ctk.CTkToplevel(self)
         popup.title("Aggiungi Evento Manuale")
-        popup.geometry("400x250")
+        popup.geometry("400x360")
         
         ctk.CTkLabel(popup, text="Data (YYYY-MM-DD):").pack(pady=(10,0))
         entry_data = ctk.CTkEntry(popup, width=300)
@@ -180,12 +180,20 @@ class PaginaCalendario(PageBase):
         ctk.CTkLabel(popup, text="Descrizione:").pack(pady=(10,0))
         entry_desc = ctk.CTkEntry(popup, width=300)
         entry_desc.pack(pady=5, padx=10, fill="x")
+
+        # Recurrence: the labels shown, mapped to the backend frequencies
+        frequenze = {"Nessuna": None, "Ogni giorno": "daily", "Ogni settimana": "weekly",
+                     "Ogni mese": "monthly", "Ogni anno": "yearly"}
+        ctk.CTkLabel(popup, text="Ripetizione:").pack(pady=(10,0))
+        option_frequenza = ctk.CTkOptionMenu(popup, values=list(frequenze))
+        option_frequenza.pack(pady=5, padx=10, fill="x")
         
         def salva_evento():
             """Nested callback to validate and save the new manual event."""
             data = entry_data.get()
             titolo = entry_titolo.get()
             desc = entry_desc.get()
+            frequenza = frequenze[option_frequenza.get()]
             
             # Basic validation
             if not data or not titolo:
@@ -194,7 +202,7 @@ class PaginaCalendario(PageBase):
             
             try:
                 # Call backend to create the event
-                success, msg = db_calendario.create_evento_manuale(data, titolo, desc)
+                success, msg = db_calendario.create_evento_manuale(data, titolo, desc, frequenza=frequenza)
                 if success:
                     tkmb.showinfo("Successo", msg, parent=popup)
                     popup.destroy()
@@ -210,32 +218,35 @@ class PaginaCalendario(PageBase):
         popup.grab_set() # Make modal
         self.wait_window(popup) # Wait until popup is closed
 
-    def elimina_evento_manuale(self, event_id):
+    def elimina_evento_manuale(self, event):
         """
         Deletes a manual event from the calendar after confirmation.
+        For a recurring event, the user chooses between the single
+        occurrence and the whole series.
         
         Args:
-            event_id (str): The ID of the event to delete.
+            event (dict): The event (or occurrence) to delete.
         """
-        if not tkmb.askyesno("Conferma", "Vuoi eliminare questo evento manuale?"):
-            return
-        
         try:
-            # --- Deletion Logic ---
-            # This logic ideally belongs in the backend (e.g., db_calendario.delete_evento)
-            # For now, it's implemented directly here by manipulating the raw DB file.
-            events = db.load_data(db.CALENDARIO_DB)
-            # Create a new list excluding the event to be deleted
-            new_events = [e for e in events if not (e.get('id') == event_id and e.get('type') == 'manuale')]
-            
-            if len(new_events) < len(events):
-                # If an event was removed, save the new list
-                db.save_data(db.CALENDARIO_DB, new_events)
+            if event['type'] == 'ricorrente':
+                scelta = tkmb.askyesnocancel("Conferma", "Evento ricorrente: eliminare l'intera serie?\n"
+                                                         "(No = elimina solo questa occorrenza)")
+                if scelta is None:
+                    return
+                if scelta:
+                    success, msg = db_calendario.delete_evento_manuale(event['id'])
+                else:
+                    success, msg = db_calendario.salta_occorrenza(event['id'], event['date'])
+            else:
+                if not tkmb.askyesno("Conferma", "Vuoi eliminare questo evento manuale?"):
+                    return
+                success, msg = db_calendario.delete_evento_manuale(event['id'])
+
+            if success:
                 tkmb.showinfo("Successo", "Evento manuale eliminato.")
                 self.on_show() # Refresh the view
             else:
                 tkmb.showwarning("Errore", "Evento non trovato o non manuale.")
-            # --- End Deletion Logic ---
         except Exception as e:
             tkmb.showerror("Errore", f"Impossibile eliminare l'evento: {e}")
 
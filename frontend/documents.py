@@ -3,6 +3,7 @@ import tkinter.messagebox as tkmb
 import customtkinter as ctk
 from decimal import Decimal, InvalidOperation
 import os
+import threading
 
 # Import backend logic
 from backend import documents as db_docs
@@ -34,6 +35,15 @@ class PaginaDocumenti(PageBase):
         self.grid_columnconfigure(0, weight=1)
         
         ctk.CTkLabel(self, text="Gestione Documenti", font=ctk.CTkFont(size=24, weight="bold")).grid(row=0, column=0, padx=10, pady=10, sticky="w")
+
+        # PDF engine selector (saved in settings)
+        frame_motore = ctk.CTkFrame(self, fg_color="transparent")
+        frame_motore.grid(row=0, column=0, padx=10, pady=10, sticky="e")
+        ctk.CTkLabel(frame_motore, text="Motore PDF:").pack(side="left", padx=5)
+        self.option_motore_pdf = ctk.CTkOptionMenu(frame_motore, values=list(db_docs.PDF_ENGINES),
+                                                   command=self.cambia_motore_pdf)
+        self.option_motore_pdf.set(db_docs.get_pdf_engine())
+        self.option_motore_pdf.pack(side="left", padx=5)
         
         # Main TabView to separate Quotes and Invoices
         self.tab_view = ctk.CTkTabview(self)
@@ -60,6 +70,16 @@ class PaginaDocumenti(PageBase):
         self.aggiorna_lista_documenti("quote")
         self.aggiorna_lista_documenti("invoice")
 
+    def cambia_motore_pdf(self, motore):
+        """
+        Saves the PDF engine chosen in the selector.
+        'reportlab' needs no GTK, 'weasyprint' follows the HTML template exactly.
+        """
+        try:
+            db_docs.set_pdf_engine(motore)
+        except ValueError as e:
+            tkmb.showerror("Errore", str(e))
+
     def _crea_widgets_tab_documenti(self, tab, doc_type):
         """
         Helper method to populate a given tab (Preventivi or Fatture) 
@@ -95,6 +115,10 @@ class PaginaDocumenti(PageBase):
         btn_esporta = ctk.CTkButton(frame_azioni, text="Esporta PDF Selezionato",
                                     command=lambda dt=doc_type: self.esporta_pdf_selezionato(dt))
         btn_esporta.pack(side="left", padx=5)
+
+        btn_esporta_anno = ctk.CTkButton(frame_azioni, text="Esporta PDF Anno",
+                                         command=lambda dt=doc_type: self.esporta_pdf_anno(dt))
+        btn_esporta_anno.pack(side="left", padx=5)
         
         # --- Scrollable List ---
         frame_scroll = ctk.CTkScrollableFrame(tab)
@@ -214,6 +238,71 @@ class PaginaDocumenti(PageBase):
         except Exception as e:
             tkmb.showerror("Errore Critico", f"Errore imprevisto durante l'esportazione PDF:\n{e}")
 
+    def esporta_pdf_anno(self, doc_type):
+        """
+        Exports all the documents of a year (of the active tab) to PDF,
+        rendering them in parallel, in a worker thread: a progress bar
+        follows the export and the result is shown at the end.
+        
+        Args:
+            doc_type (str): 'quote' or 'invoice'.
+        """
+        dialog = ctk.CTkInputDialog(text="Anno da esportare (YYYY):", title="Esporta PDF Anno")
+        anno = dialog.get_input()
+        if not anno:
+            return
+        try:
+            anno = int(anno)
+        except ValueError:
+            tkmb.showwarning("Dato Errato", "Inserisci un anno valido (es. 2025).")
+            return
+
+        # The export runs in a worker thread, so the window keeps responding:
+        # the thread hands the progress and the result to the Tk loop with after()
+        finestra = ctk.CTkToplevel(self)
+        finestra.title("Esporta PDF Anno")
+        finestra.geometry("400x120")
+        finestra.transient(self)
+        finestra.grab_set()
+        finestra.protocol("WM_DELETE_WINDOW", lambda: None) # Closed when the export ends
+        etichetta = ctk.CTkLabel(finestra, text=f"Generazione PDF del {anno}...")
+        etichetta.pack(padx=20, pady=(20, 10))
+        barra = ctk.CTkProgressBar(finestra)
+        barra.set(0)
+        barra.pack(padx=20, pady=10, fill="x")
+
+        def aggiorna(fatti, totale):
+            barra.set(fatti / totale)
+            etichetta.configure(text=f"Generazione PDF: {fatti}/{totale}")
+
+        def fine(esportati, errori, errore=None):
+            finestra.destroy()
+            if errore is not None:
+                tkmb.showerror("Errore Critico", f"Errore imprevisto durante l'esportazione PDF:\n{errore}")
+                return
+            if not esportati and not errori:
+                tkmb.showinfo("Nessun Documento", f"Nessun documento trovato per il {anno}.")
+                return
+            messaggio = f"{len(esportati)} PDF generati in:\n{os.path.abspath(db_docs.PDF_EXPORT_DIR)}"
+            if errori:
+                messaggio += f"\n\n{len(errori)} errori, ad esempio:\n{errori[0][1]}"
+                tkmb.showwarning("Esportazione Completata con Errori", messaggio)
+            else:
+                tkmb.showinfo("Successo", messaggio)
+
+        def esporta():
+            try:
+                # Call backend function
+                esportati, errori = db_docs.export_batch_pdf(
+                    doc_type=doc_type, year=anno,
+                    progress=lambda fatti, totale: self.after(0, aggiorna, fatti, totale))
+            except Exception as e:
+                self.after(0, fine, None, None, e)
+            else:
+                self.after(0, fine, esportati, errori)
+
+        threading.Thread(target=esporta, daemon=True).start()
+
     # --- Popup Windows for Actions ---
     
     def apri_popup_documento(self, doc_type, quote_data=None):
@@ -121,6 +121,14 @@ class App(ctk.CTk):
 
         self.select_frame_by_name("dashboard")
 
+        # Closing the window must also write out the pending saves
+        self.protocol("WM_DELETE_WINDOW", self.quit)
+
+    def quit(self):
+        # Saves run in the background: wait for them before leaving
+        db.stop_write_behind()
+        super().quit()
+
     def select_frame_by_name(self, name):
         for btn_name, btn in self.buttons.items():
             btn.configure(fg_color="transparent")
@@ -145,5 +153,8 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Errore aggiornamento scadenze: {e}")
 
+    # Saves from the GUI are written in the background from now on
+    db.start_write_behind()
+
     app = App()
     app.mainloop()
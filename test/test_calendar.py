@@ -0,0 +1,204 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+# --- Module Import Handling ---
+try:
+    from .. import calendar
+    from .. import persistence as db
+    from .. import projects as db_progetti
+except ImportError:
+    import calendar
+    import persistence as db
+    import projects as db_progetti
+
+class TestScadenzeAutomatiche(unittest.TestCase):
+    """
+    Test suite for the automatic deadlines kept in step with the
+    projects and invoices.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+
+    def tearDown(self):
+        db.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def _auto_events(self):
+        """Returns the automatic events as {id: date}."""
+        return {e['id']: e['date'] for e in db.load_data(db.CALENDARIO_DB) if e['type'] != 'manuale'}
+
+    def test_incremental_updates_keep_ids(self):
+        """
+        Tests that project changes update only the events derived from
+        them, and that an event keeps its id across updates.
+        """
+        # 1. Setup
+        db.insert_record(db.PROGETTI_DB, {'id': 'p1', 'name': 'Villa', 'status': 'In corso', 'fasi': [
+            {'id': 'f1', 'nome': 'Rilievo', 'scadenza': '2025-03-01', 'completata': False},
+            {'id': 'f2', 'nome': 'Progetto', 'scadenza': '2025-04-01', 'completata': False},
+        ]})
+        calendar.create_evento_manuale('2025-03-02', 'Riunione', '')
+        first = self._auto_events()
+
+        # 2. Execute
+        project = db_progetti.find_project_by_id('p1')
+        project['fasi'][1]['scadenza'] = '2025-05-01'
+        db_progetti.update_project('p1', {'fasi': project['fasi']})
+        db_progetti.toggle_fase_status('p1', 'f1')
+
+        # 3. Assertions
+        self.assertEqual(len(first), 2)
+        fase2_id = calendar._auto_event_id('auto_project', 'p1', 'f2')
+        self.assertEqual(self._auto_events(), {fase2_id: '2025-05-01'})
+        self.assertEqual(len(db.query_data(db.CALENDARIO_DB, type='manuale')), 1)
+
+    def test_generate_rescans_only_when_needed(self):
+        """
+        Tests that a full scan replaces events with random ids, and that a
+        new process doesn't rescan data that didn't change since.
+        """
+        # 1. Setup
+        db.save_data(db.CALENDARIO_DB, [{'id': 'legacy', 'date': '2025-03-01', 'title': '',
+                                         'description': '', 'type': 'auto_project', 'source_id': 'p1'}])
+        db.save_data(db.PROGETTI_DB, [{'id': 'p1', 'name': 'Villa', 'status': 'In corso', 'fasi': [
+            {'id': 'f1', 'nome': 'Rilievo', 'scadenza': '2025-03-01', 'completata': False}
+        ]}])
+        db.invalidate_cache()
+
+        # 2. Execute
+        count, _ = calendar.generate_scadenze_automatiche()
+        calendar._synced.clear() # As if in a new process
+        with patch.object(calendar, '_rescan_source') as mock_rescan:
+            calendar.generate_scadenze_automatiche()
+
+        # 3. Assertions
+        # The stable event was added when the project was saved: the scan removes 'legacy'
+        self.assertEqual(count, 1)
+        self.assertEqual(list(self._auto_events()), [calendar._auto_event_id('auto_project', 'p1', 'f1')])
+        mock_rescan.assert_not_called()
+
+    def test_invoice_without_totals(self):
+        """
+        Tests that an unpaid invoice whose totals are None still gets its
+        payment deadline, with a zero total.
+        """
+        # 1. Execute
+        db.insert_record(db.DOCUMENTI_DB, {'id': 'd1', 'doc_type': 'invoice', 'number': 'F2025/001',
+                                           'client_id': 'c1', 'status': 'In sospeso', 'due_date': '2025-03-31',
+                                           'total_da_pagare': None, 'total': None})
+
+        # 2. Assertions
+        event = db.find_record(db.CALENDARIO_DB, calendar._auto_event_id('auto_invoice', 'd1'))
+        self.assertEqual(event['date'], '2025-03-31')
+        self.assertIn("Total: 0.00 €", event['description'])
+
+class TestDateIndex(unittest.TestCase):
+    """
+    Test suite for the date index answering the calendar range queries.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+
+    def tearDown(self):
+        db.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_range_queries_follow_changes(self):
+        """
+        Tests that range queries return the events of the range sorted by
+        date, and that the index follows inserts, updates and deletes.
+        """
+        # 1. Setup
+        for day in ('2025-03-10', '2025-03-01', '2025-03-05', '2025-04-01'):
+            calendar.create_evento_manuale(day, f"Evento {day}", '')
+        ids = {e['date']: e['id'] for e in db.load_data(db.CALENDARIO_DB)}
+        first = calendar.get_eventi(date(2025, 3, 1), date(2025, 3, 10))
+
+        # 2. Execute
+        db.update_record(db.CALENDARIO_DB, ids['2025-04-01'], {'date': '2025-03-05'})
+        db.delete_record(db.CALENDARIO_DB, ids['2025-03-10'])
+        calendar.create_evento_manuale('2025-03-02', 'Nuovo', '')
+
+        # 3. Assertions
+        self.assertEqual([e['date'] for e in first], ['2025-03-01', '2025-03-05', '2025-03-10'])
+        self.assertEqual(
+            [e['date'] for e in calendar.get_eventi(date(2025, 3, 1), date(2025, 3, 31))],
+            ['2025-03-01', '2025-03-02', '2025-03-05', '2025-03-05']
+        )
+        self.assertEqual(calendar.get_eventi(date(2025, 4, 1), date(2025, 4, 30)), [])
+        self.assertEqual(calendar.count_eventi_per_giorno(date(2025, 3, 2), date(2025, 3, 31)),
+                         {date(2025, 3, 2): 1, date(2025, 3, 5): 2})
+
+class TestRecurringEvents(unittest.TestCase):
+    """
+    Test suite for the recurring events, stored once and expanded
+    within the requested range.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+
+    def tearDown(self):
+        db.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_monthly_with_exceptions_and_end(self):
+        """
+        Tests the monthly expansion (clamped to the end of short months),
+        the skipped occurrences and the end date.
+        """
+        # 1. Setup
+        ok, _ = calendar.create_evento_manuale('2025-01-31', 'Chiusura mese', '', frequenza='monthly', fino_al='2025-06-30')
+        event_id = db.load_data(db.CALENDARIO_DB)[0]['id']
+
+        # 2. Execute
+        skipped, _ = calendar.salta_occorrenza(event_id, '2025-04-30')
+        not_an_occurrence, _ = calendar.salta_occorrenza(event_id, '2025-04-29')
+        eventi = calendar.get_eventi(date(2025, 2, 1), date(2025, 12, 31))
+
+        # 3. Assertions
+        self.assertTrue(ok and skipped)
+        self.assertFalse(not_an_occurrence)
+        self.assertEqual([e['date'] for e in eventi], ['2025-02-28', '2025-03-31', '2025-05-31', '2025-06-30'])
+        self.assertTrue(all(e['id'] == event_id for e in eventi))
+        self.assertEqual(len(db.load_data(db.CALENDARIO_DB)), 1)
+
+    def test_weekly_merged_with_single_events(self):
+        """
+        Tests that occurrences are merged in date order with one-off
+        events, counted per day, and only generated within the range.
+        """
+        # 1. Setup
+        calendar.create_evento_manuale('2020-01-06', 'Call cliente', '', frequenza='weekly', intervallo=2)
+        calendar.create_evento_manuale('2025-03-05', 'Consegna', '')
+
+        # 2. Execute
+        eventi = calendar.get_eventi(date(2025, 3, 1), date(2025, 3, 31))
+        counts = calendar.count_eventi_per_giorno(date(2025, 3, 1), date(2025, 3, 31))
+
+        # 3. Assertions
+        # Every other Monday from 2020-01-06: 2025-03-10 is one of them
+        self.assertEqual([e['date'] for e in eventi], ['2025-03-05', '2025-03-10', '2025-03-24'])
+        self.assertEqual(sum(counts.values()), 3)
+        bad_frequency, _ = calendar.create_evento_manuale('2025-03-05', 'X', '', frequenza='hourly')
+        self.assertFalse(bad_frequency)
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
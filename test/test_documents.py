@@ -1,7 +1,14 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, ANY
 from decimal import Decimal
 
+try:
+    from pypdf import PdfReader # To read back the rendered PDFs
+except ImportError:
+    PdfReader = None
+
 # --- Module Import Handling ---
 # This allows tests to run whether the 'Test' folder is treated
 # as a package (e.g., 'python -m unittest') or as a simple script.
@@ -63,25 +70,22 @@ class TestDocuments(unittest.TestCase):
         self.assertEqual(totals['ritenuta_amount'], Decimal('36.00'))
         self.assertEqual(totals['total_da_pagare'], Decimal('183.60'))
 
-    @patch('documents.db.save_data')
+    @patch('documents.db.transaction')
     @patch('documents.db_magazzino.update_stock')
     @patch('documents.db_rubrica.find_contact_by_id')
-    @patch('documents.db.get_next_document_number')
-    @patch('documents.db.load_data')
     def test_create_invoice_updates_stock(
-        self, mock_load_data, mock_get_next_num, mock_find_client, 
-        mock_update_stock, mock_save_data
+        self, mock_find_client, mock_update_stock, mock_transaction
     ):
         """
         Tests the interaction between 'documents' and 'inventory'.
         Verifies that creating an invoice successfully calls 'update_stock'
-        with the correct (negative) quantity.
+        with the correct (negative) quantity, in the same transaction
+        as the invoice itself.
         """
         # 1. Setup Mocks
-        # Simulate an empty database to start
-        mock_load_data.return_value = []
+        mock_tx = mock_transaction.return_value.__enter__.return_value
         # Provide a document number
-        mock_get_next_num.return_value = "F2025/001"
+        mock_tx.get_next_document_number.return_value = "F2025/001"
         # Simulate a valid client
         mock_find_client.return_value = {'id': 'client1', 'name': 'Test Client'}
         # Simulate a successful stock update
@@ -113,16 +117,16 @@ class TestDocuments(unittest.TestCase):
         
         # Critical: Verify that update_stock was called EXACTLY once,
         # with the item ID and a NEGATIVE quantity.
-        mock_update_stock.assert_called_once_with('item_id_123', Decimal('-2'))
+        mock_update_stock.assert_called_once_with('item_id_123', Decimal('-2'), tx=mock_tx)
         
-        # Verify that the new invoice was saved to the database
-        mock_save_data.assert_called_once_with(db.DOCUMENTI_DB, [invoice])
+        # Verify that the new invoice was appended to the database
+        mock_tx.insert_record.assert_called_once_with(db.DOCUMENTI_DB, invoice)
 
-    @patch('documents.db.save_data')
+    @patch('documents.db.transaction')
     @patch('documents.db_magazzino.update_stock')
     @patch('documents.db_rubrica.find_contact_by_id')
     def test_create_invoice_fails_on_stock_error(
-        self, mock_find_client, mock_update_stock, mock_save_data
+        self, mock_find_client, mock_update_stock, mock_transaction
     ):
         """
         Tests the "sad path" (failure case).
@@ -130,6 +134,7 @@ class TestDocuments(unittest.TestCase):
         if the inventory 'update_stock' function reports a failure.
         """
         # 1. Setup Mocks
+        mock_tx = mock_transaction.return_value.__enter__.return_value
         # Simulate a valid client
         mock_find_client.return_value = {'id': 'client1', 'name': 'Test Client'}
         # Simulate a FAILED stock update (e.g., insufficient stock)
@@ -149,8 +154,412 @@ class TestDocuments(unittest.TestCase):
         # Check that the exception message contains the stock error
         self.assertIn("Stock update failed", str(context.exception))
         
-        # Critical: Verify that NO data was saved to the database
-        mock_save_data.assert_not_called()
+        # Critical: Verify that NO data was saved to the database,
+        # and that the error went through the transaction (rollback)
+        mock_tx.insert_record.assert_not_called()
+        exc_type = mock_transaction.return_value.__exit__.call_args[0][0]
+        self.assertIs(exc_type, ValueError)
+
+class TestBatchExport(unittest.TestCase):
+    """
+    Test suite for the batch PDF export.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+        # A minimal template, loaded from the working directory
+        with open('invoice_template.html', 'w') as f:
+            f.write("<html><body>{{ doc.doc_type_display }} {{ doc.number }} {{ client.name }}</body></html>")
+        db.insert_record(db.RUBRICA_DB, {'id': 'c1', 'name': 'Rossi'})
+        for i, (year, status) in enumerate([(2024, 'Pagato'), (2025, 'Pagato'), (2025, 'In sospeso'), (2025, 'Pagato')]):
+            db.insert_record(db.DOCUMENTI_DB, {
+                'id': f"d{i}", 'doc_type': 'invoice', 'number': f"F{year}/{i:03d}", 'date': f"{year}-05-01",
+                'status': status, 'client_id': 'c1' if i < 3 else 'missing', 'items': []
+            })
+
+    def tearDown(self):
+        db.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_batch_filters_and_progress(self):
+        """
+        Tests that only the selected documents are exported, with the
+        usual filenames, and that progress and errors are reported.
+        """
+        # 1. Setup
+        progress = []
+
+        # 2. Execute
+        exported, errors = documents.export_batch_pdf(
+            doc_type='invoice', year=2025, status='Pagato', max_workers=1,
+            progress=lambda done, total: progress.append((done, total))
+        )
+
+        # 3. Assertions
+        self.assertEqual(exported, [os.path.join(documents.PDF_EXPORT_DIR, 'F2025-001_invoice.pdf')])
+        self.assertEqual(errors, [('d3', "Associated client not found.")])
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    def test_batch_on_process_pool(self):
+        """
+        Tests that documents rendered by worker processes are written
+        like export_to_pdf() writes them.
+        """
+        # 1. Setup & 2. Execute
+        exported, errors = documents.export_batch_pdf(doc_ids=['d0', 'd1', 'd2'], max_workers=2)
+
+        # 3. Assertions
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(os.path.basename(path) for path in exported),
+                         ['F2024-000_invoice.pdf', 'F2025-001_invoice.pdf', 'F2025-002_invoice.pdf'])
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in exported))
+
+    def test_unchanged_documents_are_not_rendered_again(self):
+        """
+        Tests that exporting again returns the existing PDF, unless the
+        document, the client or the template changed.
+        """
+        # 1. Setup
+        render = patch.object(documents, '_render_pdf', wraps=documents._render_pdf)
+
+        # 2. Execute
+        with render as mock_render:
+            documents.export_to_pdf('d1')
+            documents.export_batch_pdf(doc_ids=['d1', 'd2'], max_workers=1) # Only d2 is new
+            documents.export_to_pdf('d1')
+            db.update_record(db.RUBRICA_DB, 'c1', {'name': 'Rossi S.r.l.'})
+            documents.export_to_pdf('d1')
+            with open('invoice_template.html', 'a') as f:
+                f.write("<!-- v2 -->")
+            success, path = documents.export_to_pdf('d1')
+            documents.export_to_pdf('d1', force=True)
+
+        # 3. Assertions
+        self.assertTrue(success)
+        self.assertEqual(path, os.path.join(documents.PDF_EXPORT_DIR, 'F2025-001_invoice.pdf'))
+        rendered = [call.args[0]['id'] for call in mock_render.call_args_list]
+        self.assertEqual(rendered, ['d1', 'd2', 'd1', 'd1', 'd1'])
+
+    def test_pdf_engine_from_settings(self):
+        """
+        Tests that documents are rendered with the PDF engine chosen in
+        settings, and that changing engine renders them again.
+        """
+        # 1. Setup
+        def write_pdf(doc, client, my_details, filepath):
+            with open(filepath, 'wb') as f:
+                f.write(b'%PDF')
+        engines = {name: MagicMock(side_effect=write_pdf) for name in documents.PDF_ENGINES}
+
+        # 2. Execute
+        with patch.dict(documents.PDF_ENGINES, engines):
+            documents.set_pdf_engine('reportlab')
+            documents.export_to_pdf('d1')
+            documents.export_to_pdf('d1') # Up to date
+            documents.set_pdf_engine('weasyprint')
+            documents.export_to_pdf('d1')
+
+        # 3. Assertions
+        self.assertEqual(engines['reportlab'].call_count, 1)
+        self.assertEqual(engines['weasyprint'].call_count, 1)
+        self.assertEqual(documents.get_pdf_engine(), 'weasyprint')
+        with self.assertRaises(ValueError):
+            documents.set_pdf_engine('unknown')
+
+@unittest.skipIf(PdfReader is None, "pypdf is not installed")
+class TestReportLabEngine(unittest.TestCase):
+    """
+    Test suite for the ReportLab PDF engine, rendering real PDFs.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp_dir.name, 'doc.pdf')
+        self.client = {'name': 'Mario Rossi', 'company': 'Rossi S.r.l.', 'address': 'Via Roma 1', 'vat_id': '123'}
+        self.my_details = {'name': 'Studio Bianchi', 'address': 'Via Milano 2\nTorino', 'vat_id': '456'}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _render_text(self, doc):
+        """Renders a document with ReportLab and returns the text of its pages."""
+        success, path = documents._render_pdf(doc, self.client, self.my_details, self.filepath, 'reportlab')
+        self.assertTrue(success, path)
+        return "\n".join(page.extract_text() for page in PdfReader(path).pages)
+
+    def test_invoice_layout(self):
+        """
+        Tests that an invoice is drawn with the header, the line items
+        (escaped) and the totals of the template.
+        """
+        # 1. Setup: the totals of test_calculate_totals_complex
+        items = [{'description': 'Rilievo <A&B>', 'qty': Decimal('2'), 'unit_price': Decimal('50')},
+                 {'description': 'Progetto', 'qty': Decimal('1'), 'unit_price': Decimal('100')}]
+        doc = {'doc_type': 'invoice', 'number': 'F2025/001', 'date': '2025-03-01', 'due_date': '2025-03-31',
+               'notes': 'Bonifico\na 30 giorni', 'items': items,
+               **documents._calculate_totals(items, Decimal('10'), Decimal('22'), Decimal('20'))}
+
+        # 2. Execute
+        text = self._render_text(doc)
+
+        # 3. Assertions
+        for expected in ["Studio Bianchi", "Spett.le", "Rossi S.r.l.", "FATTURA", "Numero: F2025/001",
+                         "Scadenza: 2025-03-31", "Rilievo <A&B>", "100.00 €", "Ritenuta (20 %)",
+                         "-36.00 €", "TOTALE DA PAGARE", "183.60 €", "Bonifico"]:
+            self.assertIn(expected, text)
+
+    def test_missing_totals_render_as_zero(self):
+        """
+        Tests that a quote without totals is still rendered, with zero amounts.
+        """
+        # 1. Execute
+        text = self._render_text({'doc_type': 'quote', 'number': 'P2025/001', 'items': []})
+
+        # 2. Assertions
+        self.assertIn("PREVENTIVO", text)
+        self.assertNotIn("Scadenza", text)
+        self.assertIn("TOTALE DA PAGARE", text)
+        self.assertIn("0.00 €", text)
+
+class TestRenderPipeline(unittest.TestCase):
+    """
+    Test suite for the cached template and stylesheets of the PDF export.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        documents._pipeline = None
+
+    def tearDown(self):
+        documents._pipeline = None
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def _write_template(self, body):
+        with open('invoice_template.html', 'w') as f:
+            f.write("<html><head><style>h1 { color: red; }</style></head>"
+                    f"<body>{body}</body></html>")
+
+    @patch.object(documents, 'CSS')
+    def test_template_and_css_prepared_once(self, mock_css):
+        """
+        Tests that the CSS is parsed once and taken out of the HTML, and
+        that the template is prepared again only when its file changes.
+        """
+        # 1. Setup
+        self._write_template("{{ doc.number }}")
+
+        # 2. Execute
+        template, stylesheets = documents._render_pipeline()
+        again, _ = documents._render_pipeline()
+        html_out = template.render(doc={'number': 'F2025/001'})
+
+        # 3. Assertions
+        self.assertIs(again, template)
+        self.assertEqual(stylesheets, [mock_css.return_value])
+        self.assertEqual(mock_css.call_count, 1)
+        self.assertIn("h1 { color: red; }", mock_css.call_args.kwargs['string'])
+        self.assertNotIn("<style>", html_out)
+        self.assertIn("F2025/001", html_out)
+
+        # A changed template is compiled again
+        self._write_template("Numero {{ doc.number }}")
+        template, _ = documents._render_pipeline()
+        self.assertIn("Numero F2025/001", template.render(doc={'number': 'F2025/001'}))
+        self.assertEqual(mock_css.call_count, 2)
+
+    @unittest.skipIf(documents.HTML is None or PdfReader is None, "WeasyPrint or pypdf not installed")
+    def test_assets_fetched_once(self):
+        """
+        Tests with real WeasyPrint renders that an asset of the template
+        is fetched once, and again only when its file changes.
+        """
+        # 1. Setup
+        documents._asset_cache.clear()
+        self._write_template('<img src="logo.svg"><h1>{{ doc.number }}</h1>')
+        with open('logo.svg', 'w') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>')
+        doc = {'doc_type': 'invoice', 'number': 'F2025/001', 'items': []}
+
+        # 2. Execute
+        for name in ('1.pdf', '2.pdf'):
+            success, path = documents._render_pdf(dict(doc), {}, {}, name, 'weasyprint')
+            self.assertTrue(success, path)
+
+        # 3. Assertions
+        logo_keys = [key for key in documents._asset_cache if key[0].endswith('/logo.svg')]
+        self.assertEqual(len(logo_keys), 1)
+        self.assertIn("F2025/001", PdfReader('2.pdf').pages[0].extract_text())
+
+        # A changed asset is fetched again
+        os.utime('logo.svg', ns=(0, 0))
+        documents._render_pdf(dict(doc), {}, {}, '3.pdf', 'weasyprint')
+        logo_keys = [key for key in documents._asset_cache if key[0].endswith('/logo.svg')]
+        self.assertEqual(len(logo_keys), 2)
+
+class TestLargeDocuments(unittest.TestCase):
+    """
+    Test suite for the page groups of documents with many line items.
+    """
+
+    @patch.object(documents, 'PAGES_PER_GROUP', 2)
+    @patch.object(documents, 'ITEMS_PER_PAGE', 3)
+    @patch.object(documents, 'ITEMS_FIRST_PAGE', 2)
+    def test_pages_and_running_subtotals(self):
+        """
+        Tests that the items are split into pages (fewer on the first
+        one), grouped into parts, with exact carried and running subtotals.
+        """
+        # 1. Setup: 10 items of 0.10 -> pages of 2, 3, 3, 2 items
+        items = [{'description': f"Voce {i}", 'total': Decimal('0.10')} for i in range(10)]
+
+        # 2. Execute
+        with patch.object(documents, 'PdfWriter', MagicMock()):
+            parts = list(documents._item_parts(items))
+        with patch.object(documents, 'PdfWriter', None):
+            single = list(documents._item_parts(items))
+
+        # 3. Assertions
+        self.assertEqual([(part['first'], part['last']) for part in parts], [(True, False), (False, True)])
+        pages = [page for part in parts for page in part['pages']]
+        self.assertEqual([page['number'] for page in pages], [1, 2, 3, 4])
+        self.assertEqual([len(page['items']) for page in pages], [2, 3, 3, 2])
+        self.assertEqual([page['carried'] for page in pages],
+                         [Decimal('0'), Decimal('0.2'), Decimal('0.5'), Decimal('0.8')])
+        self.assertEqual([page['running'] for page in pages],
+                         [Decimal('0.2'), Decimal('0.5'), Decimal('0.8'), Decimal('1')])
+        self.assertEqual(pages[-1]['subtotal'], Decimal('0.2'))
+        # Without pypdf, a single part
+        self.assertEqual(len(single), 1)
+        self.assertEqual(len(single[0]['pages']), 4)
+
+    def _large_document(self):
+        """Returns an invoice with LARGE_DOCUMENT_ITEMS line items of 1.00."""
+        items = [{'description': f"Voce {i}", 'qty': Decimal('1'), 'unit_price': Decimal('1'),
+                  'total': Decimal('1')} for i in range(documents.LARGE_DOCUMENT_ITEMS)]
+        return {'doc_type': 'invoice', 'number': 'F2025/001', 'date': '2025-03-01', 'due_date': '2025-03-31',
+                'notes': '', 'items': items,
+                **documents._calculate_totals(items, Decimal('0'), Decimal('22'), Decimal('0'))}
+
+    @unittest.skipIf(PdfReader is None, "pypdf is not installed")
+    def test_render_large_document(self):
+        """
+        Tests that a large document is rendered in parts joined into one
+        valid PDF, with the carried and running subtotals on its pages,
+        and that no part file is left behind.
+        """
+        # 1. Setup: 15 items on the first page, then pages of 25, in parts of 20 pages
+        doc = self._large_document()
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, 'doc.pdf')
+
+            # 2. Execute
+            success, msg = documents._render_pdf(doc, {'name': 'Rossi'}, {'name': 'Bianchi'}, filepath, 'reportlab')
+
+            # 3. Assertions
+            self.assertTrue(success, msg)
+            self.assertEqual(os.listdir(folder), ['doc.pdf'])
+            pages = [page.extract_text() for page in PdfReader(filepath, strict=True).pages]
+        pages_count = 1 + -(-(documents.LARGE_DOCUMENT_ITEMS - documents.ITEMS_FIRST_PAGE) // documents.ITEMS_PER_PAGE)
+        self.assertGreater(pages_count, documents.PAGES_PER_GROUP) # More than one part
+        self.assertEqual(len(pages), pages_count)
+        self.assertIn("Spett.le", pages[0])
+        self.assertNotIn("Riporto", pages[0])
+        self.assertIn("Riporto", pages[1])
+        self.assertIn("15.00 €", pages[1]) # Carried from the first page
+        self.assertIn("DESCRIZIONE", pages[-1]) # Header row on every page
+        self.assertIn("Subtotale progressivo", pages[-1])
+        self.assertIn(f"{documents.LARGE_DOCUMENT_ITEMS}.00 €", pages[-1])
+        self.assertIn("TOTALE DA PAGARE", pages[-1])
+        self.assertNotIn("TOTALE DA PAGARE", pages[-2])
+
+    @unittest.skipIf(PdfReader is None, "pypdf is not installed")
+    def test_large_document_without_totals(self):
+        """
+        Tests that a large document whose line items and document have no
+        totals is rendered, with zero subtotals.
+        """
+        # 1. Setup
+        items = [{'description': f"Voce {i}"} for i in range(documents.LARGE_DOCUMENT_ITEMS)]
+        doc = {'doc_type': 'quote', 'number': 'P2025/001', 'items': items}
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, 'doc.pdf')
+
+            # 2. Execute
+            success, msg = documents._render_pdf(doc, {}, {}, filepath, 'reportlab')
+
+            # 3. Assertions
+            self.assertTrue(success, msg)
+            pages = [page.extract_text() for page in PdfReader(filepath).pages]
+        self.assertIn("Riporto", pages[1])
+        self.assertIn("Subtotale progressivo", pages[-1])
+        self.assertIn("0.00 €", pages[-1])
+        self.assertIn("TOTALE DA PAGARE", pages[-1])
+
+    def test_failed_part_leaves_no_files(self):
+        """
+        Tests that the part files are removed, and no PDF is written,
+        when rendering a part fails.
+        """
+        # 1. Setup: the second part fails
+        def render(doc, client, my_details, filepath, part=None):
+            if not part['first']:
+                raise RuntimeError("Rendering failed")
+            with open(filepath, 'wb') as f:
+                f.write(b'%PDF')
+
+        with tempfile.TemporaryDirectory() as folder:
+            # 2. Execute
+            with patch.dict(documents.PDF_ENGINES, {'reportlab': render}), \
+                 patch.object(documents, 'PdfWriter', MagicMock()):
+                success, msg = documents._render_pdf(self._large_document(), {}, {},
+                                                     os.path.join(folder, 'doc.pdf'), 'reportlab')
+
+            # 3. Assertions
+            self.assertFalse(success)
+            self.assertIn("Rendering failed", msg)
+            self.assertEqual(os.listdir(folder), [])
+
+    @patch.object(documents, 'CSS')
+    def test_template_part_mode(self, mock_css):
+        """
+        Tests that the HTML template renders a part as one table per page,
+        each with its header row and subtotals, with the document header
+        only in the first part and the totals only in the last.
+        """
+        # 1. Setup
+        documents._pipeline = None
+        items = self._large_document()['items']
+        pages = list(documents._item_pages(items[:50])) # 15, 25, 10 items
+        first = {'pages': pages[:2], 'first': True, 'last': False}
+        second = {'pages': pages[2:], 'first': False, 'last': True}
+        doc = self._large_document()
+        doc['doc_type_display'] = "FATTURA"
+
+        # 2. Execute
+        try:
+            template, _ = documents._render_pipeline()
+            html_first = template.render(doc=doc, client={'name': 'Rossi'}, my_details={}, part=first)
+            html_second = template.render(doc=doc, client={'name': 'Rossi'}, my_details={}, part=second)
+        finally:
+            documents._pipeline = None
+
+        # 3. Assertions
+        self.assertEqual(html_first.count("<thead>"), 2)
+        self.assertEqual(html_first.count("Riporto"), 1) # Not on the first page
+        self.assertEqual(html_first.count("Subtotale progressivo"), 2)
+        self.assertIn("Spett.le", html_first)
+        self.assertNotIn("TOTALE DA PAGARE", html_first)
+        self.assertIn("40.00 €", html_second) # Carried from the first two pages
+        self.assertIn("50.00 €", html_second) # Running subtotal
+        self.assertNotIn("Spett.le", html_second)
+        self.assertIn("TOTALE DA PAGARE", html_second)
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
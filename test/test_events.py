@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+# --- Module Import Handling ---
+try:
+    from .. import events
+    from .. import persistence
+except ImportError:
+    import events
+    import persistence
+
+class TestChangeFeed(unittest.TestCase):
+    """
+    Test suite for the change feed published by the persistence layer.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+        self.changes = []
+        events.subscribe(persistence.RUBRICA_DB, self.changes.append)
+
+    def tearDown(self):
+        events.unsubscribe(persistence.RUBRICA_DB, self.changes.append)
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def _summary(self):
+        """Returns the changes received as (operation, id, before, after) tuples."""
+        return [(c.operation, c.id, c.before, c.after) for c in self.changes]
+
+    def test_record_changes(self):
+        """
+        Tests that inserts, updates and deletes are published with the
+        record before and after, and that no-op updates are not.
+        """
+        # 1. Setup & 2. Execute
+        persistence.insert_record(persistence.RUBRICA_DB, {'id': 'c1', 'name': 'Rossi'})
+        persistence.update_record(persistence.RUBRICA_DB, 'c1', {'name': 'Bianchi'})
+        persistence.update_record(persistence.RUBRICA_DB, 'c1', {'name': 'Bianchi'})
+        persistence.delete_record(persistence.RUBRICA_DB, 'c1')
+        persistence.delete_record(persistence.RUBRICA_DB, 'c1')
+
+        # 3. Assertions
+        self.assertEqual(self._summary(), [
+            ('insert', 'c1', None, {'id': 'c1', 'name': 'Rossi'}),
+            ('update', 'c1', {'id': 'c1', 'name': 'Rossi'}, {'id': 'c1', 'name': 'Bianchi'}),
+            ('delete', 'c1', {'id': 'c1', 'name': 'Bianchi'}, None),
+        ])
+        self.assertTrue(all(c.entity == persistence.RUBRICA_DB for c in self.changes))
+
+    def test_save_data_and_transactions(self):
+        """
+        Tests that a full save publishes only the differences, and that a
+        transaction publishes one change per record, only on commit.
+        """
+        # 1. Setup
+        persistence.save_data(persistence.RUBRICA_DB, [{'id': 'c1'}, {'id': 'c2'}])
+        self.changes.clear()
+
+        # 2. Execute
+        persistence.save_data(persistence.RUBRICA_DB, [{'id': 'c1'}, {'id': 'c3'}])
+        with self.assertRaises(ValueError):
+            with persistence.transaction() as tx:
+                tx.update_record(persistence.RUBRICA_DB, 'c1', {'v': 0})
+                raise ValueError("Rolled back")
+        with persistence.transaction() as tx:
+            tx.update_record(persistence.RUBRICA_DB, 'c1', {'v': 1})
+            tx.update_record(persistence.RUBRICA_DB, 'c1', {'v': 2})
+
+        # 3. Assertions
+        self.assertEqual(self._summary(), [
+            ('insert', 'c3', None, {'id': 'c3'}),
+            ('delete', 'c2', {'id': 'c2'}, None),
+            ('update', 'c1', {'id': 'c1'}, {'id': 'c1', 'v': 2}),
+        ])
+
+    def test_failing_subscriber_and_reload(self):
+        """
+        Tests that an error in a subscriber doesn't stop the write, and
+        that dropping the cache publishes a 'reload'.
+        """
+        # 1. Setup
+        def broken(change):
+            raise RuntimeError("Subscriber bug")
+        events.subscribe(persistence.RUBRICA_DB, broken)
+        self.addCleanup(events.unsubscribe, persistence.RUBRICA_DB, broken)
+
+        # 2. Execute
+        persistence.insert_record(persistence.RUBRICA_DB, {'id': 'c1'})
+        persistence.invalidate_cache()
+
+        # 3. Assertions
+        self.assertEqual(persistence.find_record(persistence.RUBRICA_DB, 'c1'), {'id': 'c1'})
+        self.assertEqual([c.operation for c in self.changes], ['insert', 'reload'])
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
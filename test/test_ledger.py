@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from decimal import Decimal
@@ -7,10 +9,12 @@ try:
     from .. import ledger
     from .. import persistence as db
     from .. import documents as db_docs
+    from .. import ledger_columns
 except ImportError:
     import ledger
     import persistence as db
     import documents as db_docs
+    import ledger_columns
 
 class TestLedger(unittest.TestCase):
     """
@@ -20,20 +24,19 @@ class TestLedger(unittest.TestCase):
 
     @patch('ledger.db_docs.update_document_status')
     @patch('ledger.db_docs.find_document_by_id')
-    @patch('ledger.db.save_data')
-    @patch('ledger.db.load_data')
+    @patch('ledger.db.transaction')
     def test_create_movimento_from_invoice(
-        self, mock_load_data, mock_save_data, mock_find_invoice, mock_update_status
+        self, mock_transaction, mock_find_invoice, mock_update_status
     ):
         """
         Tests that creating a payment from an invoice correctly:
         1. Updates the invoice status to 'Pagato'.
         2. Creates a new 'Entrata' (Income) movement with the correct financial data.
+        Both changes must go through the same transaction.
         """
         # 1. Setup Mocks
-        # Start with an empty ledger
-        mock_load_data.return_value = [] 
-        
+        mock_tx = mock_transaction.return_value.__enter__.return_value
+        mock_insert_record = mock_tx.insert_record
         # Define the mock invoice that will be "paid"
         mock_invoice = {
             'id': 'inv123',
@@ -59,19 +62,17 @@ class TestLedger(unittest.TestCase):
         self.assertTrue(success)
         
         # Verify the invoice status was changed to 'Pagato'
-        mock_update_status.assert_called_once_with('inv123', 'Pagato')
+        mock_update_status.assert_called_once_with('inv123', 'Pagato', tx=mock_tx)
         
-        # Verify that the ledger was saved
-        mock_save_data.assert_called_once()
-        # Retrieve the list of movements that was passed to save_data
-        saved_movimenti = mock_save_data.call_args[0][1]
-        self.assertEqual(len(saved_movimenti), 1)
+        # Verify that a single movement was appended to the ledger
+        mock_insert_record.assert_called_once()
+        self.assertEqual(mock_insert_record.call_args[0][0], db.PRIMANOTA_DB)
         
         # Inspect the new movement to ensure all data was copied correctly
-        new_movimento = saved_movimenti[0]
+        new_movimento = mock_insert_record.call_args[0][1]
         self.assertEqual(new_movimento['type'], 'Entrata')
         self.assertEqual(new_movimento['date'], payment_date)
-        self.assertEqual(new_movimento['description'], "Incasso Fattura N. F2025/001")
+        self.assertEqual(new_movimento['description'], "Payment for Invoice N. F2025/001")
         self.assertEqual(new_movimento['linked_invoice_id'], 'inv123')
         # Check that financial data matches the invoice
         self.assertEqual(new_movimento['amount_netto'], Decimal('1000'))
@@ -80,10 +81,10 @@ class TestLedger(unittest.TestCase):
         self.assertEqual(new_movimento['amount_totale'], Decimal('1020'))
 
     @patch('ledger.db_docs.update_document_status')
-    @patch('ledger.db.save_data')
-    @patch('ledger.db.load_data')
+    @patch('ledger.db.delete_record')
+    @patch('ledger.db.find_record')
     def test_delete_movimento_reverts_invoice_status(
-        self, mock_load_data, mock_save_data, mock_update_status
+        self, mock_find_record, mock_delete_record, mock_update_status
     ):
         """
         Tests the "undo" logic: deleting a linked payment movement
@@ -97,7 +98,7 @@ class TestLedger(unittest.TestCase):
             'linked_invoice_id': 'inv123' # The link
         }
         # Simulate the database containing this one movement
-        mock_load_data.return_value = [mock_movimento]
+        mock_find_record.return_value = mock_movimento
         
         # 2. Execute Function
         success, msg = ledger.delete_movimento('mov1')
@@ -110,14 +111,13 @@ class TestLedger(unittest.TestCase):
         mock_update_status.assert_called_once_with('inv123', 'In sospeso')
         
         # Verify that the movement was removed from the database
-        # (save_data is called with an empty list)
-        mock_save_data.assert_called_once_with(db.PRIMANOTA_DB, [])
+        mock_delete_record.assert_called_once_with(db.PRIMANOTA_DB, 'mov1')
 
     @patch('ledger.db_docs.update_document_status')
-    @patch('ledger.db.save_data')
-    @patch('ledger.db.load_data')
+    @patch('ledger.db.delete_record')
+    @patch('ledger.db.find_record')
     def test_delete_movimento_no_link(
-        self, mock_load_data, mock_save_data, mock_update_status
+        self, mock_find_record, mock_delete_record, mock_update_status
     ):
         """
         Tests that deleting a manual (un-linked) movement does NOT
@@ -129,7 +129,7 @@ class TestLedger(unittest.TestCase):
             'description': 'Office supplies',
             'linked_invoice_id': None # No link
         }
-        mock_load_data.return_value = [mock_movimento]
+        mock_find_record.return_value = mock_movimento
         
         # 2. Execute Function
         success, msg = ledger.delete_movimento('mov2')
@@ -141,7 +141,71 @@ class TestLedger(unittest.TestCase):
         mock_update_status.assert_not_called()
         
         # Verify the movement was still deleted
-        mock_save_data.assert_called_once_with(db.PRIMANOTA_DB, [])
+        mock_delete_record.assert_called_once_with(db.PRIMANOTA_DB, 'mov2')
+
+class TestLedgerColumns(unittest.TestCase):
+    """
+    Test suite for the columnar ledger used by the statistics.
+    """
+
+    def setUp(self):
+        # The ledger partitions are the real (relative) data files
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+        ledger_columns._columns_cache.clear()
+
+    def tearDown(self):
+        db.invalidate_cache()
+        ledger_columns._columns_cache.clear()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_sums_are_exact(self):
+        """
+        Tests that yearly and monthly sums match the Decimal math exactly
+        (including amounts with more than two decimals), and that the saved
+        columns are reused until the ledger changes.
+        """
+        # 1. Setup
+        amounts = ['0.10', '0.20', '67.995', '1000000.01']
+        for i, amount in enumerate(amounts):
+            ledger.create_movimento({
+                'date': f'2025-0{i + 1}-15', 'type': 'Entrata', 'description': 'x',
+                'amount_netto': amount, 'amount_totale': amount
+            })
+        ledger.create_movimento({
+            'date': '2025-02-01', 'type': 'Uscita', 'description': 'y', 'amount_totale': '0.30'
+        })
+        ledger.create_movimento({
+            'date': '2024-12-31', 'type': 'Entrata', 'description': 'z', 'amount_totale': '5'
+        })
+
+        # 2. Execute
+        totals = ledger_columns.sum_by_type(2025, 'amount_totale')
+        stats_df, _ = ledger.generate_monthly_stats(2025)
+
+        # 3. Assertions
+        self.assertEqual(totals['Entrata'], sum(Decimal(a) for a in amounts))
+        self.assertEqual(totals['Uscita'], Decimal('0.30'))
+        self.assertEqual(ledger_columns.monthly_sums(2025, 'Entrata')[2], Decimal('67.995'))
+        self.assertEqual(list(stats_df.index), ['2025-01', '2025-02', '2025-03', '2025-04', 'TOTALE'])
+        self.assertEqual(stats_df.loc['2025-02', 'Uscite'], 0.3)
+
+        # Saved next to the partition and reloaded without the records
+        self.assertTrue(os.path.exists('primanota_2025.cols.npz'))
+        db.invalidate_cache()
+        ledger_columns._columns_cache.clear()
+        with patch('ledger_columns.db.query_data') as mock_query:
+            self.assertEqual(ledger_columns.sum_by_type(2025)['Entrata'], totals['Entrata'])
+            mock_query.assert_not_called()
+
+        # A new movement invalidates them
+        ledger.create_movimento({
+            'date': '2025-12-01', 'type': 'Uscita', 'description': 'w', 'amount_totale': '1'
+        })
+        self.assertEqual(ledger_columns.sum_by_type(2025)['Uscita'], Decimal('1.30'))
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
@@ -0,0 +1,108 @@
+import random
+import unittest
+from decimal import Decimal, ROUND_HALF_UP
+
+# --- Module Import Handling ---
+try:
+    from .. import money
+    from .. import documents
+except ImportError:
+    import money
+    import documents
+
+def _decimal_totals(items, discount_perc, vat_perc, ritenuta_perc):
+    """The reference Decimal implementation of documents._calculate_totals."""
+    cent = Decimal('0.01')
+    subtotal = Decimal('0')
+    for item in items:
+        subtotal += Decimal(str(item['qty'])) * Decimal(str(item['unit_price']))
+    discount_amount = (subtotal * (discount_perc / Decimal('100'))).quantize(cent, rounding=ROUND_HALF_UP)
+    taxable_amount = subtotal - discount_amount
+    vat_amount = (taxable_amount * (vat_perc / Decimal('100'))).quantize(cent, rounding=ROUND_HALF_UP)
+    total = taxable_amount + vat_amount
+    ritenuta_amount = (taxable_amount * (ritenuta_perc / Decimal('100'))).quantize(cent, rounding=ROUND_HALF_UP)
+    return {
+        'subtotal': subtotal,
+        'discount_amount': discount_amount,
+        'taxable_amount': taxable_amount,
+        'vat_amount': vat_amount,
+        'total': total,
+        'ritenuta_amount': ritenuta_amount,
+        'total_da_pagare': total - ritenuta_amount,
+    }
+
+class TestMoney(unittest.TestCase):
+    """
+    Test suite for the 'money' module.
+    Every result must be identical to the Decimal math it replaces.
+    """
+
+    def test_rounding_is_half_up(self):
+        """
+        Tests percentages and rounding on exact halves, also for negative amounts.
+        """
+        # 1. Setup
+        cases = ['0.05', '0.15', '-0.05', '-2.345', '67.995', '1234567.005']
+
+        for value in cases:
+            # 2. Execute
+            rounded = money.Money.parse(value).rounded()
+
+            # 3. Assertions
+            expected = Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            self.assertEqual(rounded.to_decimal(), expected)
+            self.assertEqual(str(rounded), str(expected))
+
+        self.assertEqual(money.Money.parse('0.25').percent(Decimal('10')).to_decimal(), Decimal('0.03'))
+        self.assertEqual(money.Money.parse('-0.25').percent('10').to_decimal(), Decimal('-0.03'))
+
+    def test_invoice_totals_match_decimal(self):
+        """
+        Tests that documents._calculate_totals gives exactly the same values
+        as the original Decimal implementation, on random invoices
+        (fractional quantities, sub-cent line totals, odd percentages).
+        """
+        rng = random.Random(42)
+        for _ in range(500):
+            # 1. Setup
+            items = [
+                {
+                    'qty': str(Decimal(rng.randint(1, 4000)) / rng.choice([1, 2, 4, 10, 1000])),
+                    'unit_price': str(Decimal(rng.randint(0, 10**7)) / 100),
+                }
+                for _ in range(rng.randint(1, 8))
+            ]
+            discount = Decimal(rng.randint(0, 500)) / rng.choice([1, 10, 100])
+            vat = rng.choice([Decimal('0'), Decimal('4'), Decimal('10'), Decimal('22')])
+            ritenuta = rng.choice([Decimal('0'), Decimal('20'), Decimal('23.5')])
+
+            # 2. Execute
+            expected = _decimal_totals(items, discount, vat, ritenuta)
+            totals = documents._calculate_totals([dict(i) for i in items], discount, vat, ritenuta)
+
+            # 3. Assertions
+            for key, value in expected.items():
+                self.assertEqual(totals[key], value, (key, items, discount, vat, ritenuta))
+                self.assertIsInstance(totals[key], Decimal)
+
+    def test_batch_operations(self):
+        """
+        Tests the vectorized sum and percentage against the scalar operations.
+        """
+        # 1. Setup
+        values = [Decimal('0.10'), Decimal('0.20'), Decimal('67.995'), None, '-3.33']
+
+        # 2. Execute
+        units, scale = money.to_array(values)
+        percents = money.array_percent(units, scale, Decimal('22'))
+
+        # 3. Assertions
+        self.assertEqual(scale, 3)
+        self.assertEqual(money.total(values).to_decimal(), Decimal('64.965'))
+        self.assertEqual(
+            [money.Money(int(cents)) for cents in percents],
+            [money.Money.parse(value).percent(Decimal('22')) for value in values]
+        )
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
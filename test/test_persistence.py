@@ -1,3 +1,7 @@
+import os
+import pickle
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 from datetime import datetime
@@ -5,8 +9,20 @@ from datetime import datetime
 # --- Module Import Handling ---
 try:
     from .. import persistence
+    from .. import records
+    from .. import journal, locking, numbering, record_format, sqlite_store, writes
 except ImportError:
     import persistence
+    import records
+    import journal, locking, numbering, record_format, sqlite_store, writes
+
+def _last_number(doc_type):
+    """Returns the last document number taken (0 if none)."""
+    return numbering.load_sequences().get(doc_type, {}).get('last', 0)
+
+def _with_date_ordinals(records):
+    """Returns the records as stored: with their date ordinals."""
+    return [record_format.add_date_ordinals(dict(record)) for record in records]
 
 class TestPersistence(unittest.TestCase):
     """
@@ -15,11 +31,11 @@ class TestPersistence(unittest.TestCase):
     specifically the document numbering and year-end rollover.
     """
 
-    @patch('persistence.save_settings')
-    @patch('persistence.load_settings')
-    @patch('persistence.datetime') # Mock the datetime module
+    @patch('numbering.save_sequences')
+    @patch('numbering.load_sequences')
+    @patch('numbering.datetime') # Mock the datetime module
     def test_get_next_document_number_simple_increment(
-        self, mock_datetime, mock_load_settings, mock_save_settings
+        self, mock_datetime, mock_load_sequences, mock_save_sequences
     ):
         """
         Tests the standard increment of a document number within the same year.
@@ -28,14 +44,12 @@ class TestPersistence(unittest.TestCase):
         # Simulate that we are currently in 2025
         mock_datetime.now.return_value = datetime(2025, 6, 15)
         
-        # Simulate the settings loaded from disk
-        mock_settings = {
-            'last_invoice_num': 41,
-            'invoice_prefix': "F2025/",
-            'last_quote_num': 10,
-            'quote_prefix': "P2025/",
+        # Simulate the sequences loaded from disk
+        mock_sequences = {
+            'invoice': {'last': 41, 'prefix': "F2025/"},
+            'quote': {'last': 10, 'prefix': "P2025/"},
         }
-        mock_load_settings.return_value = mock_settings
+        mock_load_sequences.return_value = mock_sequences
         
         # 2. Execute Function
         next_num = persistence.get_next_document_number(doc_type="invoice")
@@ -44,21 +58,21 @@ class TestPersistence(unittest.TestCase):
         # The number should be the last number (41) + 1, formatted
         self.assertEqual(next_num, "F2025/042")
         
-        # Verify that the settings were saved
-        mock_save_settings.assert_called_once()
-        # Inspect the dictionary that was passed to save_settings
-        saved_settings = mock_save_settings.call_args[0][0]
+        # Verify that the sequences were saved
+        mock_save_sequences.assert_called_once()
+        # Inspect the dictionary that was passed to _save_sequences
+        saved_sequences = mock_save_sequences.call_args[0][0]
         
         # Check that the number was incremented in the saved data
-        self.assertEqual(saved_settings['last_invoice_num'], 42)
+        self.assertEqual(saved_sequences['invoice']['last'], 42)
         # Check that the quote number was left untouched
-        self.assertEqual(saved_settings['last_quote_num'], 10)
+        self.assertEqual(saved_sequences['quote']['last'], 10)
 
-    @patch('persistence.save_settings')
-    @patch('persistence.load_settings')
-    @patch('persistence.datetime') # Mock the datetime module
+    @patch('numbering.save_sequences')
+    @patch('numbering.load_sequences')
+    @patch('numbering.datetime') # Mock the datetime module
     def test_get_next_document_number_year_rollover(
-        self, mock_datetime, mock_load_settings, mock_save_settings
+        self, mock_datetime, mock_load_sequences, mock_save_sequences
     ):
         """
         Tests the critical "year-end rollover" logic.
@@ -69,14 +83,12 @@ class TestPersistence(unittest.TestCase):
         # Simulate that we are now in 2026
         mock_datetime.now.return_value = datetime(2026, 1, 1)
         
-        # Simulate settings loaded from disk, which are from the *previous* year
-        mock_settings = {
-            'last_invoice_num': 99,
-            'invoice_prefix': "F2025/", # Old prefix
-            'last_quote_num': 50,
-            'quote_prefix': "P2025/",
+        # Simulate sequences loaded from disk, which are from the *previous* year
+        mock_sequences = {
+            'invoice': {'last': 99, 'prefix': "F2025/"}, # Old prefix
+            'quote': {'last': 50, 'prefix': "P2025/"},
         }
-        mock_load_settings.return_value = mock_settings
+        mock_load_sequences.return_value = mock_sequences
         
         # 2. Execute Function
         next_num = persistence.get_next_document_number(doc_type="invoice")
@@ -85,14 +97,759 @@ class TestPersistence(unittest.TestCase):
         # The number should reset to 1 and the prefix should update to 2026
         self.assertEqual(next_num, "F2026/001")
         
-        # Verify that the settings were saved
-        mock_save_settings.assert_called_once()
-        saved_settings = mock_save_settings.call_args[0][0]
+        # Verify that the sequences were saved
+        mock_save_sequences.assert_called_once()
+        saved_sequences = mock_save_sequences.call_args[0][0]
         
         # Check that the number was reset to 1 in the saved data
-        self.assertEqual(saved_settings['last_invoice_num'], 1)
+        self.assertEqual(saved_sequences['invoice']['last'], 1)
         # Check that the prefix was updated
-        self.assertEqual(saved_settings['invoice_prefix'], "F2026/")
+        self.assertEqual(saved_sequences['invoice']['prefix'], "F2026/")
+
+    @patch('numbering.datetime')
+    def test_reserve_document_numbers_block(self, mock_datetime):
+        """
+        Tests that a block of numbers is reserved with one write, right
+        after the numbers already taken.
+        """
+        # 1. Setup
+        mock_datetime.now.return_value = datetime(2025, 6, 15)
+        old_cwd = os.getcwd()
+        tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(tmp_dir.name)
+        self.addCleanup(tmp_dir.cleanup)
+        self.addCleanup(os.chdir, old_cwd)
+        persistence.invalidate_cache()
+        self.addCleanup(persistence.invalidate_cache)
+
+        # 2. Execute
+        first = persistence.get_next_document_number('invoice')
+        with patch('writes.atomic_write', wraps=writes.atomic_write) as mock_write:
+            block = persistence.reserve_document_numbers('invoice', 500)
+        after = persistence.get_next_document_number('invoice')
+
+        # 3. Assertions
+        self.assertEqual(first, "F2025/001")
+        self.assertEqual(block[0], "F2025/002")
+        self.assertEqual(block[-1], "F2025/501")
+        self.assertEqual(len(set(block)), 500)
+        self.assertEqual(mock_write.call_count, 1)
+        self.assertEqual(after, "F2025/502")
+
+class TestDataCache(unittest.TestCase):
+    """
+    Test suite for the in-process cache behind load_data/save_data.
+    Uses a real temporary file instead of mocks, since the cache
+    relies on the file's stat to detect changes.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, 'test.pkl')
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        self.tmp_dir.cleanup()
+
+    def test_load_data_served_from_cache(self):
+        """
+        Tests that a second load of an unchanged file does not unpickle it again.
+        """
+        persistence.save_data(self.db_file, [{'id': 'a', 'name': 'Alpha'}])
+        persistence.invalidate_cache()
+
+        with patch.object(pickle, 'load', wraps=pickle.load) as mock_load:
+            first = persistence.load_data(self.db_file)
+            second = persistence.load_data(self.db_file)
+
+        self.assertEqual(first, second)
+        # Only the first call should have touched the file contents
+        mock_load.assert_called_once()
+
+    def test_load_data_returns_private_copies(self):
+        """
+        Tests that callers can't corrupt the cache by mutating what they receive,
+        including nested lists (e.g., invoice 'items').
+        """
+        persistence.save_data(self.db_file, [{'id': 'a', 'items': [{'qty': '1'}]}])
+
+        data = persistence.load_data(self.db_file)
+        data[0]['id'] = 'changed'
+        data[0]['items'][0]['qty'] = '99'
+        data.append({'id': 'b'})
+
+        fresh = persistence.load_data(self.db_file)
+        self.assertEqual(fresh, [{'id': 'a', 'items': [{'qty': '1'}]}])
+
+    def test_external_change_invalidates_cache(self):
+        """
+        Tests that a file rewritten behind the cache's back (e.g., by another
+        process) is detected and re-read.
+        """
+        persistence.save_data(self.db_file, [{'id': 'a'}])
+        version = persistence.get_data_version(self.db_file)
+
+        # Write directly, bypassing save_data
+        with open(self.db_file, 'wb') as f:
+            pickle.dump([{'id': 'a'}, {'id': 'b'}], f)
+
+        self.assertEqual(len(persistence.load_data(self.db_file)), 2)
+        self.assertGreater(persistence.get_data_version(self.db_file), version)
+
+class TestJournal(unittest.TestCase):
+    """
+    Test suite for the journaled record API (insert/update/delete_record).
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, 'test.pkl')
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        self.tmp_dir.cleanup()
+
+    def test_record_changes_are_journaled_and_replayed(self):
+        """
+        Tests that single-record changes don't rewrite the snapshot
+        and are correctly replayed when loading from disk.
+        """
+        # 1. Setup: a snapshot with two records
+        persistence.save_data(self.db_file, [{'id': 'a', 'v': 1}, {'id': 'b', 'v': 2}])
+        snapshot_mtime = os.stat(self.db_file).st_mtime_ns
+
+        # 2. Execute: one change of each kind
+        persistence.insert_record(self.db_file, {'id': 'c', 'v': 3})
+        updated = persistence.update_record(self.db_file, 'a', {'v': 10})
+        self.assertTrue(persistence.delete_record(self.db_file, 'b'))
+
+        # 3. Assertions
+        self.assertEqual(updated, {'id': 'a', 'v': 10})
+        # The snapshot was not touched, the changes went to the journal
+        self.assertEqual(os.stat(self.db_file).st_mtime_ns, snapshot_mtime)
+        self.assertTrue(os.path.exists(self.db_file + journal.JOURNAL_SUFFIX))
+
+        expected = [{'id': 'a', 'v': 10}, {'id': 'c', 'v': 3}]
+        self.assertEqual(persistence.load_data(self.db_file), expected)
+        # Drop the cache: the same data must be rebuilt from snapshot + journal
+        persistence.invalidate_cache()
+        self.assertEqual(persistence.load_data(self.db_file), expected)
+
+    def test_missing_record(self):
+        """
+        Tests that updating/deleting an unknown ID reports 'not found'.
+        """
+        self.assertIsNone(persistence.update_record(self.db_file, 'nope', {'v': 1}))
+        self.assertFalse(persistence.delete_record(self.db_file, 'nope'))
+
+    def test_modify_record(self):
+        """
+        Tests that a record is changed based on its current content, with
+        only the returned fields written, and can be left unchanged.
+        """
+        # 1. Setup
+        persistence.save_data(self.db_file, [{'id': 'p', 'fasi': [{'id': 1}]}, {'id': 'q'}])
+
+        def append(project):
+            project['fasi'].append({'id': 2})
+            return {'fasi': project['fasi']}
+
+        # 2. Execute
+        changed = persistence.modify_record(self.db_file, 'p', append)
+        unchanged = persistence.modify_record(self.db_file, 'q', lambda record: None)
+
+        # 3. Assertions
+        self.assertEqual(changed, {'id': 'p', 'fasi': [{'id': 1}, {'id': 2}]})
+        self.assertEqual(unchanged, {'id': 'q'})
+        self.assertIsNone(persistence.modify_record(self.db_file, 'nope', append))
+        persistence.invalidate_cache()
+        self.assertEqual(persistence.load_data(self.db_file), [changed, unchanged])
+
+    def test_concurrent_modify_record(self):
+        """
+        Tests that read-modify-writes of the same record from several
+        threads don't overwrite each other.
+        """
+        # 1. Setup
+        persistence.save_data(self.db_file, [{'id': 'p', 'fasi': []}])
+
+        def add_many(start):
+            for n in range(start, start + 25):
+                persistence.modify_record(
+                    self.db_file, 'p', lambda project: {'fasi': project['fasi'] + [{'id': n}]}
+                )
+
+        # 2. Execute
+        threads = [threading.Thread(target=add_many, args=(i * 25,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 3. Assertions
+        ids = sorted(fase['id'] for fase in persistence.find_record(self.db_file, 'p')['fasi'])
+        self.assertEqual(ids, list(range(200)))
+
+    def test_find_record_follows_changes(self):
+        """
+        Tests that lookups by ID stay correct as records are inserted,
+        updated and deleted (the index positions shift on delete).
+        """
+        # 1. Setup
+        persistence.save_data(self.db_file, [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}])
+
+        # 2. Execute
+        self.assertEqual(persistence.find_record(self.db_file, 'c'), {'id': 'c'})
+        persistence.delete_record(self.db_file, 'a')
+        persistence.insert_record(self.db_file, {'id': 'd'})
+        persistence.update_record(self.db_file, 'c', {'v': 1})
+
+        # 3. Assertions
+        self.assertIsNone(persistence.find_record(self.db_file, 'a'))
+        self.assertEqual(persistence.find_record(self.db_file, 'b'), {'id': 'b'})
+        self.assertEqual(persistence.find_record(self.db_file, 'c'), {'id': 'c', 'v': 1})
+        self.assertEqual(persistence.find_record(self.db_file, 'd'), {'id': 'd'})
+        # The result is a copy, not the cached record
+        persistence.find_record(self.db_file, 'b')['id'] = 'changed'
+        self.assertEqual(persistence.find_record(self.db_file, 'b'), {'id': 'b'})
+
+    def test_torn_journal_tail_is_ignored(self):
+        """
+        Tests that a partially written entry (crash during append) is dropped
+        without losing the complete entries before it.
+        """
+        persistence.insert_record(self.db_file, {'id': 'a'})
+        with open(self.db_file + journal.JOURNAL_SUFFIX, 'ab') as f:
+            f.write(pickle.dumps(('insert', {'id': 'b'}))[:-3])
+        persistence.invalidate_cache()
+
+        self.assertEqual(persistence.load_data(self.db_file), [{'id': 'a'}])
+        # New entries are still readable after the truncated tail
+        persistence.insert_record(self.db_file, {'id': 'c'})
+        persistence.invalidate_cache()
+        self.assertEqual(persistence.load_data(self.db_file), [{'id': 'a'}, {'id': 'c'}])
+
+    @patch.object(journal, 'JOURNAL_COMPACT_MIN_ENTRIES', 3)
+    def test_journal_compaction(self):
+        """
+        Tests that a long journal is folded into a new snapshot.
+        """
+        for i in range(4):
+            persistence.insert_record(self.db_file, {'id': str(i)})
+
+        self.assertFalse(os.path.exists(self.db_file + journal.JOURNAL_SUFFIX))
+        persistence.invalidate_cache()
+        self.assertEqual(len(persistence.load_data(self.db_file)), 4)
+
+class TestAtomicWrites(unittest.TestCase):
+    """
+    Test suite for crash-safe writes and group commit.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, 'test.pkl')
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        self.tmp_dir.cleanup()
+
+    def test_failed_write_keeps_old_file(self):
+        """
+        Tests that an error while writing leaves the previous content
+        intact and no temporary file behind.
+        """
+        persistence.save_data(self.db_file, [{'id': 'a'}])
+
+        # A lambda can't be pickled: the write fails halfway
+        with self.assertRaises(Exception):
+            persistence.save_data(self.db_file, [{'id': 'b', 'bad': lambda: None}])
+
+        persistence.invalidate_cache()
+        self.assertEqual(persistence.load_data(self.db_file), [{'id': 'a'}])
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['test.pkl'])
+
+    def test_group_commit_coalesces_writes(self):
+        """
+        Tests that repeated saves inside a group are written once, at the
+        end, and that reads inside the group see the pending data.
+        """
+        # 1. Setup
+        real_atomic_write = writes.atomic_write
+        with patch.object(writes, 'atomic_write', side_effect=real_atomic_write) as mock_write:
+            # 2. Execute
+            with persistence.group_commit():
+                for i in range(5):
+                    persistence.save_data(self.db_file, [{'id': str(n)} for n in range(i + 1)])
+                persistence.insert_record(self.db_file, {'id': 'x'})
+                self.assertEqual(len(persistence.load_data(self.db_file)), 6)
+                self.assertFalse(os.path.exists(self.db_file))
+
+            # 3. Assertions
+            mock_write.assert_called_once()
+        persistence.invalidate_cache()
+        self.assertEqual(len(persistence.load_data(self.db_file)), 6)
+
+    def test_write_behind(self):
+        """
+        Tests that with the background writer, saves are visible at once
+        and reach the disk by the time the writer is stopped.
+        """
+        persistence.start_write_behind(delay=0.01)
+        try:
+            persistence.save_data(self.db_file, [{'id': 'a'}])
+            persistence.update_record(self.db_file, 'a', {'v': 1})
+            self.assertEqual(persistence.load_data(self.db_file), [{'id': 'a', 'v': 1}])
+        finally:
+            persistence.stop_write_behind()
+
+        persistence.invalidate_cache()
+        self.assertEqual(persistence.load_data(self.db_file), [{'id': 'a', 'v': 1}])
+
+class TestYearPartitions(unittest.TestCase):
+    """
+    Test suite for the year-partitioned stores (documents and ledger).
+    """
+
+    def setUp(self):
+        # The partitioned stores are the real (relative) data files
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_legacy_file_is_split_by_year(self):
+        """
+        Tests that a single legacy file is split into one partition per
+        year, and that a year-scoped query only reads its partition.
+        """
+        # 1. Setup: a legacy single-file ledger
+        movimenti = [
+            {'id': 'm1', 'date': '2024-03-01'},
+            {'id': 'm2', 'date': '2025-06-30'},
+            {'id': 'm3', 'date': ''},
+        ]
+        with open(persistence.PRIMANOTA_DB, 'wb') as f:
+            pickle.dump(movimenti, f)
+
+        # 2. Execute
+        loaded = persistence.load_data(persistence.PRIMANOTA_DB)
+
+        # 3. Assertions
+        self.assertCountEqual(loaded, _with_date_ordinals(movimenti))
+        self.assertTrue(os.path.exists('primanota_2024.pkl'))
+        self.assertTrue(os.path.exists('primanota_2025.pkl'))
+        self.assertTrue(os.path.exists('primanota_undated.pkl'))
+        self.assertTrue(os.path.exists(persistence.PRIMANOTA_DB + '.bak'))
+        self.assertFalse(os.path.exists(persistence.PRIMANOTA_DB))
+
+        persistence.invalidate_cache()
+        result = persistence.query_data(
+            persistence.PRIMANOTA_DB, date_from=datetime(2025, 1, 1), date_to=datetime(2025, 12, 31)
+        )
+        self.assertEqual(result, _with_date_ordinals([movimenti[1]]))
+        self.assertNotIn('primanota_2024.pkl', journal.stores)
+
+    def test_records_follow_their_year(self):
+        """
+        Tests inserts, lookups and date changes across partitions, and that
+        saving the whole list leaves unchanged years untouched.
+        """
+        # 1. Setup
+        persistence.insert_record(persistence.DOCUMENTI_DB, {'id': 'd1', 'date': '2024-12-31'})
+        persistence.insert_record(persistence.DOCUMENTI_DB, {'id': 'd2', 'date': '2025-01-01'})
+        old_year_mtimes = [os.stat(path).st_mtime_ns for path in ('documenti_2024.pkl', 'documenti_2024.pkl.journal')]
+
+        # 2. Execute: move d2 to 2026, then save the whole list with a new record
+        persistence.update_record(persistence.DOCUMENTI_DB, 'd2', {'date': '2026-02-01'})
+        docs = persistence.load_data(persistence.DOCUMENTI_DB)
+        docs.append({'id': 'd3', 'date': '2026-03-01'})
+        persistence.save_data(persistence.DOCUMENTI_DB, docs)
+
+        # 3. Assertions
+        self.assertEqual(persistence.find_record(persistence.DOCUMENTI_DB, 'd2')['date'], '2026-02-01')
+        persistence.invalidate_cache()
+        self.assertEqual(
+            [d['id'] for d in persistence.load_data(persistence.DOCUMENTI_DB)], ['d1', 'd2', 'd3']
+        )
+        self.assertEqual(persistence.find_record(persistence.DOCUMENTI_DB, 'd1')['date'], '2024-12-31')
+        # The closed year was never rewritten
+        self.assertEqual(
+            [os.stat(path).st_mtime_ns for path in ('documenti_2024.pkl', 'documenti_2024.pkl.journal')],
+            old_year_mtimes
+        )
+
+class TestSchemaMigrations(unittest.TestCase):
+    """
+    Test suite for the one-shot upgrade of data saved by older versions,
+    including the date ordinals stored next to the record dates.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_old_data_is_upgraded_once(self):
+        """
+        Tests that data saved without ordinals is upgraded on first load,
+        and that range queries then never parse the date strings.
+        """
+        # 1. Setup: an old events file, without ordinals
+        events = [
+            {'id': 'e1', 'date': '2025-03-01'},
+            {'id': 'e2', 'date': '2025-04-01'},
+            {'id': 'e3', 'date': ''},
+        ]
+        with open(persistence.CALENDARIO_DB, 'wb') as f:
+            pickle.dump(events, f)
+
+        # 2. Execute
+        loaded = persistence.load_data(persistence.CALENDARIO_DB)
+        persistence.update_record(persistence.CALENDARIO_DB, 'e3', {'date': '2025-03-15'})
+
+        # 3. Assertions
+        self.assertEqual(loaded[0]['date_ord'], datetime(2025, 3, 1).toordinal())
+        self.assertIsNone(loaded[2]['date_ord'])
+        # Rewritten once, with the ordinals
+        with open(persistence.CALENDARIO_DB, 'rb') as f:
+            snapshot = pickle.load(f)
+        self.assertEqual(snapshot['schema'], persistence.SCHEMA_VERSION)
+        self.assertEqual(snapshot['records'], _with_date_ordinals(events))
+
+        with patch('record_format.as_date', wraps=record_format.as_date) as mock_as_date:
+            result = persistence.query_data(
+                persistence.CALENDARIO_DB, date_from=datetime(2025, 3, 1).date(),
+                date_to=datetime(2025, 3, 31).date(), order_by='date'
+            )
+            # Only the two bounds are converted, not the records
+            self.assertEqual(mock_as_date.call_count, 2)
+        self.assertEqual([e['id'] for e in result], ['e1', 'e3'])
+
+    def test_legacy_fields_are_migrated(self):
+        """
+        Tests the migrations of projects, documents and settings, and that
+        they only run once.
+        """
+        # 1. Setup: old files (plain lists and a settings dict without version)
+        with open(persistence.PROGETTI_DB, 'wb') as f:
+            pickle.dump([{'id': 'p1', 'attivita': [{'ore': 2}, {'ore': 1, 'fatturabile': False}]}], f)
+        with open(persistence.DOCUMENTI_DB, 'wb') as f:
+            pickle.dump([{'id': 'd1', 'date': '2025-01-01', 'items': [{'linked_item_id': 'a1'}]}], f)
+        with open(persistence.SETTINGS_FILE, 'wb') as f:
+            pickle.dump({'last_invoice_num': 7, 'smtp_config': {'host': 'smtp.example.com'}}, f)
+
+        # 2. Execute
+        project = persistence.find_record(persistence.PROGETTI_DB, 'p1')
+        document = persistence.find_record(persistence.DOCUMENTI_DB, 'd1')
+        settings = persistence.load_settings()
+
+        # 3. Assertions
+        self.assertEqual([a['fatturabile'] for a in project['attivita']], [True, False])
+        self.assertEqual(document['items'], [{'articolo_id': 'a1'}])
+        self.assertNotIn('last_invoice_num', settings)
+        self.assertEqual(_last_number('invoice'), 7)
+        self.assertEqual(settings['smtp_config']['host'], 'smtp.example.com')
+        self.assertEqual(settings['smtp_config']['port'], 587)
+        self.assertEqual(settings['schema_version'], persistence.SCHEMA_VERSION)
+
+        # Upgraded data is not migrated again
+        persistence.invalidate_cache()
+        with patch('migrations.migrate') as mock_migrate:
+            persistence.load_data(persistence.PROGETTI_DB)
+            persistence.load_settings()
+            mock_migrate.assert_not_called()
+
+class TestCompactRecords(unittest.TestCase):
+    """
+    Test suite for the slotted records (ledger movements, activities,
+    line items): they must behave exactly like the dicts they replace.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_dict_compatibility(self):
+        """
+        Tests the mapping behaviour, including unset fields and extra keys.
+        """
+        # 1. Setup
+        plain = {'id': 'm1', 'date': '2025-02-01', 'type': 'Entrata', 'custom': 1}
+
+        # 2. Execute
+        movimento = records.Movimento(plain)
+        copy = movimento.copy()
+        copy['notes'] = 'Saldo'
+        del copy['custom']
+
+        # 3. Assertions
+        self.assertEqual(movimento, plain)
+        self.assertEqual(list(movimento), list(plain))
+        self.assertNotIn('notes', movimento)
+        self.assertIsNone(movimento.get('notes'))
+        self.assertEqual(movimento.get('notes', ''), '')
+        self.assertRaises(KeyError, lambda: movimento['notes'])
+        self.assertEqual(copy, {'id': 'm1', 'date': '2025-02-01', 'type': 'Entrata', 'notes': 'Saldo'})
+        self.assertEqual(movimento['custom'], 1) # The original is unchanged
+        self.assertEqual(pickle.loads(pickle.dumps(copy)), copy)
+
+    def test_records_are_stored_compact(self):
+        """
+        Tests that saved and migrated records come back as compact records.
+        """
+        # 1. Setup: an old projects file, with plain dict activities
+        with open(persistence.PROGETTI_DB, 'wb') as f:
+            pickle.dump([{'id': 'p1', 'attivita': [{'id': 'a1', 'ore': 2, 'fatturabile': True}]}], f)
+        movimento = {'id': 'm1', 'date': '2025-02-01', 'type': 'Uscita'}
+
+        # 2. Execute
+        persistence.insert_record(persistence.PRIMANOTA_DB, movimento)
+        persistence.update_record(persistence.PRIMANOTA_DB, 'm1', {'notes': 'Affitto'})
+        persistence.invalidate_cache()
+        stored = persistence.find_record(persistence.PRIMANOTA_DB, 'm1')
+        project = persistence.find_record(persistence.PROGETTI_DB, 'p1')
+
+        # 3. Assertions
+        self.assertIsInstance(stored, records.Movimento)
+        self.assertEqual(stored, dict(_with_date_ordinals([movimento])[0], notes='Affitto'))
+        self.assertIsInstance(project['attivita'][0], records.Attivita)
+        self.assertEqual(project['attivita'], [{'id': 'a1', 'ore': 2, 'fatturabile': True}])
+
+@unittest.skipIf(locking.fcntl is None, "Inter-process locking needs fcntl")
+class TestInterProcessLocking(unittest.TestCase):
+    """
+    Test suite for the locking between processes sharing the data files.
+    The other process is simulated by a flock on a separate descriptor.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+        persistence.save_data(persistence.CALENDARIO_DB, [{'id': 'e1'}])
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def _other_process_lock(self, mode):
+        """Takes the lock file like another process would."""
+        fd = os.open(persistence.LOCK_FILE, os.O_RDWR | os.O_CREAT)
+        locking.fcntl.flock(fd, mode)
+        self.addCleanup(os.close, fd)
+        return fd
+
+    def test_writers_wait_readers_dont(self):
+        """
+        Tests that a write waits for another process's exclusive lock,
+        while reads go on without any lock.
+        """
+        # 1. Setup: another process is writing
+        fd = self._other_process_lock(locking.fcntl.LOCK_EX)
+
+        # 2. Execute
+        writer = threading.Thread(
+            target=persistence.insert_record, args=(persistence.CALENDARIO_DB, {'id': 'e2'})
+        )
+        writer.start()
+        writer.join(0.2)
+
+        # 3. Assertions
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(persistence.load_data(persistence.CALENDARIO_DB), [{'id': 'e1'}])
+        locking.fcntl.flock(fd, locking.fcntl.LOCK_UN)
+        writer.join(5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(persistence.find_record(persistence.CALENDARIO_DB, 'e2'), {'id': 'e2'})
+
+    def test_reader_keeps_append_in_progress(self):
+        """
+        Tests that a reader ignores, but doesn't truncate, a journal entry
+        another process is still appending.
+        """
+        # 1. Setup: half of an entry, written under the other process's lock
+        fd = self._other_process_lock(locking.fcntl.LOCK_EX)
+        entry = pickle.dumps(('insert', {'id': 'e2'}))
+        journal_file = persistence.CALENDARIO_DB + journal.JOURNAL_SUFFIX
+        with open(journal_file, 'ab') as f:
+            f.write(entry[:5])
+
+        # 2. Execute
+        before = persistence.load_data(persistence.CALENDARIO_DB)
+        with open(journal_file, 'ab') as f:
+            f.write(entry[5:])
+        locking.fcntl.flock(fd, locking.fcntl.LOCK_UN)
+        after = persistence.load_data(persistence.CALENDARIO_DB)
+
+        # 3. Assertions
+        self.assertEqual(before, [{'id': 'e1'}])
+        self.assertEqual(after, [{'id': 'e1'}, {'id': 'e2'}])
+
+class TestSqliteBackend(unittest.TestCase):
+    """
+    Test suite for the optional SQLite storage backend and the
+    one-shot migration from the .pkl files.
+    """
+
+    def setUp(self):
+        # All data files are relative paths, so work in a temporary directory
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+
+    def tearDown(self):
+        sqlite_store.close_all()
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_migrate_and_query(self):
+        """
+        Tests that the migration copies the pickle data into SQLite, switches
+        the backend, and that filtered queries return the same records
+        as the in-memory filtering of the pickle backend.
+        """
+        # 1. Setup: some pickle data
+        docs = [
+            {'id': 'd1', 'doc_type': 'invoice', 'date': '2025-01-10', 'status': 'Pagato'},
+            {'id': 'd2', 'doc_type': 'quote', 'date': '2025-02-10', 'status': 'Bozza'},
+            {'id': 'd3', 'doc_type': 'invoice', 'date': '2025-05-01', 'status': 'In sospeso'},
+            {'id': 'd4', 'doc_type': 'invoice', 'date': 'not a date', 'status': 'In sospeso'},
+        ]
+        persistence.save_data(persistence.DOCUMENTI_DB, docs)
+        query = dict(date_from=datetime(2025, 1, 1), date_to=datetime(2025, 3, 31).date(), doc_type='invoice')
+        pickle_result = persistence.query_data(persistence.DOCUMENTI_DB, **query)
+
+        # 2. Execute
+        success, msg = persistence.migrate_to_sqlite()
+
+        # 3. Assertions
+        self.assertTrue(success, msg)
+        self.assertEqual(persistence.get_storage_backend(), 'sqlite')
+        self.assertEqual(persistence.load_data(persistence.DOCUMENTI_DB), _with_date_ordinals(docs))
+
+        sqlite_result = persistence.query_data(persistence.DOCUMENTI_DB, **query)
+        self.assertEqual(sqlite_result, pickle_result)
+        self.assertEqual([d['id'] for d in sqlite_result], ['d1'])
+
+        # Record-level writes go to SQLite as well
+        persistence.update_record(persistence.DOCUMENTI_DB, 'd3', {'status': 'Pagato'})
+        paid = persistence.query_data(persistence.DOCUMENTI_DB, status='Pagato', order_by='date')
+        self.assertEqual([d['id'] for d in paid], ['d1', 'd3'])
+        # modify_record reads the record from SQLite, not the old .pkl file
+        changed = persistence.modify_record(
+            persistence.DOCUMENTI_DB, 'd3', lambda doc: {'notes': f"Stato: {doc['status']}"}
+        )
+        self.assertEqual(changed['notes'], "Stato: Pagato")
+
+        # A second migration is refused
+        self.assertFalse(persistence.migrate_to_sqlite()[0])
+
+class TestTransaction(unittest.TestCase):
+    """
+    Test suite for the multi-store unit of work (persistence.transaction).
+    """
+
+    def setUp(self):
+        # TRANSACTION_FILE and the settings are relative paths
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        persistence.invalidate_cache()
+        persistence.save_data(persistence.MAGAZZINO_DB, [{'id': 'art1', 'qta_in_stock': 5}])
+
+    def tearDown(self):
+        persistence.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_commit_applies_all_changes(self):
+        """
+        Tests that changes to several stores and to the settings are
+        only visible after the commit, and then all of them are.
+        """
+        # 1. Setup
+        last_num = _last_number('invoice')
+
+        # 2. Execute
+        with persistence.transaction() as tx:
+            tx.update_record(persistence.MAGAZZINO_DB, 'art1', {'qta_in_stock': 3})
+            tx.insert_record(persistence.DOCUMENTI_DB, {'id': 'inv1'})
+            number = tx.get_next_document_number('invoice')
+            # The transaction sees its own changes, nobody else does yet
+            self.assertEqual(tx.find_record(persistence.MAGAZZINO_DB, 'art1')['qta_in_stock'], 3)
+            self.assertEqual(persistence.find_record(persistence.MAGAZZINO_DB, 'art1')['qta_in_stock'], 5)
+            self.assertIsNone(persistence.find_record(persistence.DOCUMENTI_DB, 'inv1'))
+
+        # 3. Assertions
+        self.assertEqual(persistence.find_record(persistence.MAGAZZINO_DB, 'art1')['qta_in_stock'], 3)
+        self.assertEqual(persistence.find_record(persistence.DOCUMENTI_DB, 'inv1'), {'id': 'inv1'})
+        self.assertEqual(_last_number('invoice'), last_num + 1)
+        self.assertTrue(number.endswith(str(last_num + 1).zfill(3)))
+        self.assertFalse(os.path.exists(persistence.TRANSACTION_FILE))
+
+    def test_exception_rolls_back(self):
+        """
+        Tests that an error inside the transaction discards every change,
+        including the consumed document number.
+        """
+        with self.assertRaises(ValueError):
+            with persistence.transaction() as tx:
+                tx.update_record(persistence.MAGAZZINO_DB, 'art1', {'qta_in_stock': 0})
+                tx.get_next_document_number('invoice')
+                raise ValueError("Stock update failed")
+
+        self.assertEqual(persistence.find_record(persistence.MAGAZZINO_DB, 'art1')['qta_in_stock'], 5)
+        self.assertEqual(_last_number('invoice'), 0)
+        # The numbering is free again
+        self.assertTrue(persistence.get_next_document_number('invoice').endswith('001'))
+
+    def test_interrupted_commit_is_recovered(self):
+        """
+        Tests that a redo log left by a crash during commit is applied
+        on the next access.
+        """
+        # 1. Setup: simulate a crash right after the redo log was written
+        pending = {
+            'changes': [
+                (persistence.MAGAZZINO_DB, ('update', 'art1', {'qta_in_stock': 1})),
+                (persistence.DOCUMENTI_DB, ('insert', {'id': 'inv1'})),
+            ],
+            'settings': None
+        }
+        with open(persistence.TRANSACTION_FILE, 'wb') as f:
+            pickle.dump(pending, f)
+        persistence.invalidate_cache()
+
+        # 2. Execute & 3. Assertions
+        self.assertEqual(persistence.find_record(persistence.MAGAZZINO_DB, 'art1')['qta_in_stock'], 1)
+        self.assertEqual(persistence.find_record(persistence.DOCUMENTI_DB, 'inv1'), {'id': 'inv1'})
+        self.assertFalse(os.path.exists(persistence.TRANSACTION_FILE))
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+# --- Module Import Handling ---
+try:
+    from .. import calendar
+    from .. import email_utils
+    from .. import persistence as db
+    from .. import scheduler
+except ImportError:
+    import calendar
+    import email_utils
+    import persistence as db
+    import scheduler
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of the SMTP protocol for smtplib to send mail (no TLS)."""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self._reply('220 stand-in ready')
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self._reply('250-stand-in')
+                self._reply('250 AUTH PLAIN')
+            elif command.startswith('AUTH'):
+                self._reply('235 Authenticated')
+            elif command == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(data_line)
+                self.server.messages.append(b''.join(data).decode())
+                self._reply('250 Queued')
+            elif command == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('250 OK')
+
+class _SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server recording the messages it receives."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+class TestNotificationScheduler(unittest.TestCase):
+    """
+    Test suite for the notification scheduler, against a local SMTP stand-in.
+    """
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        db.invalidate_cache()
+
+        self.smtp = _SMTPStandIn()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        settings = db.load_settings()
+        settings['smtp_config'] = {
+            'host': '127.0.0.1', 'port': self.smtp.server_address[1], 'user': 'me@example.com',
+            'password': 'secret', 'notify_email': 'me@example.com', 'starttls': False
+        }
+        db.save_settings(settings)
+
+    def tearDown(self):
+        email_utils.close_connections()
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        db.invalidate_cache()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def test_due_digests_share_one_connection(self):
+        """
+        Tests that the digests due are sent together over one connection,
+        and that a restarted scheduler doesn't send them again.
+        """
+        # 1. Setup
+        calendar.create_evento_manuale('2025-03-10', 'F24', 'Pagamento')
+        calendar.create_evento_manuale('2025-03-11', 'Call cliente', '')
+        calendar.create_evento_manuale('2025-03-25', 'IVA', '')
+        clock = lambda: datetime(2025, 3, 10, 9, 0)
+
+        # 2. Execute
+        scheduler.NotificationScheduler(clock=clock).run_pending()
+        wait = scheduler.NotificationScheduler(clock=clock).run_pending() # Restarted
+
+        # 3. Assertions
+        self.assertEqual(len(self.smtp.messages), 2)
+        self.assertIn('Subject: Deadline Reminders for 2025-03-10', self.smtp.messages[0])
+        self.assertIn('Call cliente', self.smtp.messages[1])
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(db.load_settings()['last_notified_date'], '2025-03-11')
+        self.assertEqual(wait, scheduler.RECHECK_INTERVAL) # The next digest is days away
+
+    def test_sleeps_until_next_digest(self):
+        """
+        Tests that nothing is sent before a digest is due, and that the
+        scheduler sleeps exactly until then.
+        """
+        # 1. Setup
+        calendar.create_evento_manuale('2025-03-11', 'Call cliente', '')
+        job = scheduler.NotificationScheduler(clock=lambda: datetime(2025, 3, 10, 7, 50))
+
+        # 2. Execute
+        wait = job.run_pending()
+
+        # 3. Assertions
+        self.assertEqual(wait, 600.0) # Due at 08:00
+        self.assertEqual(self.smtp.messages, [])
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)